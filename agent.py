@@ -1,36 +1,108 @@
+import json
 import os
+import re
+import time
 from dotenv import load_dotenv
-from langchain.chains import create_history_aware_retriever, create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
+from langchain_core.documents import Document
 from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.runnables import RunnableGenerator, RunnableLambda
+from langchain_core.runnables.utils import AddableDict
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from pinecone import Pinecone, ServerlessSpec
+from pinecone import Pinecone
+from aggregates import ProfessorAggregates
+from compaction import ContextCompactor
+from embeddings import BatchingEmbeddings, CachedEmbeddings
+from ingest import iter_records
+from lexical import LexicalIndex, reciprocal_rank_fusion
+from metrics import llm_metrics, timed
 from rag import RAG
+from rewrite import QuestionRewriter, history_digest
+from semantic_cache import SemanticAnswerCache, index_version
 
 class ProfessorRaterAgent:
-    def __init__(self):
+    def __init__(self, llm=None, embeddings=None):
+        """
+        Args:
+            llm (BaseChatModel, optional): Chat model for rewriting and answering; defaults to gpt-4o-mini.
+            embeddings (Embeddings, optional): Embeddings model; defaults to OpenAI text-embedding-3-small.
+        """
         # Load environment variables
         load_dotenv()
 
+        # Vector store backend: "pinecone" or "local" (in-process NumPy index)
+        self.vector_backend = os.getenv("VECTOR_BACKEND", "pinecone")
+        self.local_index_path = os.getenv("LOCAL_INDEX_PATH", "data/professors-index")
+
         # Pinecone Setup
-        self.PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-        if self.PINECONE_API_KEY is None:
-            raise ValueError("Please set the PINECONE_API_KEY environment variable")
+        self.pc_client = None
+        if self.vector_backend == "pinecone":
+            self.PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
+            if self.PINECONE_API_KEY is None:
+                raise ValueError("Please set the PINECONE_API_KEY environment variable")
+            self.pc_client = Pinecone(api_key=self.PINECONE_API_KEY)
 
-        # Initialize Pinecone client and embeddings
-        self.pc_client = Pinecone(api_key=self.PINECONE_API_KEY)
-        self.embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+        # Initialize embeddings
+        # Identical queries are embedded once; set EMBEDDING_CACHE_PATH to keep vectors across restarts.
+        # Cache misses of concurrent sessions are coalesced into batched API calls.
+        self.embedding_batcher = BatchingEmbeddings(
+            embeddings or OpenAIEmbeddings(model="text-embedding-3-small"),
+            window=float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5")) / 1000,
+            max_batch=int(os.getenv("EMBEDDING_MAX_BATCH", "64")),
+        )
+        self.embeddings = CachedEmbeddings(self.embedding_batcher, path=os.getenv("EMBEDDING_CACHE_PATH"))
         self.index_name = "professors-index"
 
-        # Initialize RAG with Pinecone client, index, and embeddings
-        self.rag = RAG(self.pc_client, self.index_name, self.embeddings)
+        # Initialize RAG with the configured backend, index, and embeddings
+        self.rag = RAG(
+            self.pc_client,
+            self.index_name,
+            self.embeddings,
+            backend=self.vector_backend,
+            local_index_path=self.local_index_path,
+        )
 
         # Initialize retriever
-        self.retriever = self.rag.get_retriever()
+        self.retrieval_k = 4
+        self.retriever = self.rag.get_retriever(k=self.retrieval_k)
+
+        # Lexical index over the same review records that feed the vector store
+        self.reviews_path = os.getenv("REVIEWS_PATH", "data/sample.json")
+        self.lexical = LexicalIndex()
+        if os.path.exists(self.reviews_path):
+            self.lexical = LexicalIndex.from_records(iter_records(self.reviews_path))
+
+        # Per-professor review aggregates for ranking questions, saved by ingest.py or built from the reviews
+        self.aggregates_path = os.getenv("AGGREGATES_PATH", "data/professor-aggregates")
+        self.aggregates = None
+        if os.path.isdir(self.aggregates_path) and os.listdir(self.aggregates_path):
+            self.aggregates = ProfessorAggregates.load(self.aggregates_path)
+        elif os.path.exists(self.reviews_path):
+            self.aggregates = ProfessorAggregates.from_records(iter_records(self.reviews_path))
+
+        # How often each retrieval route is taken: ranking, name/course fast path or hybrid search
+        self.route_counts = {"ranking": 0, "name": 0, "course": 0, "hybrid": 0}
+
+        # Top vector relevance score (0-1) above which the local index is trusted, and below which
+        # the question goes straight to the RateMyProfessors tools; in between both run speculatively
+        self.accept_score = float(os.getenv("RAG_ACCEPT_SCORE", "0.8"))
+        self.reject_score = float(os.getenv("RAG_REJECT_SCORE", "0.7"))
+
+        # Answers to repeated questions, dropped whenever ingestion changes the index
+        self.index_version_path = os.getenv("INDEX_VERSION_PATH", "data/index-version")
+        self.answer_cache = SemanticAnswerCache(
+            threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+            max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2048")),
+            version=lambda: index_version(self.index_version_path),
+        )
+
+        # Retrieved chunks reach the prompt as one compact, token-budgeted table
+        self.compactor = ContextCompactor(max_tokens=int(os.getenv("CONTEXT_MAX_TOKENS", "600")))
 
         # Initialize LLM (Language Model)
-        self.llm = ChatOpenAI(model="gpt-4o-mini")
+        self.llm = llm or ChatOpenAI(model="gpt-4o-mini")
 
         # System prompt for contextualizing questions
         self.contextualize_q_system_prompt = (
@@ -50,11 +122,19 @@ class ProfessorRaterAgent:
             ]
         )
 
-        # Create history aware retriever
-        self.history_aware_retriever = create_history_aware_retriever(
-            self.llm, self.retriever, self.contextualize_q_prompt
+        # Create a chain that rewrites follow-up questions into standalone ones
+        self.contextualize_chain = (self.contextualize_q_prompt | self.llm | StrOutputParser()).with_config(
+            tags=["rewrite"], callbacks=[llm_metrics]
         )
 
+        # Skip the rewrite for self-contained messages and memoize the rest
+        self.rewriter = QuestionRewriter(self.contextualize_chain, self.lexical)
+
+        # Retrieval: history-aware rewrite (skipped when not needed), then the ranking or lexical fast path
+        # on the standalone question, otherwise hybrid lexical + vector search.
+        # Adds "question", "route", "context", "score" and "decision" to the chain inputs.
+        self.retrieval = RunnableLambda(self._retrieve, afunc=self._aretrieve).with_config(run_name="retrieve_documents")
+
         # System prompt for answering questions
         self.qa_system_prompt = (
             """
@@ -80,10 +160,179 @@ class ProfessorRaterAgent:
         )
 
         # Create a chain for question answering
-        self.question_answer_chain = create_stuff_documents_chain(self.llm, self.qa_prompt)
+        self.question_answer_chain = create_stuff_documents_chain(self.llm, self.qa_prompt).with_config(
+            tags=["answer"], callbacks=[llm_metrics]
+        )
+
+        # Answering: semantic answer cache in front of the QA chain
+        self.answering = RunnableGenerator(self._answer, self._aanswer).with_config(run_name="answer")
+
+        # Create a retrieval chain using the retrieval stage and QA chain
+        self.rag_chain = (self.retrieval | self.answering).with_config(run_name="retrieval_chain")
+
+    def _ranking(self, inputs: dict, question: str):
+        """Return the retrieval output of a ranking question answered from the aggregates, or None."""
+        rows = self.aggregates.answer(question) if self.aggregates is not None else None
+        if not rows:
+            return None
+        self.route_counts["ranking"] += 1
+        context = [Document(page_content=json.dumps(row)) for row in rows]
+        return {**inputs, "question": question, "route": "ranking", "context": context, "score": 1.0, "decision": "rag"}
+
+    def _fast_path(self, inputs: dict, question: str):
+        """
+        Return the retrieval output of a ranking question or a confident professor-name or course hit, or None.
+
+        Matches the standalone question, so that a follow-up ("does he also teach Physics II?")
+        is routed with the professor or course it refers to.
+        """
+        if (result := self._ranking(inputs, question)) is not None:
+            return result
+        match = self.lexical.match(question)
+        if match is None:
+            self.route_counts["hybrid"] += 1
+            return None
+        self.route_counts[match.kind] += 1
+        return {**inputs, "question": question, "route": match.kind, "context": match.documents, "score": 1.0, "decision": "rag"}
+
+    def _decide(self, score: float) -> str:
+        """Route a hybrid retrieval by its top relevance score: "rag", "speculate" or "tools"."""
+        if score >= self.accept_score:
+            return "rag"
+        if score < self.reject_score:
+            return "tools"
+        return "speculate"
+
+    def _hybrid(self, inputs: dict, query: str, scored: list):
+        score = max((relevance for _, relevance in scored), default=0.0)
+        docs = self._fuse([doc for doc, _ in scored], query)
+        return {**inputs, "question": query, "route": "hybrid", "context": docs, "score": score, "decision": self._decide(score)}
+
+    def _fuse(self, vector_docs: list, query: str):
+        """Fuse vector and BM25 results with reciprocal rank fusion."""
+        lexical_docs = [doc for doc, _ in self.lexical.search(query, self.retrieval_k)]
+        return reciprocal_rank_fusion(vector_docs, lexical_docs, k=self.retrieval_k)
+
+    def _retrieve(self, inputs: dict):
+        with timed("retrieve"):
+            # Free without history or for self-contained messages; follow-ups are rewritten before any routing
+            with timed("rewrite"):
+                query = self.rewriter.rewrite(inputs)
+            if (result := self._fast_path(inputs, query)) is not None:
+                return result
+            return self._hybrid(inputs, query, self.rag.lookup_with_scores(query, top_k=self.retrieval_k))
+
+    async def _aretrieve(self, inputs: dict):
+        with timed("retrieve"):
+            with timed("rewrite"):
+                query = await self.rewriter.arewrite(inputs)
+            if (result := self._fast_path(inputs, query)) is not None:
+                return result
+            return self._hybrid(inputs, query, await self.rag.alookup_with_scores(query, top_k=self.retrieval_k))
+
+    @staticmethod
+    def _merge(chunks):
+        inputs = AddableDict()
+        for chunk in chunks:
+            inputs = inputs + chunk
+        return inputs
+
+    @staticmethod
+    def _replay(answer: str, size: int = 32):
+        """Split a cached answer into word-aligned chunks for streaming."""
+        chunk = ""
+        for word in re.findall(r"\S+\s*|\s+", answer):
+            chunk += word
+            if len(chunk) >= size:
+                yield chunk
+                chunk = ""
+        if chunk:
+            yield chunk
+
+    @staticmethod
+    def _cache_scope(inputs: dict) -> str:
+        """Return the answer cache scope: the answer prompt sees the chat history, so answers are only shared without one."""
+        chat_history = inputs.get("chat_history") or []
+        return history_digest(chat_history, len(chat_history)) if chat_history else ""
+
+    def _qa_inputs(self, inputs: dict) -> dict:
+        """Return the QA chain inputs with the retrieved context compacted for the prompt."""
+        # Ranking rows are already aggregated, per professor or per (professor, course): never merge them
+        merge = inputs.get("route") != "ranking"
+        return {**inputs, "context": self.compactor.compact_documents(inputs["context"], inputs["question"], merge=merge)}
+
+    def _answer(self, chunks):
+        inputs = self._merge(chunks)
+        yield AddableDict(inputs)
+        # Only hybrid turns already embedded the question, so only they pay for a similarity lookup
+        vector = self.embeddings.embed_query(inputs["question"]) if inputs["route"] == "hybrid" else None
+        scope = self._cache_scope(inputs)
+        cached = self.answer_cache.lookup(inputs["question"], inputs["context"], vector, scope)
+        if cached is not None:
+            for chunk in self._replay(cached.answer):
+                yield AddableDict(answer=chunk)
+            return
+        started = time.perf_counter()
+        answer = []
+        for chunk in self.question_answer_chain.stream(self._qa_inputs(inputs)):
+            answer.append(chunk)
+            yield AddableDict(answer=chunk)
+        self.answer_cache.store(inputs["question"], inputs["context"], "".join(answer), time.perf_counter() - started, vector, scope)
+
+    async def _aanswer(self, chunks):
+        inputs = AddableDict()
+        async for chunk in chunks:
+            inputs = inputs + chunk
+        yield AddableDict(inputs)
+        vector = await self.embeddings.aembed_query(inputs["question"]) if inputs["route"] == "hybrid" else None
+        scope = self._cache_scope(inputs)
+        cached = self.answer_cache.lookup(inputs["question"], inputs["context"], vector, scope)
+        if cached is not None:
+            for chunk in self._replay(cached.answer):
+                yield AddableDict(answer=chunk)
+            return
+        started = time.perf_counter()
+        answer = []
+        async for chunk in self.question_answer_chain.astream(self._qa_inputs(inputs)):
+            answer.append(chunk)
+            yield AddableDict(answer=chunk)
+        self.answer_cache.store(inputs["question"], inputs["context"], "".join(answer), time.perf_counter() - started, vector, scope)
+
+    def retrieve(self, input: str, chat_history: list) -> dict:
+        """Run retrieval only, so the caller can route on the result before generating.
+
+        Args:
+            input (str): The user input or query.
+            chat_history (list): A list of messages representing the chat history.
 
-        # Create a retrieval chain using the history-aware retriever and QA chain
-        self.rag_chain = create_retrieval_chain(self.history_aware_retriever, self.question_answer_chain)
+        Returns:
+            dict: The chain inputs plus "question", "route", "context", "score" and "decision".
+        """
+        return self.retrieval.invoke({"input": input, "chat_history": chat_history})
+
+    def stream_answer(self, retrieved: dict):
+        """Stream the answer generated from the output of `retrieve`.
+
+        Yields:
+            str: The AI's response text.
+        """
+        for chunk in self.answering.stream(retrieved):
+            if answer_chunk := chunk.get("answer"):
+                yield answer_chunk
+
+    async def aretrieve(self, input: str, chat_history: list) -> dict:
+        """Asynchronously run retrieval only. See `retrieve`."""
+        return await self.retrieval.ainvoke({"input": input, "chat_history": chat_history})
+
+    async def astream_answer(self, retrieved: dict):
+        """Asynchronously stream the answer generated from the output of `aretrieve`.
+
+        Yields:
+            str: The AI's response text.
+        """
+        async for chunk in self.answering.astream(retrieved):
+            if answer_chunk := chunk.get("answer"):
+                yield answer_chunk
 
     def invoke(self, input: str, chat_history: list):
         """Invoke the retrieval chain with the provided input and chat history.
@@ -114,6 +363,36 @@ class ProfessorRaterAgent:
             if answer_chunk := chunk.get("answer"):
                 yield answer_chunk
 
+    async def ainvoke(self, input: str, chat_history: list):
+        """Asynchronously invoke the retrieval chain with the provided input and chat history.
+
+        Args:
+            input (str): The user input or query.
+            chat_history (list): A list of messages representing the chat history.
+
+        Returns:
+            str: The AI's response text.
+        """
+        result = await self.rag_chain.ainvoke({"input": input, "chat_history": chat_history})
+        return result['answer']
+
+    async def astream(self, input: str, chat_history: list):
+        """Asynchronously stream the retrieval chain with the provided input and chat history.
+
+        Answer tokens are yielded as soon as the model emits them, without
+        blocking the event loop while the retriever or the LLM is waiting.
+
+        Args:
+            input (str): The user input or query.
+            chat_history (list): A list of messages representing the chat history.
+
+        Yields:
+            str: The AI's response text.
+        """
+        async for chunk in self.rag_chain.astream({"input": input, "chat_history": chat_history}):
+            if answer_chunk := chunk.get("answer"):
+                yield answer_chunk
+
 
 # Example usage to start the continual chat
 def start_chat(bot: ProfessorRaterAgent):
@@ -0,0 +1,428 @@
+import os
+import time
+from hashlib import sha256
+from logging import getLogger
+from typing import Iterable
+
+import numpy as np
+
+from lexical import STOPWORDS, normalize_name, tokenize
+
+logger = getLogger(__name__)
+
+# Per-review metrics averaged by the table, in column order
+METRICS = ("overall_rating", "clarity", "helpfulness", "easiness")
+METRIC_ALIASES = {
+    "overall": "overall_rating", "rating": "overall_rating", "avgRating": "overall_rating",
+    "clear": "clarity", "helpful": "helpfulness", "easy": "easiness", "difficulty": "easiness",
+}
+TEXT_COLUMNS = ("professor", "course", "school", "department")
+
+# Ranking questions: superlatives pick the metric and direction, "most"/"least" qualify adjectives
+SUPERLATIVES = {
+    "best": ("overall_rating", False), "top": ("overall_rating", False), "highest": ("overall_rating", False),
+    "worst": ("overall_rating", True), "lowest": ("overall_rating", True),
+    "easiest": ("easiness", False), "hardest": ("easiness", True), "toughest": ("easiness", True),
+    "clearest": ("clarity", False),
+}
+ADJECTIVES = {
+    "rated": ("overall_rating", False), "easy": ("easiness", False), "hard": ("easiness", True),
+    "tough": ("easiness", True), "difficult": ("easiness", True), "clear": ("clarity", False),
+    "confusing": ("clarity", True), "helpful": ("helpfulness", False),
+}
+# Words a ranking question may contain besides the subject; any other word makes it a regular question
+RANKING_FILLER = STOPWORDS | {
+    "most", "least", "rank", "ranked", "ranking", "list", "professors", "teachers", "instructor", "instructors",
+    "lecturer", "lecturers", "courses", "classes", "students", "student", "reviews", "according", "there",
+    "ones", "one", "all", "overall", "rating", "ratings", "teach", "taught", "get", "have", "has",
+}
+COURSE_FILLER = {"intro", "introduction", "to", "i", "ii", "iii", "and", "of", "the"}
+DEFAULT_TOP_K = 3
+MAX_TOP_K = 20
+# Rankings use a Bayesian mean: each row gets this many extra ratings at the table-wide mean,
+# so a single 5-star review does not outrank 4.9 over 200 ratings
+PRIOR_RATINGS = 5
+
+
+def _resolve_metric(metric: str) -> str:
+    metric = METRIC_ALIASES.get(metric, metric)
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric {metric!r}; use one of {', '.join(METRICS)}")
+    return metric
+
+
+def _number(value) -> float | None:
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+def aggregate_records(records: Iterable[dict]) -> dict[str, np.ndarray]:
+    """
+    Sum the reviews of each (professor, course) into columns.
+
+    Review rows count once each. Professor records fetched from
+    RateMyProfessors (with `avgRating` and `numRatings`) count for their
+    number of ratings, and only the last record of each id is kept.
+
+    Args:
+        records (iterable): Records as read by `ingest.iter_records`.
+
+    Returns:
+        dict: Text columns, "count", metric "sums" and "counts" (rows x metrics) and the
+            overall rating "histogram" (rows x 5 stars), one row per (professor, course).
+    """
+    groups: dict[tuple[str, str], dict] = {}
+    professors: dict[str, dict] = {}
+
+    def group(record: dict) -> dict | None:
+        name = record.get("professor_name") or " ".join(filter(None, [record.get("firstName"), record.get("lastName")]))
+        if not normalize_name(name):
+            return None
+        course = " ".join(str(record.get("course") or "").split())
+        key = (normalize_name(name), course.lower())
+        row = groups.get(key)
+        if row is None:
+            row = groups[key] = {
+                "professor": name, "course": course, "school": "", "department": "", "count": 0,
+                "sums": [0.0] * len(METRICS), "counts": [0] * len(METRICS), "histogram": [0] * 5,
+            }
+        for column in ("school", "department"):
+            if not row[column] and isinstance(record.get(column), str):
+                row[column] = record[column]
+        return row
+
+    for record in records:
+        if "avgRating" in record and record.get("id"):
+            professors[record["id"]] = record
+            continue
+        row = group(record)
+        if row is None:
+            continue
+        row["count"] += 1
+        for i, metric in enumerate(METRICS):
+            value = _number(record.get(metric))
+            if value is not None:
+                row["sums"][i] += value
+                row["counts"][i] += 1
+        overall = _number(record.get("overall_rating"))
+        if overall is not None:
+            row["histogram"][min(max(int(round(overall)), 1), 5) - 1] += 1
+
+    for record in professors.values():
+        ratings = int(_number(record.get("numRatings")) or 0)
+        average = _number(record.get("avgRating"))
+        row = group(record)
+        if row is None or not ratings:
+            continue
+        row["count"] += ratings
+        if average is not None:
+            row["sums"][0] += average * ratings
+            row["counts"][0] += ratings
+        distribution = record.get("ratingsDistribution") or {}
+        for star in range(5):
+            row["histogram"][star] += int(distribution.get(f"r{star + 1}") or 0)
+
+    rows = list(groups.values())
+    columns = {column: np.array([row[column] for row in rows], dtype=str) for column in TEXT_COLUMNS}
+    columns["count"] = np.array([row["count"] for row in rows], dtype=np.int64)
+    columns["sums"] = np.array([row["sums"] for row in rows], dtype=np.float64).reshape(len(rows), len(METRICS))
+    columns["counts"] = np.array([row["counts"] for row in rows], dtype=np.int64).reshape(len(rows), len(METRICS))
+    columns["histogram"] = np.array([row["histogram"] for row in rows], dtype=np.int64).reshape(len(rows), 5)
+    return columns
+
+
+def _group_by(columns: dict[str, np.ndarray], keys: list) -> dict[str, np.ndarray]:
+    """Merge the rows sharing a key: sums are added, text columns keep their first non-empty value."""
+    index: dict = {}
+    inverse = np.fromiter((index.setdefault(key, len(index)) for key in keys), dtype=np.int64, count=len(keys))
+    size = len(index)
+    merged = {}
+    for column in ("count", "sums", "counts", "histogram"):
+        values = columns[column]
+        merged[column] = np.zeros((size,) + values.shape[1:], dtype=values.dtype)
+        np.add.at(merged[column], inverse, values)
+    for column in TEXT_COLUMNS:
+        values = [""] * size
+        for row, value in zip(inverse.tolist(), columns[column].tolist()):
+            if value and not values[row]:
+                values[row] = value
+        merged[column] = np.array(values, dtype=str)
+    return merged
+
+
+class AggregateTable:
+    """
+    Columnar table of review aggregates with a sorted index per metric.
+
+    Means are precomputed, and each metric keeps the row order from best to
+    worst (ties broken by number of ratings, rows without the metric
+    dropped), so a top-k query reads the first k rows of an index, or of
+    the rows passing a filter mask. Rows are ordered by their Bayesian
+    mean, the mean with `prior_ratings` more ratings at the table-wide
+    mean, so that rows with few ratings do not win on luck; the rows
+    themselves report the plain mean.
+    """
+
+    def __init__(self, columns: dict[str, np.ndarray], prior_ratings: float = PRIOR_RATINGS):
+        self.columns = columns
+        self.size = len(columns["count"])
+        counts = columns["counts"]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.means = np.where(counts > 0, columns["sums"] / counts, np.nan)
+            prior = np.nan_to_num(columns["sums"].sum(axis=0) / counts.sum(axis=0))
+            self.scores = np.where(counts > 0, (columns["sums"] + prior_ratings * prior) / (counts + prior_ratings), np.nan)
+
+        self.order = {}
+        for i, metric in enumerate(METRICS):
+            values = self.scores[:, i]
+            ranked = np.lexsort((-columns["count"], -np.nan_to_num(values, nan=-np.inf)))
+            self.order[metric] = ranked[:int(np.count_nonzero(~np.isnan(values)))]
+
+        # Text columns as codes into their distinct lower-cased values, so filters compare a few strings
+        self._codes = {}
+        self._values = {}
+        for column in TEXT_COLUMNS:
+            values, codes = np.unique(np.char.lower(columns[column]), return_inverse=True)
+            self._values[column] = values.tolist()
+            self._codes[column] = codes.reshape(-1)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def distinct(self, column: str) -> list[str]:
+        """Return the distinct lower-cased values of a text column."""
+        return self._values[column]
+
+    def mask(self, column: str, needles: Iterable[str]) -> np.ndarray:
+        """Return the rows whose `column` contains any of `needles` (case-insensitive)."""
+        needles = [needle.lower() for needle in needles]
+        matching = [code for code, value in enumerate(self._values[column]) if any(needle in value for needle in needles)]
+        return np.isin(self._codes[column], matching)
+
+    def top(self, metric: str, k: int, ascending: bool = False, mask: np.ndarray | None = None) -> np.ndarray:
+        """Return the row numbers of the k best (or worst) rows by `metric` among those in `mask`."""
+        order = self.order[metric]
+        if ascending:
+            order = order[::-1]
+        if mask is not None:
+            order = order[mask[order]]
+        return order[:k]
+
+    def row(self, index: int, with_course: bool = True) -> dict:
+        """Return a row as a record the context compactor can render."""
+        columns = self.columns
+        record = {"professor_name": str(columns["professor"][index])}
+        if with_course and columns["course"][index]:
+            record["course"] = str(columns["course"][index])
+        for column in ("school", "department"):
+            if columns[column][index]:
+                record[column] = str(columns[column][index])
+        record["numRatings"] = int(columns["count"][index])
+        for i, metric in enumerate(METRICS):
+            if not np.isnan(self.means[index, i]):
+                record[metric] = round(float(self.means[index, i]), 2)
+        histogram = columns["histogram"][index]
+        if histogram.any():
+            record["ratingsDistribution"] = {f"r{star + 1}": int(count) for star, count in enumerate(histogram)}
+        return record
+
+
+class ProfessorAggregates:
+    """
+    Per-professor and per-course review aggregates for ranking questions.
+
+    Built at ingestion time (see `save_aggregates`) or from a reviews file,
+    it answers "top 5 clearest professors" or "easiest chemistry professor"
+    in-process with an exact ranking over every review, instead of hoping
+    the right reviews are among the retrieved chunks.
+    """
+
+    def __init__(self, columns: dict[str, np.ndarray], prior_ratings: float = PRIOR_RATINGS):
+        """
+        Args:
+            columns (dict): Per (professor, course) columns as returned by `aggregate_records`.
+            prior_ratings (float): Weight of the table-wide mean in the Bayesian mean rows are ranked by.
+        """
+        self.courses = AggregateTable(columns, prior_ratings)
+        self.professors = AggregateTable(_group_by(columns, [normalize_name(name) for name in columns["professor"].tolist()]), prior_ratings)
+        self._course_words = self._vocabulary(self.courses.distinct("course"))
+        self.counts = {"queries": 0, "matched_questions": 0, "query_seconds": 0.0}
+
+    @classmethod
+    def from_records(cls, records: Iterable[dict]) -> "ProfessorAggregates":
+        return cls(aggregate_records(records))
+
+    @classmethod
+    def load(cls, path: str) -> "ProfessorAggregates":
+        """
+        Load and combine the aggregates saved by ingestion for every source file.
+
+        Args:
+            path (str): Directory written by `save_aggregates`.
+        """
+        parts = []
+        for name in sorted(os.listdir(path)):
+            if name.endswith(".npz"):
+                with np.load(os.path.join(path, name)) as data:
+                    parts.append({column: data[column] for column in data.files if column != "source"})
+        if not parts:
+            raise ValueError(f"No aggregates found in {path}")
+        columns = {column: np.concatenate([part[column] for part in parts]) for column in parts[0]}
+        keys = list(zip([normalize_name(name) for name in columns["professor"].tolist()], np.char.lower(columns["course"]).tolist()))
+        return cls(_group_by(columns, keys))
+
+    def __len__(self) -> int:
+        return len(self.professors)
+
+    @staticmethod
+    def _vocabulary(courses: list[str]) -> dict[str, set[str]]:
+        words: dict[str, set[str]] = {}
+        for course in courses:
+            for word in tokenize(course):
+                if word not in COURSE_FILLER:
+                    words.setdefault(word, set()).add(word)
+        return words
+
+    def _course_word(self, token: str) -> str | None:
+        """Return the course-name word matching `token` exactly or by a shared prefix of 4+ letters."""
+        if token in self._course_words:
+            return token
+        for word in self._course_words:
+            if min(len(word), len(token)) >= 4 and (word.startswith(token) or token.startswith(word)):
+                return word
+        return None
+
+    def query(
+        self,
+        metric: str = "overall_rating",
+        k: int = 5,
+        ascending: bool = False,
+        course: str | list[str] | None = None,
+        school: str | None = None,
+        department: str | None = None,
+        min_ratings: int = 1,
+    ) -> list[dict]:
+        """
+        Rank professors by the mean of a metric over all their reviews.
+
+        With a course filter, each professor is ranked on the reviews of
+        the matching courses only, one row per course. The order uses the
+        Bayesian mean (see `AggregateTable`), so few ratings rank close to
+        the average rather than at the top or bottom.
+
+        Args:
+            metric (str): "overall_rating", "clarity", "helpfulness" or "easiness".
+            k (int): Number of rows to return.
+            ascending (bool): Lowest first, e.g. the hardest professors by easiness.
+            course (str or list, optional): Text contained in the course name (any of them, for a list).
+            school (str, optional): Text contained in the school name.
+            department (str, optional): Text contained in the department name.
+            min_ratings (int): Minimum number of ratings of a row.
+
+        Returns:
+            list: The winning rows, best first.
+
+        Raises:
+            ValueError: If the metric is unknown.
+        """
+        started = time.perf_counter()
+        metric = _resolve_metric(metric)
+        table = self.courses if course else self.professors
+        mask = None
+        filters = {"course": [course] if isinstance(course, str) else course, "school": [school] if school else None, "department": [department] if department else None}
+        for column, needles in filters.items():
+            if needles:
+                column_mask = table.mask(column, needles)
+                mask = column_mask if mask is None else mask & column_mask
+        if min_ratings > 1:
+            enough = table.columns["count"] >= min_ratings
+            mask = enough if mask is None else mask & enough
+        rows = [table.row(int(index), with_course=table is self.courses) for index in table.top(metric, max(k, 0), ascending, mask)]
+        self.counts["queries"] += 1
+        self.counts["query_seconds"] += time.perf_counter() - started
+        return rows
+
+    def match(self, question: str) -> dict | None:
+        """
+        Recognize a ranking question and return its `query` arguments.
+
+        The question must contain a superlative ("best", "easiest", "top
+        5", "most helpful", ...) and nothing else but filler words and
+        words of known course names; anything more specific (a professor
+        name, an unknown subject) is left to regular retrieval.
+
+        Args:
+            question (str): The user message.
+
+        Returns:
+            dict: Keyword arguments for `query`, or None.
+        """
+        tokens = tokenize(question)
+        found = []
+        courses = []
+        k = None
+        qualifier = None
+        for i, token in enumerate(tokens):
+            if token in ("most", "least"):
+                qualifier = token
+            elif token in SUPERLATIVES:
+                found.append(SUPERLATIVES[token])
+            elif token in ADJECTIVES and (qualifier or (i and tokens[i - 1] in ("top", "highly", "best"))):
+                metric, ascending = ADJECTIVES[token]
+                found.append((metric, not ascending if qualifier == "least" else ascending))
+            elif token.isdigit() and k is None and 0 < int(token) <= MAX_TOP_K:
+                k = int(token)
+            elif token in RANKING_FILLER or token in COURSE_FILLER or token.isdigit():
+                continue
+            elif (word := self._course_word(token)) is not None:
+                courses.append(word)
+            else:
+                return None
+        if not found:
+            return None
+        # A specific metric ("clearest") wins over a generic superlative ("top", "best")
+        metric, ascending = next((item for item in found if item[0] != "overall_rating"), found[0])
+        return {"metric": metric, "k": k or DEFAULT_TOP_K, "ascending": ascending, "course": courses or None}
+
+    def answer(self, question: str) -> list[dict]:
+        """
+        Answer a ranking question from the aggregates.
+
+        Args:
+            question (str): The user message.
+
+        Returns:
+            list: The winning rows, best first; empty if `match` does not recognize
+                the question or no row passes its filters.
+        """
+        query = self.match(question)
+        rows = self.query(**query) if query is not None else []
+        if rows:
+            self.counts["matched_questions"] += 1
+        return rows
+
+    def stats(self) -> dict:
+        """Return the table sizes and the number and mean duration of queries."""
+        counts = self.counts
+        return {
+            "professors": len(self.professors),
+            "professor_courses": len(self.courses),
+            "queries": counts["queries"],
+            "matched_questions": counts["matched_questions"],
+            "mean_query_us": round(1e6 * counts["query_seconds"] / counts["queries"], 1) if counts["queries"] else 0.0,
+        }
+
+
+def save_aggregates(path: str, source: str, columns: dict[str, np.ndarray]):
+    """
+    Save the aggregates of one source file, replacing those of an earlier ingestion of it.
+
+    Args:
+        path (str): Aggregates directory; one file per source.
+        source (str): The ingested file.
+        columns (dict): Columns as returned by `aggregate_records`.
+    """
+    os.makedirs(path, exist_ok=True)
+    target = os.path.join(path, sha256(os.path.abspath(source).encode("utf-8")).hexdigest()[:16] + ".npz")
+    temporary = target + ".tmp.npz"
+    np.savez(temporary, source=np.array(os.path.abspath(source)), **columns)
+    os.replace(temporary, target)
@@ -0,0 +1,97 @@
+"""
+Query-embedding throughput with and without micro-batching.
+
+Many concurrent sessions each embed one query, against a fake embeddings
+API that takes a fixed round trip per request plus a little per text and
+serves a limited number of requests at once (like a connection pool or a
+rate limit). Direct calls send one request per query; BatchingEmbeddings
+coalesces the queries arriving within its window into one request.
+
+Usage:
+    python -m benchmarks.embedding_bench [--clients 64] [--queries 20] [--window-ms 5] [--max-batch 64]
+"""
+
+import argparse
+import asyncio
+import statistics
+import threading
+import time
+
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+
+from embeddings import BatchingEmbeddings
+
+
+class SlowFakeEmbeddings(Embeddings):
+    """Deterministic vectors with the latency profile of a remote embeddings API."""
+
+    def __init__(self, round_trip: float = 0.05, per_text: float = 0.0005, max_concurrency: int = 4):
+        self.fake = DeterministicFakeEmbedding(size=256)
+        self.round_trip = round_trip
+        self.per_text = per_text
+        self._slots = threading.Semaphore(max_concurrency)
+        self.requests = 0
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        with self._slots:
+            self.requests += 1
+            time.sleep(self.round_trip + self.per_text * len(texts))
+        return self.fake.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+
+async def run(embeddings: Embeddings, clients: int, queries: int) -> dict:
+    latencies = []
+
+    async def client(index: int):
+        for query in range(queries):
+            started = time.perf_counter()
+            await embeddings.aembed_query(f"which professor teaches course {index}-{query}?")
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(index) for index in range(clients)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "seconds": elapsed,
+        "queries_per_second": len(latencies) / elapsed,
+        "p50_ms": 1000 * statistics.median(latencies),
+        "p95_ms": 1000 * latencies[int(0.95 * (len(latencies) - 1))],
+    }
+
+
+def report(name: str, result: dict, requests: int):
+    print(
+        f"{name:<8} {result['queries_per_second']:>8.1f} q/s  p50 {result['p50_ms']:>7.1f} ms  "
+        f"p95 {result['p95_ms']:>7.1f} ms  {requests:>5} API requests"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=64, help="Concurrent sessions")
+    parser.add_argument("--queries", type=int, default=20, help="Queries per session")
+    parser.add_argument("--window-ms", type=float, default=5.0)
+    parser.add_argument("--max-batch", type=int, default=64)
+    args = parser.parse_args()
+
+    # LangChain's default aembed_query runs the sync call in a thread, one request per query
+    direct_api = SlowFakeEmbeddings()
+    direct = asyncio.run(run(direct_api, args.clients, args.queries))
+    report("direct", direct, direct_api.requests)
+
+    batched_api = SlowFakeEmbeddings()
+    batcher = BatchingEmbeddings(batched_api, window=args.window_ms / 1000, max_batch=args.max_batch)
+    batched = asyncio.run(run(batcher, args.clients, args.queries))
+    report("batched", batched, batched_api.requests)
+
+    stats = batcher.stats()
+    print(f"\nmean batch size {stats['mean_batch_size']}, histogram {stats['batch_size_histogram']}")
+    print(f"throughput x{batched['queries_per_second'] / direct['queries_per_second']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Per-turn prompt size over a long conversation.
+
+Runs a 200-turn conversation through HistoryManager with a fake summarizer
+and prints the size of the history sent with each turn, which should stay
+flat once the window is full instead of growing with the conversation.
+
+Usage:
+    python -m benchmarks.history_bench [--turns 200] [--max-tokens 1500]
+"""
+
+import argparse
+import asyncio
+import random
+
+from langchain_core.messages import AIMessage
+
+from history import HistoryManager, estimate_tokens
+
+WORDS = "professor course exam lecture grading homework difficulty rating clear helpful tough fair lab".split()
+
+
+class FakeSummarizer:
+    """Returns a bounded summary after a short delay, like a fast chat model."""
+
+    async def ainvoke(self, prompt: str):
+        await asyncio.sleep(0.01)
+        return AIMessage(prompt[-600:])
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+async def run(turns: int, max_tokens: int):
+    rng = random.Random(0)
+    history = HistoryManager(summarizer=FakeSummarizer(), max_tokens=max_tokens)
+    naive_tokens = 0
+    sizes = []
+    print(f"{'turn':>5} {'messages':>9} {'tokens':>7} {'unbounded':>10}")
+    for turn in range(1, turns + 1):
+        messages = await history.messages("bench")
+        tokens = sum(estimate_tokens(message.content) for message in messages)
+        sizes.append(tokens)
+        if turn == 1 or turn % 20 == 0:
+            print(f"{turn:>5} {len(messages):>9} {tokens:>7} {naive_tokens:>10}")
+
+        human, ai = sentence(rng, rng.randint(5, 25)), sentence(rng, rng.randint(40, 160))
+        naive_tokens += estimate_tokens(human) + estimate_tokens(ai)
+        await history.append("bench", human, ai)
+        await asyncio.sleep(0)  # let background summaries run as they would between turns
+    await history.drain()
+
+    tail = sizes[turns // 2:]
+    print(f"\nsecond half: min {min(tail)}, max {max(tail)}, mean {sum(tail) / len(tail):.0f} tokens per turn")
+    print(f"unbounded history would have reached {naive_tokens} tokens")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--max-tokens", type=int, default=1500)
+    args = parser.parse_args()
+    asyncio.run(run(args.turns, args.max_tokens))
+
+
+if __name__ == "__main__":
+    main()
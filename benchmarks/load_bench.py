@@ -0,0 +1,325 @@
+"""
+Offline end-to-end load test of the chat server.
+
+Boots main.app under uvicorn on a local port with stand-ins for every
+external service (see benchmarks/standins.py): a streaming fake chat model
+with configurable token latency, deterministic fake embeddings, a local
+NumPy index built from the reviews file and a stub GraphQL server behind
+the RateMyProfessors tools. Concurrent WebSocket clients then each hold a
+conversation on /chat, asking about indexed professors and, with
+--tool-ratio, about unknown ones that go to the tools.
+
+Reports time to first token, p50/p95/p99 turn latency, throughput and
+memory per session, and writes them as JSON together with the commit and
+the server's /stats, so runs can be compared across commits (--compare).
+Other settings (BUFFER_SIZE, RAG_ACCEPT_SCORE, ...) are read from the
+environment as usual.
+
+Usage:
+    python -m benchmarks.load_bench [--clients 50] [--turns 5] [--tool-ratio 0.2]
+        [--token-latency-ms 20] [--output FILE] [--compare FILE]
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ASPECTS = ["teaching", "exams", "grading", "workload", "lectures", "office hours", "clarity", "homework"]
+UNKNOWN_FIRST = ["Alex", "Morgan", "Riley", "Jordan", "Casey", "Taylor", "Avery", "Quinn"]
+UNKNOWN_LAST = ["Okafor", "Lindqvist", "Haddad", "Moreau", "Tanaka", "Novak", "Ferreira", "Kowalski"]
+
+# Metrics shown by --compare: (path in the results, label, lower is better)
+COMPARED = [
+    (("ttft_ms", "p50"), "ttft p50 ms", True),
+    (("ttft_ms", "p95"), "ttft p95 ms", True),
+    (("turn_latency_ms", "p50"), "turn p50 ms", True),
+    (("turn_latency_ms", "p95"), "turn p95 ms", True),
+    (("turn_latency_ms", "p99"), "turn p99 ms", True),
+    (("turns_per_second",), "turns/s", False),
+    (("memory", "per_session_kb"), "KB/session", True),
+]
+
+
+def percentiles(samples: list[float]) -> dict:
+    """Return mean, p50, p95, p99 and max of `samples` (seconds) in milliseconds."""
+    if not samples:
+        return {"mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    ordered = sorted(samples)
+
+    def at(q: float) -> float:
+        return round(1000 * ordered[int(q * (len(ordered) - 1))], 1)
+
+    return {"mean": round(1000 * sum(ordered) / len(ordered), 1), "p50": at(0.5), "p95": at(0.95), "p99": at(0.99), "max": at(1.0)}
+
+
+def rss_bytes() -> int:
+    """Resident set size of this process (peak RSS where /proc is not available)."""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def git_commit() -> str | None:
+    """Return the short commit of the working tree, suffixed "-dirty" with local changes."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f"{commit}-dirty" if dirty else commit
+
+
+def make_questions(rng: random.Random, names: list[str], turns: int, tool_ratio: float) -> list[str]:
+    questions = []
+    for _ in range(turns):
+        aspect = rng.choice(ASPECTS)
+        if not names or rng.random() < tool_ratio:
+            questions.append(f"What do students say about the {aspect} of Professor {rng.choice(UNKNOWN_FIRST)} {rng.choice(UNKNOWN_LAST)}?")
+        else:
+            questions.append(f"How is {rng.choice(names)} for {aspect}?")
+    return questions
+
+
+async def run_session(http_url: str, ws_url: str, questions: list[str], think: float, timeout: float, fallback_notice: str) -> list[dict]:
+    """Open a session like a browser would, then ask `questions` one after another; return one record per turn."""
+    from websockets.asyncio.client import connect
+
+    async with httpx.AsyncClient(base_url=http_url) as http:
+        session_id = (await http.get("/")).cookies["session_id"]
+
+    turns = []
+    async with connect(ws_url, additional_headers={"Cookie": f"session_id={session_id}"}, max_size=None) as websocket:
+        for question in questions:
+            started = time.perf_counter()
+            await websocket.send(question)
+            turn = {"ttft": None, "latency": None, "frames": 0, "chars": 0, "tools": False}
+            streams = {}
+            try:
+                async with asyncio.timeout(timeout):
+                    while True:
+                        frame = json.loads(await websocket.recv())
+                        turn["frames"] += 1
+                        text = streams[frame["id"]] = streams.get(frame["id"], "") + frame["text"]
+                        if frame["text"] and turn["ttft"] is None:
+                            turn["ttft"] = time.perf_counter() - started
+                        if frame["end"]:
+                            # The fallback notice ends its own stream; the tool answer follows in a new one
+                            if text == fallback_notice:
+                                turn["tools"] = True
+                                continue
+                            turn["chars"] = len(text)
+                            break
+            except TimeoutError:
+                turn["error"] = "timeout"
+                turns.append(turn)
+                break
+            turn["latency"] = time.perf_counter() - started
+            turns.append(turn)
+            if think:
+                await asyncio.sleep(think)
+    return turns
+
+
+async def drive(args, http_url: str, ws_url: str, names: list[str], fallback_notice: str) -> dict:
+    rng = random.Random(args.seed)
+    plans = [make_questions(rng, names, args.turns, args.tool_ratio) for _ in range(args.clients)]
+    barrier = asyncio.Event()
+    done = 0
+    peak = {"rss": 0}
+
+    async def client(index: int, questions: list[str]):
+        nonlocal done
+        if args.ramp:
+            await asyncio.sleep(args.ramp * index / args.clients)
+        try:
+            return await run_session(http_url, ws_url, questions, args.think_ms / 1000, args.turn_timeout, fallback_notice)
+        except Exception as e:
+            return [{"error": repr(e)}]
+        finally:
+            done += 1
+            if done == args.clients:
+                barrier.set()
+
+    async def sample_memory():
+        # Peak RSS while the sessions run (every session and its history is alive until the end)
+        while not barrier.is_set():
+            peak["rss"] = max(peak["rss"], rss_bytes())
+            await asyncio.sleep(0.05)
+
+    sampler = asyncio.create_task(sample_memory())
+    started = time.perf_counter()
+    sessions = await asyncio.gather(*(client(index, questions) for index, questions in enumerate(plans)))
+    elapsed = time.perf_counter() - started
+    await sampler
+    peak["rss"] = max(peak["rss"], rss_bytes())
+    return {"sessions": sessions, "seconds": elapsed, "peak_rss": peak["rss"]}
+
+
+def summarize(args, run: dict, baseline_rss: int) -> dict:
+    turns = [turn for session in run["sessions"] for turn in session]
+    answered = [turn for turn in turns if turn.get("latency") is not None]
+    errors = [turn["error"] for turn in turns if "error" in turn]
+    by_route = {}
+    for route, selected in (("index", [t for t in answered if not t["tools"]]), ("tools", [t for t in answered if t["tools"]])):
+        by_route[route] = {"turns": len(selected), "turn_latency_ms": percentiles([t["latency"] for t in selected])}
+    return {
+        "clients": args.clients,
+        "turns": len(answered),
+        "errors": len(errors),
+        "error_samples": sorted(set(errors))[:5],
+        "seconds": round(run["seconds"], 3),
+        "turns_per_second": round(len(answered) / run["seconds"], 2) if run["seconds"] else 0.0,
+        "ttft_ms": percentiles([turn["ttft"] for turn in answered if turn["ttft"] is not None]),
+        "turn_latency_ms": percentiles([turn["latency"] for turn in answered]),
+        "mean_frames_per_turn": round(sum(turn["frames"] for turn in answered) / len(answered), 2) if answered else 0.0,
+        "by_route": by_route,
+        "memory": {
+            "baseline_rss_mb": round(baseline_rss / 2**20, 1),
+            "peak_rss_mb": round(run["peak_rss"] / 2**20, 1),
+            "per_session_kb": round(max(run["peak_rss"] - baseline_rss, 0) / 1024 / args.clients, 1),
+        },
+    }
+
+
+def compare(previous: dict, current: dict):
+    print(f"\n{'':<14} {previous.get('commit') or '?':>14} {current.get('commit') or '?':>14}")
+    for path, label, lower_is_better in COMPARED:
+        old, new = previous, current
+        for key in path:
+            old = (old or {}).get(key)
+            new = (new or {}).get(key)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old * 100 if old else 0.0
+        better = (change < 0) == lower_is_better if change else True
+        print(f"{label:<14} {old:>14} {new:>14}  {change:+6.1f}% {'' if better else '(worse)'}")
+
+
+def start_server(app, port: int):
+    """Run uvicorn in a background thread; return (server, thread, port) once it is listening."""
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on"))
+    thread = threading.Thread(target=server.run, name="uvicorn", daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("The server failed to start")
+        time.sleep(0.02)
+    return server, thread, server.servers[0].sockets[0].getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=50, help="Concurrent WebSocket sessions")
+    parser.add_argument("--turns", type=int, default=5, help="Messages per session")
+    parser.add_argument("--tool-ratio", type=float, default=0.2, help="Share of questions about professors missing from the index")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="Pause between a session's turns")
+    parser.add_argument("--ramp", type=float, default=0.0, help="Seconds over which the sessions start")
+    parser.add_argument("--first-token-ms", type=float, default=200.0, help="Chat model latency to the first token")
+    parser.add_argument("--token-latency-ms", type=float, default=20.0, help="Chat model latency per further token")
+    parser.add_argument("--answer-tokens", type=int, default=60)
+    parser.add_argument("--embed-latency-ms", type=float, default=30.0, help="Embeddings API round trip")
+    parser.add_argument("--rmp-latency-ms", type=float, default=150.0, help="RateMyProfessors API round trip")
+    parser.add_argument("--reviews", default="data/sample.json", help="Reviews indexed for the run")
+    parser.add_argument("--turn-timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Results file (default benchmarks/results/load-<commit>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    from benchmarks.standins import FakeChatModel, SlowDeterministicEmbeddings, StubGraphQLServer, build_local_index
+
+    workdir = tempfile.mkdtemp(prefix="load-bench-")
+    embeddings = SlowDeterministicEmbeddings(latency=args.embed_latency_ms / 1000)
+    build_local_index(os.path.join(workdir, "index"), args.reviews, embeddings)
+    os.environ.update(
+        VECTOR_BACKEND="local",
+        LOCAL_INDEX_PATH=os.path.join(workdir, "index"),
+        INDEX_VERSION_PATH=os.path.join(workdir, "index-version"),
+        REVIEWS_PATH=args.reviews,
+    )
+    stub = StubGraphQLServer(latency=args.rmp_latency_ms / 1000).start()
+
+    import ingest
+    import main as server_main
+    from routing import FALLBACK_NOTICE
+
+    llm = FakeChatModel(
+        first_token_latency=args.first_token_ms / 1000,
+        token_latency=args.token_latency_ms / 1000,
+        answer_tokens=args.answer_tokens,
+    )
+    server_main.agent_overrides.update(llm=llm, embeddings=embeddings)
+    server_main.rmp_client.url = stub.url
+
+    server, thread, port = start_server(server_main.app, 0)
+    http_url, ws_url = f"http://127.0.0.1:{port}", f"ws://127.0.0.1:{port}/chat"
+    try:
+        deadline = time.monotonic() + 60
+        while httpx.get(f"{http_url}/readyz").status_code != 200:
+            if time.monotonic() > deadline:
+                raise RuntimeError("The agent did not become ready")
+            time.sleep(0.1)
+
+        names = sorted({record["professor_name"] for record in ingest.iter_records(args.reviews) if record.get("professor_name")})
+        gc.collect()
+        baseline_rss = rss_bytes()
+        run = asyncio.run(drive(args, http_url, ws_url, names, FALLBACK_NOTICE))
+        server_stats = httpx.get(f"{http_url}/stats").json()
+    finally:
+        server.should_exit = True
+        thread.join(timeout=30)
+        stub.stop()
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": vars(args),
+        **summarize(args, run, baseline_rss),
+        "llm_calls": llm.calls,
+        "embedding_requests": embeddings.requests,
+        "graphql": dict(stub.stats),
+        "server": server_stats,
+    }
+
+    output = args.output or os.path.join("benchmarks", "results", f"load-{results['commit'] or 'local'}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+
+    ttft, latency = results["ttft_ms"], results["turn_latency_ms"]
+    print(f"{results['turns']} turns from {args.clients} sessions in {results['seconds']}s ({results['turns_per_second']} turns/s, {results['errors']} errors)")
+    print(f"time to first token  p50 {ttft['p50']:>8.1f} ms  p95 {ttft['p95']:>8.1f} ms  p99 {ttft['p99']:>8.1f} ms")
+    print(f"turn latency         p50 {latency['p50']:>8.1f} ms  p95 {latency['p95']:>8.1f} ms  p99 {latency['p99']:>8.1f} ms")
+    for route, summary in results["by_route"].items():
+        print(f"  {route:<6} {summary['turns']:>5} turns  p50 {summary['turn_latency_ms']['p50']:>8.1f} ms  p95 {summary['turn_latency_ms']['p95']:>8.1f} ms")
+    print(f"memory per session   {results['memory']['per_session_kb']} KB (peak RSS {results['memory']['peak_rss_mb']} MB)")
+    print(f"results written to {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            compare(json.load(file), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,491 @@
+"""
+Local stand-ins for the external services, so the server can be benchmarked offline.
+
+- FakeChatModel: a streaming chat model with configurable latency that
+  rewrites, answers, summarizes and calls the RateMyProfessors tools.
+- SlowDeterministicEmbeddings: deterministic vectors with a per-request latency.
+- build_local_index: a NumPy index snapshot (VECTOR_BACKEND=local) of a reviews file.
+- StubGraphQLServer: a local HTTP server answering the three tools/*.graphql
+  operations, standalone or fused, with made-up but stable professors and schools.
+- FakeRedisServer: a local Redis-protocol server with the commands, MULTI/EXEC
+  and WATCH semantics used by sessions.RedisSessionStore.
+"""
+
+import asyncio
+import base64
+import json
+import re
+import socketserver
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, AsyncIterator, Iterator
+from uuid import uuid4
+
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+import ingest
+from vectorstore import NumpyVectorStore
+
+_WORD_RE = re.compile(r"[A-Za-z][A-Za-z.'-]*")
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model answering from its prompt, with the latency profile of a hosted model.
+
+    The reply depends on the prompt: the question rewrite returns the
+    question, the RAG prompt gets an answer built from the words of its
+    context (or "NO PROFESSOR." without context rows), the tool agent first
+    calls GetProfessor with the question and then answers from the tool
+    result, and anything else (the history summary) gets a short summary.
+    """
+
+    first_token_latency: float = 0.2
+    token_latency: float = 0.02
+    answer_tokens: int = 60
+    summary_tokens: int = 30
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def bind_tools(self, tools: list, **kwargs: Any):
+        return self.bind(tools=[getattr(tool, "name", str(tool)) for tool in tools], **kwargs)
+
+    def _reply(self, messages: list[BaseMessage], tools: list[str] | None) -> tuple[list[str], dict | None]:
+        """Return the reply tokens, or a tool call when the tool agent should look something up."""
+        self.calls += 1
+        system = next((message.content for message in messages if isinstance(message, SystemMessage)), "")
+        human = next((message.content for message in reversed(messages) if isinstance(message, HumanMessage)), "")
+        if tools:
+            if not isinstance(messages[-1], ToolMessage):
+                tool = "GetProfessor" if "GetProfessor" in tools else tools[0]
+                return [], {"name": tool, "args": {"name": human}, "id": f"call_{uuid4().hex[:12]}"}
+            return self._words(messages[-1].content, self.answer_tokens), None
+        if "standalone question" in system:
+            return [word + " " for word in human.split()], None
+        if "Professor Finder Bot" in system:
+            rows = [line for line in system.splitlines() if " | " in line][1:]
+            if not rows:
+                return ["NO ", "PROFESSOR."], None
+            return self._words("\n".join(rows), self.answer_tokens), None
+        return self._words(human, self.summary_tokens), None
+
+    @staticmethod
+    def _words(source: str, count: int) -> list[str]:
+        words = _WORD_RE.findall(source) or ["professor"]
+        return [words[i % len(words)] + " " for i in range(count)]
+
+    def _message(self, tokens: list[str], tool_call: dict | None) -> AIMessage:
+        if tool_call is not None:
+            return AIMessage(content="", tool_calls=[tool_call])
+        return AIMessage(content="".join(tokens))
+
+    def _chunks(self, tokens: list[str], tool_call: dict | None) -> Iterator[ChatGenerationChunk]:
+        if tool_call is not None:
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=[
+                {"name": tool_call["name"], "args": json.dumps(tool_call["args"]), "id": tool_call["id"], "index": 0}
+            ]))
+            return
+        for token in tokens:
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    def _generate(self, messages, stop=None, run_manager=None, tools=None, **kwargs) -> ChatResult:
+        tokens, tool_call = self._reply(messages, tools)
+        time.sleep(self.first_token_latency + self.token_latency * len(tokens))
+        return ChatResult(generations=[ChatGeneration(message=self._message(tokens, tool_call))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, tools=None, **kwargs) -> ChatResult:
+        tokens, tool_call = self._reply(messages, tools)
+        await asyncio.sleep(self.first_token_latency + self.token_latency * len(tokens))
+        return ChatResult(generations=[ChatGeneration(message=self._message(tokens, tool_call))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, tools=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        tokens, tool_call = self._reply(messages, tools)
+        await asyncio.sleep(self.first_token_latency)
+        for index, chunk in enumerate(self._chunks(tokens, tool_call)):
+            if index:
+                await asyncio.sleep(self.token_latency)
+            yield chunk
+
+
+class SlowDeterministicEmbeddings(Embeddings):
+    """Deterministic vectors (the same text always maps to the same vector) with a per-request latency."""
+
+    def __init__(self, size: int = 256, latency: float = 0.0):
+        self.fake = DeterministicFakeEmbedding(size=size)
+        self.latency = latency
+        self.model = f"fake-{size}"
+        self.requests = 0
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self.fake.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+
+def build_local_index(path: str, reviews_path: str, embeddings: Embeddings) -> int:
+    """
+    Embed a reviews file into a NumPy index snapshot, as `ingest.py --backend local` would.
+
+    Args:
+        path (str): Snapshot directory to write.
+        reviews_path (str): JSON or JSONL reviews file.
+        embeddings (Embeddings): Embeddings used for the index (and later for the queries).
+
+    Returns:
+        int: The number of indexed records.
+    """
+    records = list(ingest.iter_records(reviews_path))
+    store = NumpyVectorStore(embeddings)
+    store.add_texts(
+        [ingest.record_text(record) for record in records],
+        [ingest.record_metadata(record) for record in records],
+        [ingest.record_id(record) for record in records],
+    )
+    store.save(path)
+    return len(records)
+
+
+def _seed(text: str) -> int:
+    return zlib.crc32(text.lower().encode("utf-8"))
+
+
+def _teachers(variables: dict) -> dict:
+    query = variables.get("query") or {}
+    text = query.get("text") or ""
+    words = [word.title() for word in _WORD_RE.findall(text)] or ["Sam", "Doe"]
+    seed = _seed(text)
+    count = min(variables.get("count") or 5, 3)
+    school_id = query.get("schoolID") or base64.b64encode(f"School-{seed % 97}".encode()).decode()
+    edges = []
+    for i in range(count):
+        legacy_id = seed % 1_000_000 * 10 + i
+        edges.append({
+            "cursor": base64.b64encode(f"arrayconnection:{i}".encode()).decode(),
+            "node": {
+                "id": base64.b64encode(f"Teacher-{legacy_id}".encode()).decode(),
+                "legacyId": legacy_id,
+                "firstName": words[0],
+                "lastName": words[-1] + (f" {i + 1}" if i else ""),
+                "department": ("Biology", "Mathematics", "English", "Computer Science")[(seed + i) % 4],
+                "avgRating": round(2.5 + (seed >> i) % 25 / 10, 1),
+                "numRatings": 5 + (seed >> i) % 120,
+                "school": {"id": school_id, "name": f"University {seed % 97}"},
+                "wouldTakeAgainPercentRounded": (seed >> i) % 100,
+                "mandatoryAttendance": {"yes": 3, "no": 7, "neither": 0, "total": 10},
+                "takenForCredit": {"yes": 9, "no": 1, "neither": 0, "total": 10},
+                "ratingsDistribution": {"r1": 1, "r2": 1, "r3": 2, "r4": 3, "r5": 3, "total": 10},
+            },
+        })
+    return {"teachers": {
+        "didFallback": False,
+        "resultCount": len(edges),
+        "pageInfo": {"hasNextPage": False, "endCursor": edges[-1]["cursor"] if edges else None},
+        "edges": edges,
+    }}
+
+
+def _schools(variables: dict) -> dict:
+    text = (variables.get("query") or {}).get("text") or ""
+    seed = _seed(text)
+    node = {
+        "id": base64.b64encode(f"School-{seed % 97}".encode()).decode(),
+        "legacyId": seed % 97,
+        "name": f"{text.title() or 'State'} University",
+        "city": "Springfield",
+        "state": "IL",
+        "avgRatingRounded": 3.8,
+        "numRatings": 250,
+        "departments": [{"id": f"D{i}", "name": name} for i, name in enumerate(("Biology", "Mathematics", "English"))],
+        "summary": {"schoolReputation": 3.9, "schoolSafety": 4.1, "foodQuality": 3.2},
+    }
+    return {"schools": {"edges": [{"cursor": "YXJyYXljb25uZWN0aW9uOjA=", "node": node}]}}
+
+
+_RESOLVERS = {"teachers": _teachers, "schools": _schools}
+_FIELD_RE = re.compile(r"(?:(op\d+):)?newSearch\{(teachers|schools)\b")
+
+
+class StubGraphQLServer:
+    """
+    Local stand-in for the RateMyProfessors GraphQL endpoint.
+
+    Answers GetProfessor, GetUniversity and GetProfessorsByUniversityID, and
+    fused requests of them (see `tools.queries.fuse`), after `latency`
+    seconds. The same search text always returns the same results. The
+    next `failures` requests are answered with HTTP 503 instead.
+    """
+
+    def __init__(self, latency: float = 0.0, host: str = "127.0.0.1", port: int = 0):
+        self.latency = latency
+        self.failures = 0
+        self.stats = {"requests": 0, "operations": 0}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/graphql"
+
+    def resolve(self, query: str, variables: dict) -> dict:
+        """Return the response to one (possibly fused) GraphQL request."""
+        data = {}
+        for alias, field in _FIELD_RE.findall(query):
+            if alias:
+                prefix = f"{alias}_"
+                data[alias] = _RESOLVERS[field]({name[len(prefix):]: value for name, value in variables.items() if name.startswith(prefix)})
+            else:
+                data["newSearch"] = _RESOLVERS[field](variables)
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["operations"] += len(data)
+        if not data:
+            return {"errors": [{"message": "Unknown operation"}]}
+        return {"data": data}
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if stub.latency:
+                    time.sleep(stub.latency)
+                with stub._lock:
+                    fail = stub.failures > 0
+                    stub.failures -= fail
+                if fail:
+                    self.send_response(503)
+                    self.send_header("Retry-After", "0")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                payload = json.dumps(stub.resolve(body.get("query", ""), body.get("variables") or {})).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
+
+    def start(self) -> "StubGraphQLServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-graphql", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class RedisReplyError(Exception):
+    """Error reply of the fake Redis server."""
+
+
+class FakeRedisServer:
+    """
+    Local stand-in for a Redis server, for the session store.
+
+    Speaks RESP2 over TCP and implements the string-free subset the
+    session store uses (lists, hashes, EXISTS/DEL/EXPIRE), MULTI/EXEC with
+    per-command error replies, and WATCH: a transaction is aborted when a
+    watched key was written since it was watched. `execute` runs a command
+    in-process, e.g. to simulate another worker writing at a given moment.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.data: dict[str, Any] = {}
+        self.stats = {"commands": 0, "transactions": 0, "aborted": 0}
+        self._expiry: dict[str, float] = {}
+        self._versions: dict[str, int] = {}
+        self._lock = threading.RLock()
+        self._server = socketserver.ThreadingTCPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def _live(self, key: str):
+        deadline = self._expiry.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self._delete(key)
+        return self.data.get(key)
+
+    def _delete(self, key: str) -> bool:
+        self._expiry.pop(key, None)
+        self._written(key)
+        return self.data.pop(key, None) is not None
+
+    def _written(self, key: str):
+        self._versions[key] = self._versions.get(key, 0) + 1
+
+    def _typed(self, key: str, kind: type):
+        value = self._live(key)
+        if value is not None and not isinstance(value, kind):
+            raise RedisReplyError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    @staticmethod
+    def _range(length: int, start: int, stop: int) -> slice:
+        start = max(start + length if start < 0 else start, 0)
+        stop = stop + length if stop < 0 else stop
+        return slice(start, max(stop + 1, start))
+
+    def execute(self, command: str, *args: str):
+        """Run one command outside of any connection and return its reply."""
+        with self._lock:
+            self.stats["commands"] += 1
+            name = command.upper()
+            if name == "PING":
+                return "PONG"
+            if name == "EXISTS":
+                return sum(self._live(key) is not None for key in args)
+            if name == "DEL":
+                return sum(self._delete(key) for key in args)
+            if name == "EXPIRE":
+                if self._live(args[0]) is None:
+                    return 0
+                self._expiry[args[0]] = time.monotonic() + int(args[1])
+                return 1
+            if name in ("RPUSH", "LTRIM", "LRANGE", "LLEN"):
+                items = self._typed(args[0], list)
+                if name == "RPUSH":
+                    items = self.data.setdefault(args[0], [])
+                    items.extend(args[1:])
+                    self._written(args[0])
+                    return len(items)
+                items = items or []
+                if name == "LLEN":
+                    return len(items)
+                selected = items[self._range(len(items), int(args[1]), int(args[2]))]
+                if name == "LRANGE":
+                    return list(selected)
+                if selected:
+                    self.data[args[0]] = selected
+                else:
+                    self.data.pop(args[0], None)
+                self._written(args[0])
+                return "OK"
+            if name in ("HSET", "HSETNX", "HINCRBY", "HGETALL"):
+                fields = self._typed(args[0], dict)
+                if name == "HGETALL":
+                    return [item for pair in (fields or {}).items() for item in pair]
+                fields = self.data.setdefault(args[0], {})
+                if name == "HSETNX" and args[1] in fields:
+                    return 0
+                if name == "HINCRBY":
+                    try:
+                        value = int(fields.get(args[1], 0)) + int(args[2])
+                    except ValueError:
+                        raise RedisReplyError("ERR hash value is not an integer") from None
+                    fields[args[1]] = str(value)
+                    self._written(args[0])
+                    return value
+                added = int(args[1] not in fields)
+                fields[args[1]] = args[2]
+                self._written(args[0])
+                return added
+            raise RedisReplyError(f"ERR unknown command '{command}'")
+
+    @staticmethod
+    def _encode(reply) -> bytes:
+        if isinstance(reply, RedisReplyError):
+            return b"-%s\r\n" % str(reply).encode("utf-8")
+        if reply is None:
+            return b"*-1\r\n"
+        if isinstance(reply, int):
+            return b":%d\r\n" % reply
+        if isinstance(reply, list):
+            return b"*%d\r\n" % len(reply) + b"".join(FakeRedisServer._encode(item) for item in reply)
+        if reply in ("OK", "QUEUED", "PONG"):
+            return b"+%s\r\n" % reply.encode("utf-8")
+        data = reply.encode("utf-8")
+        return b"$%d\r\n%s\r\n" % (len(data), data)
+
+    def _handler(self):
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def read_command(self) -> list[str] | None:
+                header = self.rfile.readline()
+                if not header:
+                    return None
+                args = []
+                for _ in range(int(header[1:])):
+                    length = int(self.rfile.readline()[1:])
+                    args.append(self.rfile.read(length + 2)[:-2].decode("utf-8"))
+                return args
+
+            def handle(self):
+                queued = None
+                watched = {}
+                while (args := self.read_command()) is not None:
+                    name = args[0].upper()
+                    if name == "MULTI":
+                        queued, reply = [], "OK"
+                    elif name == "EXEC":
+                        with server._lock:
+                            server.stats["transactions"] += 1
+                            if any(server._versions.get(key, 0) != version for key, version in watched.items()):
+                                server.stats["aborted"] += 1
+                                reply = None
+                            else:
+                                reply = []
+                                for command in queued or []:
+                                    try:
+                                        reply.append(server.execute(*command))
+                                    except RedisReplyError as e:
+                                        reply.append(e)
+                        queued, watched = None, {}
+                    elif name == "WATCH":
+                        with server._lock:
+                            for key in args[1:]:
+                                server._live(key)
+                                watched[key] = server._versions.get(key, 0)
+                        reply = "OK"
+                    elif name == "UNWATCH":
+                        watched, reply = {}, "OK"
+                    elif name in ("AUTH", "SELECT"):
+                        reply = "OK"
+                    elif queued is not None:
+                        queued.append(args)
+                        reply = "QUEUED"
+                    else:
+                        try:
+                            reply = server.execute(*args)
+                        except RedisReplyError as e:
+                            reply = e
+                    self.wfile.write(server._encode(reply))
+                    self.wfile.flush()
+
+        return Handler
+
+    def start(self) -> "FakeRedisServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-redis", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
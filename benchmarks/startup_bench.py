@@ -0,0 +1,60 @@
+"""
+Cold-start benchmark.
+
+Imports main.py in fresh interpreters and reports how long the import
+takes, which is what a new worker pays before it can accept connections.
+With --warmup it also times building the agent, which needs the usual API
+keys (and the network for the Pinecone backend). --max-import-seconds makes
+the run fail when the median import time regresses past a budget.
+
+Usage:
+    python -m benchmarks.startup_bench [--runs 5] [--warmup] [--max-import-seconds 2]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = "import time; started = time.perf_counter(); import main; print(time.perf_counter() - started)"
+WARMUP_SNIPPET = "import time, main; started = time.perf_counter(); main.build_agent(); print(time.perf_counter() - started)"
+
+
+def timed(snippet: str) -> tuple[float, float]:
+    """Run `snippet` in a fresh interpreter; return (seconds it reported, total process seconds)."""
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", snippet], cwd=ROOT, capture_output=True, text=True)
+    total = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "failed")
+    return float(result.stdout.strip().splitlines()[-1]), total
+
+
+def report(name: str, samples: list[float]):
+    print(f"{name:<16} median {statistics.median(samples):.3f}s  min {min(samples):.3f}s  max {max(samples):.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--warmup", action="store_true", help="Also time building the agent.")
+    parser.add_argument("--max-import-seconds", type=float, help="Fail if the median import time exceeds this.")
+    args = parser.parse_args()
+
+    imports, processes = zip(*(timed(IMPORT_SNIPPET) for _ in range(args.runs)))
+    report("import main", imports)
+    report("process total", processes)
+    if args.warmup:
+        report("agent warm-up", [timed(WARMUP_SNIPPET)[0] for _ in range(args.runs)])
+
+    if args.max_import_seconds is not None and statistics.median(imports) > args.max_import_seconds:
+        print(f"import time regressed past {args.max_import_seconds}s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
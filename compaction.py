@@ -0,0 +1,279 @@
+import json
+import re
+from logging import getLogger
+
+from langchain_core.documents import Document
+
+from history import estimate_tokens
+
+logger = getLogger(__name__)
+
+# Short column headers; fields not listed keep their own name
+COLUMNS = {
+    "professor_name": "professor",
+    "avgRating": "rating",
+    "overall_rating": "rating",
+    "numRatings": "ratings",
+    "wouldTakeAgainPercentRounded": "again%",
+    "ratingsDistribution": "r1/r2/r3/r4/r5",
+    "mandatoryAttendance": "attendance",
+    "takenForCredit": "for credit",
+}
+
+# Fields rendered for every question, in column order
+BASE_FIELDS = ("professor_name", "school", "department", "course", "avgRating", "overall_rating", "numRatings", "comment")
+
+# Fields only rendered when the question asks about them
+QUESTION_FIELDS = {
+    "clarity": re.compile(r"\b(clear\w*|clarity|confus\w*|explain\w*)\b"),
+    "helpfulness": re.compile(r"\b(help\w*|support\w*)\b"),
+    "easiness": re.compile(r"\b(eas\w*|hard\w*|tough\w*|difficult\w*|workload|grad\w*)\b"),
+    "wouldTakeAgainPercentRounded": re.compile(r"\b(again|retake|recommend\w*)\b"),
+    "ratingsDistribution": re.compile(r"\b(distribution|breakdown|spread|stars?)\b"),
+    "mandatoryAttendance": re.compile(r"\b(attend\w*|mandatory)\b"),
+    "takenForCredit": re.compile(r"\bcredit\b"),
+}
+
+# Never rendered: identifiers and bookkeeping the model has no use for
+HIDDEN_FIELDS = {"id", "legacyId", "source"}
+
+
+def _professor_key(record: dict) -> str:
+    if record.get("legacyId") is not None:
+        return f"rmp:{record['legacyId']}"
+    name = record.get("professor_name") or " ".join(filter(None, [record.get("firstName"), record.get("lastName")]))
+    return re.sub(r"\s+", " ", name).strip().lower()
+
+
+def _name(record: dict) -> dict:
+    if "professor_name" not in record and (record.get("firstName") or record.get("lastName")):
+        record = dict(record)
+        record["professor_name"] = " ".join(filter(None, [record.pop("firstName", None), record.pop("lastName", None)]))
+    return record
+
+
+def _is_professor(item) -> bool:
+    return isinstance(item, dict) and any(item.get(field) for field in ("firstName", "lastName", "professor_name"))
+
+
+def format_value(value) -> str:
+    """Render a field value as a short table cell."""
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return f"{value:g}"
+    if isinstance(value, dict):
+        if {"r1", "r5"} <= value.keys():
+            return "/".join(str(value.get(f"r{star}", 0)) for star in range(1, 6))
+        if {"yes", "no"} <= value.keys():
+            return f"{value.get('yes', 0)} yes, {value.get('no', 0)} no"
+        return ", ".join(f"{key} {format_value(item)}" for key, item in value.items() if key != "total")
+    if isinstance(value, list):
+        return "; ".join(format_value(item) for item in value)
+    return " ".join(str(value).split()).replace("|", "/")
+
+
+def merge_professors(records: list[dict]) -> list[dict]:
+    """
+    Merge the records of each professor into one, keeping the rank of its first record.
+
+    Numeric fields are averaged; other fields keep their distinct values in
+    order, so several reviews of a professor become one row.
+
+    Args:
+        records (list): Records, best ranked first.
+
+    Returns:
+        list: One record per professor.
+    """
+    groups: dict[str, list[dict]] = {}
+    for record in records:
+        groups.setdefault(_professor_key(record), []).append(_name(record))
+
+    merged = []
+    for group in groups.values():
+        if len(group) == 1:
+            merged.append(group[0])
+            continue
+        professor = {}
+        for field in dict.fromkeys(field for record in group for field in record):
+            values = [record[field] for record in group if record.get(field) is not None]
+            if values and all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in values):
+                professor[field] = round(sum(values) / len(values), 2)
+            else:
+                distinct = list(dict.fromkeys(format_value(value) for value in values))
+                professor[field] = values[0] if len(distinct) == 1 else " / ".join(distinct)
+        merged.append(professor)
+    return merged
+
+
+def select_fields(records: list[dict], question: str | None = None) -> list[str]:
+    """
+    Pick the columns to render: the base fields plus those the question asks about.
+
+    Args:
+        records (list): The records to render.
+        question (str, optional): The question; without one every field is rendered.
+
+    Returns:
+        list: Field names present in at least one record, in column order.
+    """
+    present = dict.fromkeys(field for record in records for field in record if field not in HIDDEN_FIELDS)
+    if question is None:
+        wanted = [field for field in BASE_FIELDS if field in present] + [field for field in present if field not in BASE_FIELDS]
+    else:
+        question = question.lower()
+        wanted = [field for field in BASE_FIELDS if field in present]
+        wanted += [field for field, pattern in QUESTION_FIELDS.items() if field in present and pattern.search(question)]
+    # avgRating and overall_rating share the "rating" column
+    return [field for field in wanted if not (field == "overall_rating" and "avgRating" in wanted)]
+
+
+def render_row(record: dict, fields: list[str], max_cell_chars: int | None = None) -> str:
+    cells = []
+    for field in fields:
+        value = record.get(field)
+        if value is None and field == "avgRating":
+            value = record.get("overall_rating")
+        cell = format_value(value)
+        if max_cell_chars is not None and len(cell) > max_cell_chars:
+            cell = cell[:max_cell_chars].rstrip() + "..."
+        cells.append(cell)
+    return " | ".join(cells)
+
+
+class ContextCompactor:
+    """
+    Render retrieved records and tool results as a compact table under a token budget.
+
+    Instead of one JSON object per retrieved chunk, the model gets one table:
+    a header naming the columns once, then one row per professor (chunks of
+    the same professor merged), with only the columns the question needs.
+    Rows are added best ranked first until `max_tokens` is reached; a row
+    that does not fit has its long cells cut down, and the rows after it
+    are dropped.
+    """
+
+    def __init__(self, max_tokens: int = 600, max_cell_chars: int = 240, min_cell_chars: int = 40, name: str = "context"):
+        """
+        Args:
+            max_tokens (int): Token budget of the rendered table.
+            max_cell_chars (int): Cells longer than this are truncated.
+            min_cell_chars (int): Shortest truncation tried when fitting the last row into the budget.
+            name (str): Label used in the log lines.
+        """
+        self.max_tokens = max_tokens
+        self.max_cell_chars = max_cell_chars
+        self.min_cell_chars = min_cell_chars
+        self.name = name
+        self.counts = {"compactions": 0, "tokens_before": 0, "tokens_after": 0, "rows": 0, "dropped_rows": 0}
+
+    def render(self, records: list[dict], question: str | None = None, merge: bool = True) -> str:
+        """
+        Render records as a table within the token budget.
+
+        Args:
+            records (list): Records, best ranked first.
+            question (str, optional): Selects the columns; without one every field is rendered.
+            merge (bool): Merge the records of each professor into one row (see `merge_professors`).
+
+        Returns:
+            str: The table, or an empty string without records.
+        """
+        professors = merge_professors(records) if merge else [_name(record) for record in records]
+        if not professors:
+            return ""
+        fields = select_fields(professors, question)
+        lines = [" | ".join(COLUMNS.get(field, field) for field in fields)]
+        used = estimate_tokens(lines[0])
+        rows = 0
+        for professor in professors:
+            row = render_row(professor, fields, self.max_cell_chars)
+            limit = self.max_cell_chars
+            while used + estimate_tokens(row) > self.max_tokens and limit > self.min_cell_chars:
+                limit //= 2
+                row = render_row(professor, fields, limit)
+            if used + estimate_tokens(row) > self.max_tokens:
+                break
+            lines.append(row)
+            used += estimate_tokens(row)
+            rows += 1
+        self.counts["rows"] += rows
+        self.counts["dropped_rows"] += len(professors) - rows
+        return "\n".join(lines)
+
+    def _parse(self, text: str) -> tuple[dict | None, str]:
+        try:
+            record = json.loads(text)
+        except ValueError:
+            return None, text
+        return (record, text) if isinstance(record, dict) else (None, text)
+
+    def compact_documents(self, documents: list[Document], question: str | None = None, merge: bool = True) -> list[Document]:
+        """
+        Replace retrieved documents by a single document holding their table.
+
+        Documents whose content is not a JSON record are kept as they are,
+        after the table and within what is left of the budget.
+
+        Args:
+            documents (list): Retrieved documents, best ranked first.
+            question (str, optional): The standalone question, used to select the columns.
+            merge (bool): Merge the records of each professor into one row.
+
+        Returns:
+            list: The compacted documents, ready for `create_stuff_documents_chain`.
+        """
+        records, others = [], []
+        for document in documents:
+            record, text = self._parse(document.page_content)
+            if record is None:
+                others.append(text)
+            else:
+                records.append(record)
+
+        parts = [self.render(records, question, merge)] if records else []
+        used = sum(estimate_tokens(part) for part in parts)
+        for text in others:
+            if used + estimate_tokens(text) > self.max_tokens:
+                break
+            parts.append(text)
+            used += estimate_tokens(text)
+
+        before = sum(estimate_tokens(document.page_content) for document in documents)
+        self._record_sizes(before, used)
+        return [Document(page_content="\n\n".join(parts))] if parts else []
+
+    def compact_result(self, result):
+        """
+        Render a tool result compactly: professor lists become tables, anything else is left as is.
+
+        Only lists of professors are rendered as tables: other records, such as
+        the schools of GetUniversity, keep their ids for later tool calls.
+
+        Args:
+            result: The value returned by a RateMyProfessors tool function.
+
+        Returns:
+            The compacted result (a string for professor lists).
+        """
+        if isinstance(result, list) and result and all(_is_professor(item) for item in result):
+            before = estimate_tokens(json.dumps(result))
+            table = self.render(result)
+            self._record_sizes(before, estimate_tokens(table))
+            return table
+        if isinstance(result, dict) and "error" not in result:
+            return {key: self.compact_result(value) for key, value in result.items()}
+        return result
+
+    def _record_sizes(self, before: int, after: int):
+        self.counts["compactions"] += 1
+        self.counts["tokens_before"] += before
+        self.counts["tokens_after"] += after
+        logger.info(f"Compacted {self.name} from about {before} to {after} prompt tokens")
+
+    def stats(self) -> dict:
+        """Return row counts and the estimated prompt tokens before and after compaction."""
+        counts = self.counts
+        saved = 1 - counts["tokens_after"] / counts["tokens_before"] if counts["tokens_before"] else 0.0
+        return dict(counts, saved=round(saved, 4))
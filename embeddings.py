@@ -0,0 +1,264 @@
+import asyncio
+import queue
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from hashlib import sha256
+from logging import getLogger
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from metrics import record_cache, timed
+
+logger = getLogger(__name__)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that caches vectors by a hash of the model name and text.
+
+    Lookups go through an in-memory LRU tier first and then, when `path` is
+    given, a SQLite tier storing float32 blobs, so identical queries and
+    unchanged documents are never sent to the embeddings API twice. Any
+    LangChain `Embeddings` can be wrapped, which also makes the cache usable
+    offline with `langchain_core.embeddings.DeterministicFakeEmbedding`.
+    """
+
+    def __init__(self, embeddings: Embeddings, path: str | None = None, max_memory_entries: int = 10000, model: str | None = None):
+        """
+        Args:
+            embeddings (Embeddings): The underlying embeddings model.
+            path (str, optional): SQLite file for the on-disk tier.
+            max_memory_entries (int): Maximum number of vectors kept in memory.
+            model (str, optional): Model name used in cache keys, inferred from `embeddings` when omitted.
+        """
+        self.embeddings = embeddings
+        self.model = model or getattr(embeddings, "model", None) or type(embeddings).__name__
+        self.max_memory_entries = max_memory_entries
+
+        self._memory: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+            self._db.commit()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def key(self, text: str) -> str:
+        """Return the cache key of `text` for this model."""
+        return sha256(f"{self.model}\0{text}".encode("utf-8")).hexdigest()
+
+    # Storage
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _get_many(self, keys: list[str]) -> dict[str, np.ndarray]:
+        found = {}
+        with self._lock:
+            missing = []
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is None:
+                    missing.append(key)
+                    continue
+                self._memory.move_to_end(key)
+                found[key] = vector
+                self.memory_hits += 1
+            if self._db is not None and missing:
+                for start in range(0, len(missing), 500):
+                    chunk = missing[start:start + 500]
+                    rows = self._db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                    ).fetchall()
+                    for key, blob in rows:
+                        vector = np.frombuffer(blob, dtype=np.float32)
+                        self._remember(key, vector)
+                        found[key] = vector
+                        self.disk_hits += 1
+        return found
+
+    def _put_many(self, items: dict[str, np.ndarray]):
+        with self._lock:
+            for key, vector in items.items():
+                self._remember(key, vector)
+            if self._db is not None and items:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(key, vector.tobytes()) for key, vector in items.items()],
+                )
+                self._db.commit()
+
+    def _plan(self, texts: list[str]):
+        """Return the keys of `texts`, the cached vectors and the unique texts still to embed."""
+        keys = [self.key(text) for text in texts]
+        found = self._get_many(list(dict.fromkeys(keys)))
+        pending = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in pending:
+                pending[key] = text
+        self.misses += len(pending)
+        record_cache("embeddings", "hit", len(keys) - len(pending))
+        record_cache("embeddings", "miss", len(pending))
+        return keys, found, pending
+
+    def _finish(self, keys, found, pending, vectors) -> list[list[float]]:
+        computed = {key: np.asarray(vector, dtype=np.float32) for key, vector in zip(pending, vectors)}
+        self._put_many(computed)
+        found.update(computed)
+        return [found[key].tolist() for key in keys]
+
+    # Embeddings interface
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys, found, pending = self._plan(texts)
+        vectors = self.embeddings.embed_documents(list(pending.values())) if pending else []
+        return self._finish(keys, found, pending, vectors)
+
+    def embed_query(self, text: str) -> list[float]:
+        with timed("embed"):
+            keys, found, pending = self._plan([text])
+            vectors = [self.embeddings.embed_query(text)] if pending else []
+            return self._finish(keys, found, pending, vectors)[0]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys, found, pending = self._plan(texts)
+        vectors = await self.embeddings.aembed_documents(list(pending.values())) if pending else []
+        return self._finish(keys, found, pending, vectors)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        with timed("embed"):
+            keys, found, pending = self._plan([text])
+            vectors = [await self.embeddings.aembed_query(text)] if pending else []
+            return self._finish(keys, found, pending, vectors)[0]
+
+    def stats(self) -> dict:
+        """Return hit and miss counters for the cache tiers."""
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "memory_entries": len(self._memory),
+        }
+
+
+class BatchingEmbeddings(Embeddings):
+    """
+    Embeddings wrapper coalescing concurrent single-text queries into batched calls.
+
+    Each `embed_query`/`aembed_query` call queues its text; a dispatcher
+    thread collects the texts arriving within `window` seconds of the first
+    one, or until `max_batch` are queued, and embeds them with one
+    `embed_documents` call, then hands each caller its vector. Up to
+    `max_inflight` batches run at once. Under load this turns many small
+    HTTPS requests into a few large ones; a lone query waits at most
+    `window` extra. Queries are embedded as documents, which is only
+    equivalent for symmetric models such as OpenAI's.
+    """
+
+    def __init__(self, embeddings: Embeddings, window: float = 0.005, max_batch: int = 64, max_inflight: int = 4):
+        """
+        Args:
+            embeddings (Embeddings): The underlying embeddings model.
+            window (float): Seconds to wait for more queries after the first one of a batch.
+            max_batch (int): Maximum number of texts per batched call.
+            max_inflight (int): Maximum number of batched calls running at once.
+        """
+        self.embeddings = embeddings
+        self.model = getattr(embeddings, "model", None) or type(embeddings).__name__
+        self.window = window
+        self.max_batch = max_batch
+        self.max_inflight = max_inflight
+
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._dispatcher = None
+        self._dispatcher_lock = threading.Lock()
+        self._calls = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix="embed-batch")
+
+        self._stats_lock = threading.Lock()
+        self.batch_sizes = Counter()
+        self.errors = 0
+
+    def _submit(self, text: str) -> Future:
+        if self._dispatcher is None:
+            with self._dispatcher_lock:
+                if self._dispatcher is None:
+                    self._dispatcher = threading.Thread(target=self._dispatch, name="embed-dispatcher", daemon=True)
+                    self._dispatcher.start()
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def _dispatch(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._calls.submit(self._embed_batch, batch)
+
+    def _embed_batch(self, batch: list[tuple[str, Future]]):
+        # Callers that gave up (e.g. a cancelled turn) are left out of the call
+        batch = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        with self._stats_lock:
+            self.batch_sizes[len(batch)] += 1
+        try:
+            vectors = self.embeddings.embed_documents([text for text, _ in batch])
+        except Exception as e:
+            with self._stats_lock:
+                self.errors += 1
+            logger.warning(f"Batched embedding of {len(batch)} texts failed: {e}")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), vector in zip(batch, vectors):
+            future.set_result(vector)
+
+    # Embeddings interface
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        # Document batches are already batched by the caller
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._submit(text).result()
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return await asyncio.wrap_future(self._submit(text))
+
+    def stats(self) -> dict:
+        """Return the number of batched calls, texts per call and the batch-size histogram."""
+        with self._stats_lock:
+            batch_sizes = dict(self.batch_sizes)
+        batches = sum(batch_sizes.values())
+        texts = sum(size * count for size, count in batch_sizes.items())
+        histogram = Counter()
+        for size, count in batch_sizes.items():
+            # Power-of-two buckets keyed by their upper bound
+            histogram[1 << (size - 1).bit_length()] += count
+        return {
+            "batches": batches,
+            "texts": texts,
+            "mean_batch_size": round(texts / batches, 2) if batches else 0.0,
+            "errors": self.errors,
+            "batch_size_histogram": {f"<={bound}": histogram[bound] for bound in sorted(histogram)},
+        }
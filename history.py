@@ -0,0 +1,125 @@
+import asyncio
+from logging import getLogger
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from sessions import HUMAN, MemorySessionStore, SessionHistory, SessionStore
+
+logger = getLogger(__name__)
+
+SUMMARY_PROMPT = (
+    "Condense the conversation below into a short summary for a professor-finder chatbot. "
+    "Keep professor names, universities, courses and the user's stated preferences; drop pleasantries.\n\n"
+    "Existing summary:\n{summary}\n\nNew turns:\n{turns}\n\nUpdated summary:"
+)
+SUMMARY_PREFIX = "Summary of the earlier conversation: "
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (about four characters per token plus per-message overhead)."""
+    return len(text) // 4 + 4
+
+
+class HistoryManager:
+    """
+    Token-budgeted chat history with a rolling summary.
+
+    Each turn's prompt gets the most recent messages that fit in
+    `max_tokens`, preceded by a summary of everything older. Messages that
+    fall out of the window are folded into the summary by a background
+    task, off the request path, and then dropped from memory, so both the
+    prompt size and the memory per session stay flat as a conversation
+    grows.
+    """
+
+    def __init__(self, summarizer=None, max_tokens: int = 1500, summary_batch: int = 4, store: SessionStore | None = None):
+        """
+        Args:
+            summarizer (BaseChatModel, optional): Model used to fold old turns into the summary.
+                Without it, messages that leave the window are simply dropped.
+            max_tokens (int): Token budget for the recent-messages window.
+            summary_batch (int): Minimum number of out-of-window messages folded at once.
+            store (SessionStore, optional): Where sessions are kept; in-process memory by default.
+        """
+        self.summarizer = summarizer
+        self.max_tokens = max_tokens
+        self.summary_batch = summary_batch
+        self.store = store or MemorySessionStore()
+        self._folding: set[str] = set()
+        self._tasks: set[asyncio.Task] = set()
+
+    def _window_start(self, session: SessionHistory) -> int:
+        """Index of the oldest message that still fits in the token budget."""
+        budget = self.max_tokens - estimate_tokens(SUMMARY_PREFIX + session.summary) if session.summary else self.max_tokens
+        start = len(session.turns)
+        while start > 0:
+            cost = estimate_tokens(session.turns[start - 1][1])
+            if cost > budget:
+                break
+            budget -= cost
+            start -= 1
+        # Keep whole human/AI pairs together
+        if start % 2:
+            start += 1
+        return start
+
+    async def messages(self, session_id: str) -> list:
+        """
+        Return the prompt history of a session as LangChain messages.
+
+        Args:
+            session_id (str): The session.
+
+        Returns:
+            list: An optional summary message followed by the recent turns that fit the budget.
+        """
+        session = await self.store.load(session_id)
+        start = self._window_start(session)
+        messages = []
+        if session.summary:
+            messages.append(SystemMessage(SUMMARY_PREFIX + session.summary))
+        for role, text in session.turns[start:]:
+            messages.append(HumanMessage(text) if role == HUMAN else AIMessage(text))
+        return messages
+
+    async def append(self, session_id: str, human_message: str, ai_message: str):
+        """
+        Record a turn and schedule folding of messages that left the window.
+
+        Args:
+            session_id (str): The session.
+            human_message (str): The user's message.
+            ai_message (str): The assistant's answer.
+        """
+        session = await self.store.append_turn(session_id, human_message, ai_message)
+        start = self._window_start(session)
+        if start < self.summary_batch or session_id in self._folding:
+            return
+        if self.summarizer is None:
+            await self.store.fold(session_id, session.start + start, session.summary)
+            return
+        self._folding.add(session_id)
+        task = asyncio.create_task(self._fold(session_id, session.turns[:start], session.summary, session.start + start))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fold(self, session_id: str, old: list[tuple[str, str]], summary: str, end: int):
+        """Fold the `old` messages, the oldest of the session ending before position `end`, into its summary."""
+        try:
+            turns = "\n".join(f"{'User' if role == HUMAN else 'Assistant'}: {text}" for role, text in old)
+            result = await self.summarizer.ainvoke(SUMMARY_PROMPT.format(summary=summary or "(none)", turns=turns))
+            summary = result.content.strip()
+        except Exception as e:
+            logger.warning(f"Could not summarize history of session {session_id}: {e}")
+        try:
+            # Folded messages leave the store even if summarizing failed, keeping sessions bounded
+            await self.store.fold(session_id, end, summary)
+        except Exception as e:
+            logger.warning(f"Could not fold history of session {session_id}: {e}")
+        finally:
+            self._folding.discard(session_id)
+
+    async def drain(self):
+        """Wait for pending summaries (used on shutdown and in benchmarks)."""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
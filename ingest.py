@@ -0,0 +1,477 @@
+"""
+Streaming, idempotent and resumable ingestion of professor reviews into the vector index.
+
+Usage:
+    python ingest.py data/sample.json --backend local
+    python ingest.py reviews.jsonl.gz --backend pinecone --create-index --batch-size 200 --concurrency 8
+
+Records are read one at a time from a JSON array or a JSONL file (optionally
+gzipped), get an id derived from their content, and are skipped when their
+content hash was already ingested. New and changed records are embedded and
+upserted in batches with bounded concurrency. Progress is checkpointed in a
+SQLite state file after every durable batch, so a crashed run resumes where
+it stopped. After a complete pass, records an earlier pass of the same file
+ingested but that are no longer in it (e.g. edited reviews, whose id is a
+hash of their content) are deleted from the index.
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import sqlite3
+import time
+from hashlib import sha256
+from logging import basicConfig, getLogger
+from typing import Iterator
+
+from dotenv import load_dotenv
+
+from semantic_cache import touch_index_version
+
+logger = getLogger(__name__)
+
+READ_SIZE = 64 * 1024
+METADATA_TYPES = (str, int, float, bool)
+PROFESSOR_FIELDS = (
+    "legacyId", "department", "school", "avgRating", "numRatings", "wouldTakeAgainPercentRounded",
+    "ratingsDistribution", "mandatoryAttendance", "takenForCredit",
+)
+
+
+# Reading
+
+def _open(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def _iter_json_array(file) -> Iterator[dict]:
+    """Incrementally decode the elements of a top-level JSON array without loading the whole file."""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    started = False
+    eof = False
+    while True:
+        position = 0
+        while True:
+            # Skip whitespace, the opening bracket and separators
+            while position < len(buffer) and (buffer[position].isspace() or buffer[position] in ",["):
+                if buffer[position] == "[":
+                    if started:
+                        break
+                    started = True
+                position += 1
+            if position < len(buffer) and buffer[position] == "]":
+                if buffer[position + 1:].strip() or file.read(READ_SIZE).strip():
+                    raise ValueError("Unexpected trailing data in JSON array")
+                return
+            if position >= len(buffer):
+                break
+            try:
+                record, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                break
+            yield record
+            position = end
+        buffer = buffer[position:]
+        if eof:
+            # A truncated file must not look like a complete, shorter one
+            raise ValueError("Truncated JSON array: end of file before the closing ']'" if started else "Expected a JSON array")
+        chunk = file.read(READ_SIZE)
+        eof = not chunk
+        buffer += chunk
+
+
+def iter_records(path: str) -> Iterator[dict]:
+    """
+    Stream review records from a JSON array or JSONL file, optionally gzipped.
+
+    Args:
+        path (str): The path to the data file.
+
+    Yields:
+        dict: One record at a time.
+    """
+    with _open(path) as file:
+        if ".jsonl" in os.path.basename(path):
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from _iter_json_array(file)
+
+
+# Normalization
+
+def record_text(record: dict) -> str:
+    """Render a record as the text that is embedded and shown to the model."""
+    return json.dumps(record, ensure_ascii=False, sort_keys=True)
+
+
+def record_metadata(record: dict) -> dict:
+    """Return the scalar fields of a record, usable as vector store metadata."""
+    return {key: value for key, value in record.items() if isinstance(value, METADATA_TYPES)}
+
+
+def record_id(record: dict) -> str:
+    """
+    Return a deterministic id for a record.
+
+    Records carrying their own `id` keep it; others are identified by a hash
+    of their canonical content, so re-ingesting the same data never creates
+    duplicates.
+    """
+    if record.get("id"):
+        return str(record["id"])
+    return "review-" + sha256(record_text(record).encode("utf-8")).hexdigest()[:32]
+
+
+def professor_record(professor: dict) -> dict | None:
+    """
+    Normalize a professor returned by the RateMyProfessors tools into a record.
+
+    Args:
+        professor (dict): A professor as formatted by `format_professor_response`.
+
+    Returns:
+        dict: The record, identified by the professor's legacyId, or None without one.
+    """
+    legacy_id = professor.get("legacyId")
+    if legacy_id is None:
+        return None
+    record = {
+        "id": f"rmp-teacher-{legacy_id}",
+        "professor_name": " ".join(filter(None, [professor.get("firstName"), professor.get("lastName")])),
+        "source": "ratemyprofessors",
+    }
+    for field in PROFESSOR_FIELDS:
+        if professor.get(field) not in (None, {}, ""):
+            record[field] = professor[field]
+    return record
+
+
+def content_hash(text: str, metadata: dict) -> str:
+    """Return the hash used to detect whether a record changed since it was ingested."""
+    return sha256(json.dumps([text, metadata], sort_keys=True).encode("utf-8")).hexdigest()
+
+
+# State
+
+class IngestState:
+    """SQLite-backed record hashes and per-source checkpoints."""
+
+    def __init__(self, path: str):
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS records (id TEXT PRIMARY KEY, hash TEXT NOT NULL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS checkpoints (source TEXT PRIMARY KEY, position INTEGER NOT NULL)")
+        # Which ids each file provided in its latest pass, to delete those it no longer contains
+        self.db.execute("CREATE TABLE IF NOT EXISTS passes (path TEXT PRIMARY KEY, pass INTEGER NOT NULL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS provided (path TEXT NOT NULL, id TEXT NOT NULL, pass INTEGER NOT NULL, PRIMARY KEY (path, id))")
+        self.db.commit()
+
+    def hashes(self, ids: list[str]) -> dict[str, str]:
+        if not ids:
+            return {}
+        rows = self.db.execute(
+            f"SELECT id, hash FROM records WHERE id IN ({','.join('?' * len(ids))})", ids
+        ).fetchall()
+        return dict(rows)
+
+    def checkpoint(self, source: str) -> int:
+        row = self.db.execute("SELECT position FROM checkpoints WHERE source = ?", (source,)).fetchone()
+        return row[0] if row else 0
+
+    def begin_pass(self, path: str, resume: bool) -> int:
+        """Return the pass number of a file: a new one, or the interrupted one when resuming."""
+        row = self.db.execute("SELECT pass FROM passes WHERE path = ?", (path,)).fetchone()
+        number = row[0] if row else 0
+        if not resume or not row:
+            number += 1
+            with self.db:
+                self.db.execute("INSERT OR REPLACE INTO passes (path, pass) VALUES (?, ?)", (path, number))
+        return number
+
+    def commit(self, source: str, position: int, hashes: dict[str, str], path: str | None = None, number: int = 0, ids: list[str] = ()):
+        """Record ingested hashes, the ids `path` provided in pass `number` and advance the checkpoint in one transaction."""
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO records (id, hash) VALUES (?, ?)", hashes.items())
+            if path is not None:
+                self.db.executemany("INSERT OR REPLACE INTO provided (path, id, pass) VALUES (?, ?, ?)", ((path, id_, number) for id_ in ids))
+            self.db.execute("INSERT OR REPLACE INTO checkpoints (source, position) VALUES (?, ?)", (source, position))
+
+    def superseded(self, path: str, number: int) -> list[str]:
+        """Return the ids `path` provided before pass `number` but not in it, and that no other file provides."""
+        rows = self.db.execute(
+            "SELECT id FROM provided AS old WHERE path = ? AND pass < ? AND NOT EXISTS "
+            "(SELECT 1 FROM provided AS other WHERE other.id = old.id AND other.path != old.path)",
+            (path, number),
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def finish_pass(self, path: str, number: int, deleted: list[str]):
+        """Forget what `path` provided before pass `number`, and the hashes of the deleted ids."""
+        with self.db:
+            self.db.execute("DELETE FROM provided WHERE path = ? AND pass < ?", (path, number))
+            self.db.executemany("DELETE FROM records WHERE id = ?", ((id_,) for id_ in deleted))
+
+    def reset(self, source: str):
+        with self.db:
+            self.db.execute("DELETE FROM checkpoints WHERE source = ?", (source,))
+
+
+# Targets
+
+def build_embeddings():
+    from langchain_openai import OpenAIEmbeddings
+    from embeddings import CachedEmbeddings
+
+    return CachedEmbeddings(
+        OpenAIEmbeddings(model="text-embedding-3-small"),
+        path=os.getenv("EMBEDDING_CACHE_PATH"),
+    )
+
+
+def build_vector_store(backend: str, index_name: str, index_path: str, embedding, create_index: bool = False):
+    """Open (or create) the vector store that records are upserted into."""
+    if backend == "local":
+        from vectorstore import NumpyVectorStore
+
+        if os.path.isdir(index_path):
+            return NumpyVectorStore.load(index_path, embedding)
+        return NumpyVectorStore(embedding)
+
+    from langchain_pinecone import PineconeVectorStore
+    from pinecone import Pinecone, ServerlessSpec
+
+    api_key = os.getenv("PINECONE_API_KEY")
+    if api_key is None:
+        raise ValueError("Please set the PINECONE_API_KEY environment variable")
+    client = Pinecone(api_key=api_key)
+    if index_name not in client.list_indexes().names():
+        if not create_index:
+            raise ValueError(f"Index {index_name} not found in Pinecone. Use --create-index to create it.")
+        spec = ServerlessSpec(
+            cloud=os.getenv("PINECONE_CLOUD") or "aws",
+            region=os.getenv("PINECONE_REGION") or "us-east-1",
+        )
+        client.create_index(index_name, dimension=1536, metric="cosine", spec=spec)  # text-embedding-3-small
+        while not client.describe_index(index_name).status["ready"]:
+            time.sleep(1)
+    return PineconeVectorStore(client.Index(index_name), embedding)
+
+
+# Pipeline
+
+class Ingestor:
+    """
+    Embed and upsert records in batches with bounded concurrency.
+
+    A batch only becomes durable, and advances the checkpoint, once every
+    batch before it has been written too. For the local backend the
+    snapshot is rewritten at most every `checkpoint_interval` seconds.
+    """
+
+    def __init__(self, vector_store, state: IngestState, source: str, batch_size: int = 100, concurrency: int = 4, index_path: str | None = None, checkpoint_interval: float = 5.0, version_path: str | None = None, path: str | None = None):
+        self.vector_store = vector_store
+        self.state = state
+        self.source = source
+        # With the file path, records the file no longer contains (e.g. edited reviews) are deleted after a full pass
+        self.path = path
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.index_path = index_path
+        self.checkpoint_interval = checkpoint_interval
+        self.version_path = version_path
+
+        self.read = 0
+        self.skipped = 0
+        self.upserted = 0
+        self.deleted = 0
+
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._done: dict[int, tuple[int, dict, list]] = {}
+        self._next_batch = 0
+        self._position = None
+        self._hashes = {}
+        self._provided = []
+        self._pass = 0
+        self._last_checkpoint = 0.0
+        self._started = 0.0
+
+    async def _write(self, number: int, end: int, batch: list[tuple[str, str, dict, str]], provided: list[str]):
+        try:
+            if batch:
+                ids, texts, metadatas, _ = zip(*batch)
+                await self.vector_store.aadd_texts(list(texts), list(metadatas), ids=list(ids))
+                self.upserted += len(batch)
+            self._done[number] = (end, {id_: hash_ for id_, _, _, hash_ in batch}, provided)
+            self._advance()
+        finally:
+            self._semaphore.release()
+
+    def _advance(self, final: bool = False):
+        """Collect the contiguous run of finished batches and checkpoint it when due."""
+        while self._next_batch in self._done:
+            self._position, batch_hashes, provided = self._done.pop(self._next_batch)
+            self._hashes.update(batch_hashes)
+            self._provided.extend(provided)
+            self._next_batch += 1
+        if self._position is None or (not final and not self._hashes and not self._provided):
+            return
+        if not final and self.index_path and time.perf_counter() - self._last_checkpoint < self.checkpoint_interval:
+            return
+        if self.index_path and (final or self._hashes):
+            # The local index is only durable once its snapshot is written
+            self.vector_store.save(self.index_path)
+        self.state.commit(self.source, self._position, self._hashes, self.path, self._pass, self._provided)
+        if self._hashes and self.version_path:
+            # Tell running workers that cached answers may be outdated
+            touch_index_version(self.version_path)
+        self._hashes = {}
+        self._provided = []
+        self._last_checkpoint = time.perf_counter()
+        elapsed = self._last_checkpoint - self._started
+        logger.info(f"Checkpoint at record {self._position}: {self.upserted} upserted, {self.skipped} unchanged, {self.read / max(elapsed, 1e-9):.1f} records/s")
+
+    async def _delete_superseded(self):
+        """Delete the records an earlier pass of the file ingested and this complete pass did not find."""
+        superseded = self.state.superseded(self.path, self._pass)
+        if superseded:
+            await self.vector_store.adelete(ids=superseded)
+            if self.index_path:
+                self.vector_store.save(self.index_path)
+            if self.version_path:
+                touch_index_version(self.version_path)
+            self.deleted = len(superseded)
+            logger.info(f"Deleted {len(superseded)} records no longer in {self.path}")
+        self.state.finish_pass(self.path, self._pass, superseded)
+
+    def _filter_unchanged(self, pending: list[tuple[str, str, dict, str]]):
+        known = self.state.hashes([item[0] for item in pending])
+        fresh = {}
+        for item in pending:
+            if known.get(item[0]) == item[3] or item[0] in fresh:
+                self.skipped += 1
+                continue
+            fresh[item[0]] = item
+        return list(fresh.values())
+
+    @staticmethod
+    def _raise_failures(tasks: set):
+        """Stop reading as soon as a batch failed; the checkpoint stays before it."""
+        for task in [task for task in tasks if task.done()]:
+            tasks.discard(task)
+            task.result()
+
+    async def run(self, records: Iterator[dict]):
+        """
+        Ingest a stream of records, resuming after the last checkpoint.
+
+        Returns:
+            dict: Counters and throughput of the run.
+        """
+        self._started = self._last_checkpoint = time.perf_counter()
+        start = self.state.checkpoint(self.source)
+        if start:
+            logger.info(f"Resuming {self.source} after record {start}")
+        if self.path is not None:
+            self._pass = self.state.begin_pass(self.path, resume=bool(start))
+
+        tasks = set()
+        pending = []
+        number = 0
+        position = start
+        for position, record in enumerate(records, start=1):
+            if position <= start:
+                continue
+            self.read += 1
+            text = record_text(record)
+            metadata = record_metadata(record)
+            pending.append((record_id(record), text, metadata, content_hash(text, metadata)))
+            if len(pending) >= self.batch_size:
+                await self._semaphore.acquire()
+                self._raise_failures(tasks)
+                tasks.add(asyncio.create_task(self._write(number, position, self._filter_unchanged(pending), [item[0] for item in pending])))
+                number += 1
+                pending = []
+            await asyncio.sleep(0)  # Let finished batches commit while the file is being read
+
+        await self._semaphore.acquire()
+        self._raise_failures(tasks)
+        tasks.add(asyncio.create_task(self._write(number, max(position, start), self._filter_unchanged(pending), [item[0] for item in pending])))
+        await asyncio.gather(*tasks)
+        self._advance(final=True)
+        if self.path is not None:
+            await self._delete_superseded()
+
+        elapsed = time.perf_counter() - self._started
+        return {
+            "read": self.read,
+            "skipped": self.skipped,
+            "upserted": self.upserted,
+            "deleted": self.deleted,
+            "seconds": round(elapsed, 3),
+            "records_per_second": round(self.read / max(elapsed, 1e-9), 1),
+        }
+
+
+def main(argv=None):
+    load_dotenv()
+    basicConfig(level="INFO", format="%(asctime)s %(levelname)s %(message)s")
+
+    parser = argparse.ArgumentParser(description="Ingest professor reviews into the vector index.")
+    parser.add_argument("path", help="JSON array or JSONL file of review records (.gz supported)")
+    parser.add_argument("--backend", choices=["pinecone", "local"], default=os.getenv("VECTOR_BACKEND", "pinecone"))
+    parser.add_argument("--index-name", default="professors-index", help="Pinecone index name")
+    parser.add_argument("--index-path", default=os.getenv("LOCAL_INDEX_PATH", "data/professors-index"), help="Local index snapshot directory")
+    parser.add_argument("--create-index", action="store_true", help="Create the Pinecone index if it does not exist")
+    parser.add_argument("--state", default=os.getenv("INGEST_STATE_PATH", "data/ingest-state.sqlite"), help="SQLite file with record hashes and checkpoints")
+    parser.add_argument("--version-path", default=os.getenv("INDEX_VERSION_PATH", "data/index-version"), help="File touched whenever the index changes")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--checkpoint-interval", type=float, default=5.0, help="Seconds between local index snapshots")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and re-read the whole file (unchanged records are still skipped)")
+    parser.add_argument("--aggregates", default=os.getenv("AGGREGATES_PATH", "data/professor-aggregates"), help="Directory of the per-professor aggregates used for ranking questions")
+    args = parser.parse_args(argv)
+
+    embedding = build_embeddings()
+    vector_store = build_vector_store(args.backend, args.index_name, args.index_path, embedding, args.create_index)
+    state = IngestState(args.state)
+    # Checkpoints are tied to the file's size and mtime, so an edited file is re-read
+    # from the start (unchanged records are still skipped by content hash).
+    stat = os.stat(args.path)
+    source = f"{os.path.abspath(args.path)}:{stat.st_size}:{int(stat.st_mtime)}"
+    if args.restart:
+        state.reset(source)
+
+    ingestor = Ingestor(
+        vector_store,
+        state,
+        source,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        index_path=args.index_path if args.backend == "local" else None,
+        checkpoint_interval=args.checkpoint_interval,
+        version_path=args.version_path,
+        path=os.path.abspath(args.path),
+    )
+    summary = asyncio.run(ingestor.run(iter_records(args.path)))
+    logger.info(f"Ingestion finished: {json.dumps(summary)}")
+
+    # Ranking aggregates are rebuilt from the whole file: a second read, but no embedding calls
+    from aggregates import aggregate_records, save_aggregates  # aggregates imports this module through lexical
+
+    columns = aggregate_records(iter_records(args.path))
+    save_aggregates(args.aggregates, args.path, columns)
+    summary["aggregated_professor_courses"] = len(columns["count"])
+    logger.info(f"Saved aggregates of {len(columns['count'])} professor-course pairs to {args.aggregates}")
+    return summary
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+import math
+import re
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from difflib import SequenceMatcher
+from typing import Iterable
+
+from langchain_core.documents import Document
+
+from ingest import record_id, record_metadata, record_text
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+TITLES = {"dr", "prof", "professor", "mr", "mrs", "ms", "miss"}
+STOPWORDS = {
+    "a", "about", "an", "and", "are", "as", "at", "be", "best", "by", "can", "class", "course", "do", "does",
+    "find", "for", "from", "give", "good", "how", "i", "in", "info", "is", "it", "me", "my", "of", "on", "or",
+    "professor", "prof", "professors", "should", "show", "take", "teach", "teacher", "teaches", "teaching",
+    "tell", "the", "to", "what", "which", "who", "with", "you",
+}
+
+
+def tokenize(text: str) -> list[str]:
+    """Lower-case word tokens of `text`."""
+    return TOKEN_RE.findall(text.lower())
+
+
+def normalize_name(name: str) -> str:
+    """Lower-case a person name and drop titles such as "Dr." or "Prof."."""
+    return " ".join(token for token in tokenize(name) if token not in TITLES)
+
+
+def _trigrams(text: str) -> set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+@dataclass
+class LexicalMatch:
+    """A confident exact or fuzzy hit on a professor name or course."""
+
+    kind: str
+    value: str
+    score: float
+    documents: list[Document]
+
+
+class LexicalIndex:
+    """
+    In-process inverted index over review records with BM25 scoring.
+
+    Besides free-text BM25 search it keeps exact lookup tables of professor
+    names and courses plus a trigram-filtered fuzzy name matcher, which lets
+    messages like "tell me about Dr. Jane Smith" be answered without an
+    embedding call or a question-rewrite round trip. Records are keyed by
+    `record_id`, so adding a record again replaces its row.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, name_threshold: float = 0.85, course_threshold: float = 0.9):
+        self.k1 = k1
+        self.b = b
+        self.name_threshold = name_threshold
+        self.course_threshold = course_threshold
+
+        self.documents: list[Document] = []
+        self._postings: dict[str, dict[int, int]] = defaultdict(dict)
+        self._lengths: list[int] = []
+        self._total_length = 0
+        self._names: dict[str, list[int]] = defaultdict(list)
+        self._last_names: dict[str, set[str]] = defaultdict(set)
+        self._name_courses: dict[str, set[str]] = defaultdict(set)
+        self._name_trigrams: dict[str, set[str]] = defaultdict(set)
+        self._courses: dict[str, list[int]] = defaultdict(list)
+        self._rows: dict[str, int] = {}
+        # Per row: name, course and tokens, to unindex the row when its record is replaced
+        self._indexed: list[tuple[str, str, list[str]]] = []
+
+    @classmethod
+    def from_records(cls, records: Iterable[dict], **kwargs) -> "LexicalIndex":
+        """Build an index from review records, rendered the same way as for the vector store."""
+        index = cls(**kwargs)
+        for record in records:
+            index.add(record)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def courses(self) -> list[str]:
+        """Return the normalized names of the indexed courses."""
+        return list(self._courses)
+
+    def add(self, record: dict):
+        """Index one review record, replacing the row of an earlier record with the same id."""
+        id_ = record_id(record)
+        row = self._rows.get(id_)
+        document = Document(page_content=record_text(record), metadata=record_metadata(record))
+        if row is None:
+            row = self._rows[id_] = len(self.documents)
+            self.documents.append(document)
+            self._lengths.append(0)
+            self._indexed.append(("", "", []))
+        else:
+            self._unindex(row)
+            self.documents[row] = document
+
+        name = normalize_name(record.get("professor_name") or " ".join(
+            filter(None, [record.get("firstName"), record.get("lastName")])
+        ))
+        course = " ".join(tokenize(record.get("course") or ""))
+        text = " ".join(filter(None, [name, course, record.get("department"), record.get("school"), record.get("comment")]))
+
+        counts = Counter(tokenize(text))
+        for token, count in counts.items():
+            self._postings[token][row] = count
+        length = sum(counts.values())
+        self._lengths[row] = length
+        self._total_length += length
+        self._indexed[row] = (name, course, list(counts))
+
+        if name:
+            if name not in self._names:
+                for trigram in _trigrams(name):
+                    self._name_trigrams[trigram].add(name)
+                self._last_names[name.split()[-1]].add(name)
+            self._names[name].append(row)
+            if course:
+                self._name_courses[name].add(course)
+        if course:
+            self._courses[course].append(row)
+
+    def _unindex(self, row: int):
+        name, course, tokens = self._indexed[row]
+        for token in tokens:
+            postings = self._postings[token]
+            del postings[row]
+            if not postings:
+                del self._postings[token]
+        self._total_length -= self._lengths[row]
+        if name:
+            self._names[name].remove(row)
+            if not self._names[name]:
+                del self._names[name]
+                self._name_courses.pop(name, None)
+                for trigram in _trigrams(name):
+                    self._name_trigrams[trigram].discard(name)
+                self._last_names[name.split()[-1]].discard(name)
+            else:
+                self._name_courses[name] = {self._indexed[other][1] for other in self._names[name] if self._indexed[other][1]}
+        if course:
+            self._courses[course].remove(row)
+            if not self._courses[course]:
+                del self._courses[course]
+
+    # Search
+
+    def _bm25(self, tokens: list[str], rows: Iterable[int] | None = None) -> dict[int, float]:
+        if not self.documents:
+            return {}
+        average = self._total_length / len(self.documents)
+        allowed = set(rows) if rows is not None else None
+        scores: dict[int, float] = defaultdict(float)
+        for token in set(tokens):
+            postings = self._postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(1 + (len(self.documents) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for row, tf in postings.items():
+                if allowed is not None and row not in allowed:
+                    continue
+                norm = tf + self.k1 * (1 - self.b + self.b * self._lengths[row] / average)
+                scores[row] += idf * tf * (self.k1 + 1) / norm
+        return scores
+
+    def search(self, query: str, k: int = 4) -> list[tuple[Document, float]]:
+        """
+        Return the `k` best BM25 matches for `query`.
+
+        Args:
+            query (str): The search text.
+            k (int): The number of results.
+
+        Returns:
+            list: (document, score) pairs, best first.
+        """
+        tokens = [token for token in tokenize(query) if token not in STOPWORDS]
+        scores = self._bm25(tokens)
+        top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.documents[row], score) for row, score in top]
+
+    def _ranked(self, rows: list[int], query: str, k: int) -> list[Document]:
+        scores = self._bm25(tokenize(query), rows)
+        rows = sorted(rows, key=lambda row: scores.get(row, 0.0), reverse=True)
+        return [self.documents[row] for row in rows[:k]]
+
+    def match_name(self, query: str) -> tuple[str, float] | None:
+        """Return the professor name best matching a span of `query`, with its similarity."""
+        tokens = [token for token in tokenize(query) if token not in TITLES]
+        best = None
+        for size in (3, 2):
+            for start in range(len(tokens) - size + 1):
+                span = " ".join(tokens[start:start + size])
+                candidates = Counter(name for trigram in _trigrams(span) for name in self._name_trigrams.get(trigram, ()))
+                for name, shared in candidates.most_common(5):
+                    if shared < 2:
+                        break
+                    ratio = SequenceMatcher(None, span, name).ratio()
+                    if ratio >= self.name_threshold and (best is None or ratio > best[1]):
+                        best = (name, ratio)
+        if best is None:
+            # A unique last name alone may just be a word ("Hall", "Young"): it is only a confident hit with
+            # a title ("Dr. Nguyen"), the first name elsewhere in the message or one of the professor's courses
+            words = tokenize(query)
+            normalized = " ".join(words)
+            for i, token in enumerate(words):
+                names = self._last_names.get(token)
+                if len(token) < 4 or not names or len(names) != 1:
+                    continue
+                name = next(iter(names))
+                if (
+                    (i and words[i - 1] in TITLES)
+                    or set(name.split()[:-1]) & set(words)
+                    or any(re.search(rf"\b{re.escape(course)}\b", normalized) for course in self._name_courses[name])
+                ):
+                    return name, 1.0
+        return best
+
+    def match_course(self, query: str) -> tuple[str, float] | None:
+        """Return the course whose name appears in `query`, exactly or fuzzily."""
+        normalized = " ".join(tokenize(query))
+        best = None
+        for course in self._courses:
+            if re.search(rf"\b{re.escape(course)}\b", normalized):
+                ratio = 1.0
+            else:
+                size = len(course.split())
+                tokens = normalized.split()
+                ratio = max(
+                    (SequenceMatcher(None, " ".join(tokens[i:i + size]), course).ratio() for i in range(len(tokens) - size + 1)),
+                    default=0.0,
+                )
+            if ratio >= self.course_threshold and (best is None or (ratio, len(course)) > (best[1], len(best[0]))):
+                best = (course, ratio)
+        return best
+
+    def match(self, query: str, k: int = 8) -> LexicalMatch | None:
+        """
+        Return a confident professor-name or course hit for `query`, or None.
+
+        Args:
+            query (str): The user message.
+            k (int): The maximum number of documents returned with the hit.
+        """
+        name = self.match_name(query)
+        if name is not None:
+            return LexicalMatch("name", name[0], name[1], self._ranked(self._names[name[0]], query, k))
+        course = self.match_course(query)
+        if course is not None:
+            return LexicalMatch("course", course[0], course[1], self._ranked(self._courses[course[0]], query, k))
+        return None
+
+
+def reciprocal_rank_fusion(*rankings: list[Document], k: int = 4, constant: int = 60) -> list[Document]:
+    """
+    Fuse several ranked document lists with reciprocal rank fusion.
+
+    Documents are identified by their content, so the same review coming
+    from the vector store and from the lexical index is counted once.
+    """
+    scores: dict[str, float] = defaultdict(float)
+    documents: dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, document in enumerate(ranking):
+            scores[document.page_content] += 1.0 / (constant + rank + 1)
+            documents.setdefault(document.page_content, document)
+    best = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [documents[key] for key in best]
@@ -1,28 +1,61 @@
 # Updated WebSocket App Code
 
 import asyncio
-import time
+import itertools
 import os
+import time
+from logging import getLogger
 from dotenv import load_dotenv
-from typing import Dict, List
+from typing import Dict
 from uuid import uuid4
 
-from fastapi import FastAPI, Request, Response, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.templating import Jinja2Templates
 from starlette.middleware.sessions import SessionMiddleware
 
-from agent import ProfessorRaterAgent
-from langchain_core.messages import HumanMessage, AIMessage
-from tools.ratemyprofessor import run_tools
+from history import HistoryManager, estimate_tokens
+from metrics import CONTENT_TYPE, finish_trace, llm_metrics, registry, render_stats, start_trace
+from sessions import build_session_store
+from streaming import FrameWriter, StreamStats
+from routing import AnswerRouter
+from tools.agent_pool import ToolAgentPool
+from tools.ratemyprofessor import (
+    arun_tools,
+    cache as rmp_cache,
+    client as rmp_client,
+    get_agent_executor,
+    professor_listeners,
+    tool_compactor,
+)
+from writeback import IndexWriteBack
 
 load_dotenv()
 
+logger = getLogger(__name__)
+
 # CONSTANTS
 SECRET_KEY = os.getenv("SECRET_KEY", "S@MPL3")
 SESSION_TIMEOUT = int(os.getenv("SESSION_TIMEOUT", 60))
 BUFFER_SIZE = int(os.getenv("BUFFER_SIZE", "1024"))
-STREAM = True # os.getenv("STREAM", "False").lower() == "true"
+STREAM_FLUSH_MS = float(os.getenv("STREAM_FLUSH_MS", "50"))
+TURN_SUPERSEDE = os.getenv("TURN_SUPERSEDE", "true").lower() == "true"
+HISTORY_MAX_TOKENS = int(os.getenv("HISTORY_MAX_TOKENS", "1500"))
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+SESSION_MAX_MESSAGES = int(os.getenv("SESSION_MAX_MESSAGES", "200"))
+SESSION_CLEANUP_INTERVAL = float(os.getenv("SESSION_CLEANUP_INTERVAL", "10"))
+WARMUP_RETRY_INTERVAL = float(os.getenv("WARMUP_RETRY_INTERVAL", "5"))
+READY_TIMEOUT = float(os.getenv("READY_TIMEOUT", "30"))
+TOOL_AGENT_CONCURRENCY = int(os.getenv("TOOL_AGENT_CONCURRENCY", "4"))
+TOOL_AGENT_QUEUE = int(os.getenv("TOOL_AGENT_QUEUE", "16"))
+TOOL_AGENT_DEADLINE = float(os.getenv("TOOL_AGENT_DEADLINE", "45"))
+WRITEBACK_ENABLED = os.getenv("WRITEBACK_ENABLED", "true").lower() == "true"
+WRITEBACK_BATCH_SIZE = int(os.getenv("WRITEBACK_BATCH_SIZE", "32"))
+WRITEBACK_DEBOUNCE = float(os.getenv("WRITEBACK_DEBOUNCE", "2"))
+WRITEBACK_MAX_PENDING = int(os.getenv("WRITEBACK_MAX_PENDING", "256"))
+WRITEBACK_MAX_WRITTEN = int(os.getenv("WRITEBACK_MAX_WRITTEN", "10000"))
+WRITEBACK_SNAPSHOT = os.getenv("WRITEBACK_SNAPSHOT", "false").lower() == "true"
 
 # App Setup
 app = FastAPI(
@@ -31,12 +64,135 @@ app = FastAPI(
 )
 app.add_middleware(SessionMiddleware, secret_key=SECRET_KEY)
 templates = Jinja2Templates(directory="templates")
-agent = ProfessorRaterAgent()
+session_store = build_session_store(SESSION_STORE, REDIS_URL, ttl=SESSION_TIMEOUT, max_messages=SESSION_MAX_MESSAGES)
+history = HistoryManager(max_tokens=HISTORY_MAX_TOKENS, store=session_store)
+
+# Bounded pool in front of the RateMyProfessors tool agent, so a burst of index misses cannot starve the server
+tool_pool = ToolAgentPool(arun_tools, concurrency=TOOL_AGENT_CONCURRENCY, max_queue=TOOL_AGENT_QUEUE, deadline=TOOL_AGENT_DEADLINE)
+
+# The agent (LangChain chains, Pinecone and OpenAI clients) is built by `warm_up` after startup,
+# so importing this module is fast and has no network side effects
+agent = None
+router = None
+writeback = None
+ready = asyncio.Event()
+# Keyword arguments for `build_agent`, e.g. the stand-in models of benchmarks/load_bench.py
+agent_overrides = {}
+warmup_status = {"state": "pending", "attempts": 0, "seconds": None, "error": None}
+
+# Time to first byte and frames per answer of the WebSocket streams
+stream_stats = StreamStats()
+
+# Turns answered, and turns cancelled because a new message superseded them or the client left
+turn_stats = {"completed": 0, "superseded": 0, "disconnected": 0, "wasted_tokens": 0, "wasted_seconds": 0.0, "max_cancel_ms": 0.0}
+
+# Chat history and expiry of each session live in `session_store` (shared between workers with SESSION_STORE=redis)
+user_sessions: Dict[str, WebSocket] = {}  # Active sessions of this worker
+
+def build_agent(llm=None, embeddings=None):
+    """
+    Build the RAG agent and the tool-calling agent.
+
+    Args:
+        llm (BaseChatModel, optional): Chat model shared by both agents; defaults to gpt-4o-mini.
+        embeddings (Embeddings, optional): Embeddings model; defaults to OpenAI text-embedding-3-small.
+
+    Returns:
+        ProfessorRaterAgent: The ready agent.
+    """
+    from agent import ProfessorRaterAgent  # Heavy imports stay off the module import path
+    from tools.rankings import make_ranking_tool
+
+    bot = ProfessorRaterAgent(llm=llm, embeddings=embeddings)
+    # Ranking questions the fast path did not recognize can still be answered from the aggregates
+    extra_tools = [make_ranking_tool(bot.aggregates, bot.compactor)] if bot.aggregates is not None else None
+    get_agent_executor(llm=llm, extra_tools=extra_tools)
+    return bot
 
-# In Memory Storage (Will later be replaced with Redis)
-user_sessions: Dict[str, WebSocket] = {}  # Active sessions
-chat_history: Dict[str, List[str]] = {}  # Chat history for each session
-session_timestamps: Dict[str, float] = {}  # Last active time for each session
+async def warm_up():
+    """
+    Background task building the agent, retrying until it succeeds (e.g. once the network is up).
+    """
+    global agent, router, writeback
+    started = time.perf_counter()
+    while agent is None:
+        warmup_status["state"] = "warming"
+        warmup_status["attempts"] += 1
+        try:
+            agent = await asyncio.to_thread(build_agent, **agent_overrides)
+        except Exception as e:
+            warmup_status["state"] = "failed"
+            warmup_status["error"] = str(e)
+            logger.warning(f"Warm-up failed, retrying in {WARMUP_RETRY_INTERVAL}s: {e}")
+            await asyncio.sleep(WARMUP_RETRY_INTERVAL)
+    router = AnswerRouter(agent, tool_pool.run)
+    history.summarizer = agent.llm.with_config(tags=["summary"], callbacks=[llm_metrics])
+    if WRITEBACK_ENABLED:
+        # Professors fetched by the tools are written back, so the index warms up to real traffic
+        writeback = IndexWriteBack(
+            agent.rag.vector_store,
+            agent.lexical,
+            batch_size=WRITEBACK_BATCH_SIZE,
+            debounce=WRITEBACK_DEBOUNCE,
+            max_pending=WRITEBACK_MAX_PENDING,
+            max_written=WRITEBACK_MAX_WRITTEN,
+            snapshot_path=agent.local_index_path if WRITEBACK_SNAPSHOT and agent.vector_backend == "local" else None,
+        )
+        writeback.start()
+        professor_listeners.append(writeback.submit)
+    warmup_status.update(state="ready", seconds=round(time.perf_counter() - started, 3), error=None)
+    ready.set()
+    logger.info(f"Agent ready after {warmup_status['seconds']}s")
+
+@app.get("/healthz")
+async def healthz():
+    """
+    Liveness probe: the process is up and serving requests.
+    """
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """
+    Readiness probe: 200 once the agent is warmed up, 503 with the warm-up state before that.
+    """
+    return JSONResponse(warmup_status, status_code=200 if ready.is_set() else 503)
+
+@app.get("/stats")
+async def stats():
+    """
+    Runtime counters: tool agent pool, routing, caches, ranking aggregates, index write-back and the RateMyProfessors client.
+    """
+    result = {
+        "tool_agent_pool": tool_pool.stats(),
+        "rmp_cache": rmp_cache.stats(),
+        "rmp_client": dict(rmp_client.stats),
+        "tool_result_compaction": tool_compactor.stats(),
+        "streaming": stream_stats.stats(),
+        "turns": dict(turn_stats, wasted_seconds=round(turn_stats["wasted_seconds"], 3)),
+    }
+    if ready.is_set():
+        result.update(
+            routing=router.stats(),
+            retrieval_routes=dict(agent.route_counts),
+            rewrite=agent.rewriter.stats(),
+            answer_cache=agent.answer_cache.stats(),
+            embeddings=agent.embeddings.stats(),
+            embedding_batches=agent.embedding_batcher.stats(),
+            context_compaction=agent.compactor.stats(),
+        )
+        if agent.aggregates is not None:
+            result["aggregates"] = agent.aggregates.stats()
+    if writeback is not None:
+        result["writeback"] = writeback.stats()
+    return result
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Prometheus metrics: per-stage latency histograms, model tokens, cache outcomes and turns, plus the /stats counters as gauges.
+    """
+    return PlainTextResponse(registry.render() + render_stats(await stats()), media_type=CONTENT_TYPE)
 
 @app.get("/")
 async def get(request: Request):
@@ -47,21 +203,14 @@ async def get(request: Request):
      
     session_id = request.cookies.get("session_id")
     
-    if session_id and session_id in session_timestamps:
-        if time.time() - session_timestamps[session_id] > SESSION_TIMEOUT:
-            # Clear expired session
-            del chat_history[session_id]
-            del session_timestamps[session_id]
-            session_id = None
-    elif session_id and session_id not in session_timestamps:
+    # Expired or unknown sessions start over; live ones keep their history across page loads
+    if session_id and not await session_store.exists(session_id):
         session_id = None
 
     if not session_id:
         session_id = str(uuid4())
     
-    # Update session timestamps and chat history
-    session_timestamps[session_id] = time.time()
-    chat_history[session_id] = []
+    await session_store.touch(session_id)
 
     response = templates.TemplateResponse("chat.html", {"request": request, "ws_url": ws_url})
     response.set_cookie("session_id", session_id)
@@ -79,85 +228,115 @@ async def chat_endpoint(websocket: WebSocket):
         await websocket.close()
         return
     
-    if not session_id in chat_history: # Create new session if not found
-        chat_history[session_id] = []
-        session_timestamps[session_id] = time.time()
-        
+    await session_store.touch(session_id) # Create new session if not found
+
+    # Answers are sent as JSON frames of numbered streams (see streaming.FrameWriter)
+    stream_ids = itertools.count(1)
+    writer = None
+    turn = None
+
+    def new_stream(started: float) -> FrameWriter:
+        return FrameWriter(
+            websocket.send_text,
+            next(stream_ids),
+            max_bytes=BUFFER_SIZE,
+            max_delay=STREAM_FLUSH_MS / 1000,
+            started=started,
+            stats=stream_stats,
+        )
+
+    async def run_turn(human_message: str, started: float, previous: asyncio.Task | None = None):
+        """Answer one message; runs as a task so that it can be cancelled mid-answer."""
+        nonlocal writer
+        if previous is not None:
+            # Without TURN_SUPERSEDE, turns run one after another
+            await asyncio.gather(previous, return_exceptions=True)
+        # Stage timings, model calls and cache outcomes of this turn are collected under one trace id
+        trace = start_trace(session=session_id)
+        status = "error"
+        ai_message = []
+        try:
+            if not ready.is_set():
+                try:
+                    await asyncio.wait_for(ready.wait(), READY_TIMEOUT)
+                except asyncio.TimeoutError:
+                    await new_stream(started).close("I am still starting up. Please try again in a moment.")
+                    status = "not_ready"
+                    return
+            messages = await history.messages(session_id)
+            # Flushed once BUFFER_SIZE characters are waiting or STREAM_FLUSH_MS after the first of them
+            writer = new_stream(started)
+            async for kind, text in router.astream(human_message, messages, session_id):
+                if kind == "token":
+                    ai_message.append(text)
+                    await writer.write(text)
+                elif kind == "notice":
+                    # The local answer is abandoned: end its stream with the notice, the tool answer gets a new one
+                    await writer.close(text)
+                    writer = new_stream(started)
+                else:  # Tool answer
+                    await writer.write(text)
+                    ai_message = [text]
+            await writer.close()
+            ai_message = "".join(ai_message)
+
+            await history.append(session_id, human_message, ai_message)
+            turn_stats["completed"] += 1
+            status = "completed"
+        except asyncio.CancelledError:
+            # Work thrown away: what was generated so far and the time spent on it
+            turn_stats["wasted_tokens"] += estimate_tokens("".join(ai_message)) if ai_message else 0
+            turn_stats["wasted_seconds"] += time.perf_counter() - started
+            status = "cancelled"
+            raise
+        finally:
+            finish_trace(trace, status)
+
+    async def cancel_turn(reason: str):
+        """Cancel the running turn, waiting until the LLM stream, embeddings and tool requests have stopped."""
+        if turn is None or turn.done():
+            return
+        cancelled = time.perf_counter()
+        turn.cancel()
+        turn_stats[reason] += 1
+        await asyncio.gather(turn, return_exceptions=True)
+        turn_stats["max_cancel_ms"] = max(turn_stats["max_cancel_ms"], round(1000 * (time.perf_counter() - cancelled), 1))
+
+    def log_turn_error(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Turn failed for session {session_id}: {task.exception()!r}")
+
     try:
+        # Receive concurrently with the running turn, so a disconnect or a new message is seen right away
         while True:
             human_message = await websocket.receive_text()
-            ai_message = []
-            if STREAM:
-                await websocket.send_text("<STREAM>")
-                buffer = ""
-                for chunk in agent.invoke(human_message, chat_history[session_id]):                   
-                    buffer += chunk  # Add chunk to buffer
-                    if "NO PROFESSOR" in buffer:
-                        buffer = "I could not find anything relavant in my database.\
-                            I will try to make tool call to help you. Please wait for a moment."
-                        await websocket.send_text(buffer)
-                        await websocket.send_text("<END>")  # Send end of stream
-                        
-                        ai_response = run_tools(human_message, chat_history=chat_history[session_id]) # Call the tool
-                        await websocket.send_text("<STREAM>")  # Start new stream
-                        await websocket.send_text(ai_response)
-                        await websocket.send_text("<END>")  # Send end of stream
-                        ai_message.append(ai_response)
-                        buffer = ""
-                        break
-                    
-                    elif len(buffer) >= BUFFER_SIZE:  # Check if buffer size is exceeded                  
-                        await websocket.send_text(buffer)  # Send buffered data
-                        buffer = ""  # Clear the buffer
-                    
-                        ai_message.append(chunk)
-                    # await asyncio.sleep(0.01)
-                
-                # Send any remaining data in the buffer
-                if buffer:
-                    await websocket.send_text(buffer)
-                
-                await websocket.send_text("<END>")
-                ai_message = "".join(ai_message)
-            else: # No Streaming
-                ai_message = agent.invoke(human_message, chat_history[session_id])
-                if "NO PROFESSOR" in ai_message:
-                    buffer = "I could not find anything relavant in my databse.\
-                            I will try to make tool call to help you. Please wait for a moment."
-                    await websocket.send_text(buffer)
-                    ai_response = run_tools(human_message, chat_history=chat_history) # Call the toolnd(ai_response)
-                await websocket.send_text(ai_message)
-
-            chat_history[session_id].append(HumanMessage(human_message))
-            chat_history[session_id].append(AIMessage(ai_message))
-            session_timestamps[session_id] = time.time()
+            started = time.perf_counter()
+            if TURN_SUPERSEDE and turn is not None and not turn.done():
+                await cancel_turn("superseded")
+                if writer is not None and not writer.ended:
+                    await writer.close(cancelled=True)
+            turn = asyncio.create_task(run_turn(human_message, started, None if TURN_SUPERSEDE else turn))
+            turn.add_done_callback(log_turn_error)
 
     except WebSocketDisconnect:
         # Log disconnection and remove session
         if session_id in user_sessions:
             del user_sessions[session_id]
-        print(f"WebSocket disconnected for session {session_id}.")
-    # except Exception as e:
-        
-    #     print(f"Error occurred for session {session_id}: {str(e)}")
-        # await websocket.close()
+        logger.info(f"WebSocket disconnected for session {session_id}.")
+    finally:
+        # However the connection ended, stop generating an answer nobody will read
+        await cancel_turn("disconnected")
+        if writer is not None:
+            writer.abort()
 
 async def session_cleanup_task():
     """
     Background task to clean up expired sessions.
     """
     while True:
-        current_time = time.time()
-        expired_sessions = [
-            session_id for session_id, timestamp in session_timestamps.items()
-            if current_time - timestamp > SESSION_TIMEOUT
-        ]
-        
-        for session_id in expired_sessions:
-            del chat_history[session_id]
-            del session_timestamps[session_id]
-
-        await asyncio.sleep(60)  # Run cleanup every 60 seconds
+        # Only touches the sessions that actually expired
+        await session_store.expire()
+        await asyncio.sleep(SESSION_CLEANUP_INTERVAL)
 
 @app.on_event("startup")
 async def startup_event():
@@ -165,6 +344,19 @@ async def startup_event():
     Event handler to start background tasks.
     """
     asyncio.create_task(session_cleanup_task())
+    asyncio.create_task(warm_up())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """
+    Event handler to let pending history summaries and index write-backs finish, then close the clients.
+    """
+    await history.drain()
+    if writeback is not None:
+        professor_listeners.remove(writeback.submit)
+        await writeback.stop()
+    await session_store.close()
+    await rmp_client.aclose()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,354 @@
+import json
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from logging import getLogger
+from uuid import uuid4
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from history import estimate_tokens
+
+logger = getLogger(__name__)
+
+# Log one JSON line per turn with its trace id, stage durations, tokens and cache hits
+TRACE_LOG = os.getenv("TRACE_LOG", "false").lower() == "true"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Tags marking the LangChain runs whose model calls are measured (see `llm_metrics`)
+LLM_STAGES = ("rewrite", "answer", "tool_agent", "summary")
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    """A monotonically increasing count per combination of label values."""
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: tuple = (), amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        lines += [f"{self.name}{_format_labels(self.labels, labels)} {_format_number(value)}" for labels, value in values]
+        return lines
+
+
+class Histogram:
+    """Observations counted into cumulative buckets, with their sum and count, per combination of label values."""
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        self._values: dict[tuple, list] = {}  # labels -> [bucket counts (+Inf last), sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, labels: tuple = ()):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            values = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._values.items())
+        for labels, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_number(bound)
+                bucket_label = f'le="{le}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, labels, bucket_label)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, labels)} {_format_number(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """The metrics exposed on /metrics, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name: str, help: str, labels: tuple = ()) -> Counter:
+        metric = Counter(name, help, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+
+def render_stats(stats: dict, prefix: str = "rmp") -> str:
+    """
+    Render the numeric values of a /stats snapshot as Prometheus gauges.
+
+    Nested keys are joined with underscores, e.g. `{"rmp_cache": {"hits": 3}}`
+    becomes `rmp_rmp_cache_hits 3`; values that are not numbers are skipped.
+
+    Args:
+        stats (dict): The /stats payload.
+        prefix (str): Prefix of the gauge names.
+
+    Returns:
+        str: The gauges in the Prometheus text format.
+    """
+    lines = []
+
+    def walk(name: str, value):
+        if isinstance(value, dict):
+            for key, item in value.items():
+                walk(f"{name}_{key}", item)
+        elif isinstance(value, (int, float)) and value == value:
+            name = re.sub(r"_+", "_", re.sub(r"[^a-zA-Z0-9_]", "_", name)).rstrip("_")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {_format_number(value)}")
+
+    walk(prefix, stats)
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram(
+    "rmp_stage_seconds",
+    "Duration of the stages of a turn (retrieve includes rewrite and vector_search, which includes embed).",
+    ("stage",),
+)
+LLM_SECONDS = registry.histogram("rmp_llm_seconds", "Duration of chat model calls.", ("stage",))
+LLM_FIRST_TOKEN_SECONDS = registry.histogram("rmp_llm_first_token_seconds", "Time to the first streamed token of chat model calls.", ("stage",))
+LLM_TOKENS = registry.counter("rmp_llm_tokens_total", "Chat model tokens (reported usage, estimated when not reported).", ("stage", "kind"))
+CACHE_REQUESTS = registry.counter("rmp_cache_requests_total", "Cache lookups by outcome.", ("cache", "result"))
+TURNS = registry.counter("rmp_turns_total", "Turns by routing decision and outcome.", ("decision", "status"))
+
+
+class Trace:
+    """Per-turn record of stage durations, model calls and cache outcomes, identified by a trace id."""
+
+    __slots__ = ("trace_id", "started", "attributes", "stages", "llm", "cache")
+
+    def __init__(self, **attributes):
+        self.trace_id = uuid4().hex[:16]
+        self.started = time.perf_counter()
+        self.attributes = attributes
+        self.stages: dict[str, float] = {}
+        self.llm: dict[str, dict] = {}
+        self.cache: dict[str, dict] = {}
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            **self.attributes,
+            "seconds": round(time.perf_counter() - self.started, 4),
+            "stages": {stage: round(seconds, 4) for stage, seconds in self.stages.items()},
+            "llm": self.llm,
+            "cache": self.cache,
+        }
+
+
+# The trace of the turn being answered; asyncio tasks and `asyncio.to_thread` calls started by the turn inherit it
+current_trace: ContextVar[Trace | None] = ContextVar("current_trace", default=None)
+
+
+def start_trace(**attributes) -> Trace:
+    """Start the trace of a turn in the current context."""
+    trace = Trace(**attributes)
+    current_trace.set(trace)
+    return trace
+
+
+def annotate(**attributes):
+    """Add attributes (e.g. the routing decision) to the current trace, if any."""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.attributes.update(attributes)
+
+
+def finish_trace(trace: Trace, status: str):
+    """
+    Record the end of a turn and, with TRACE_LOG, log its trace as one JSON line.
+
+    Args:
+        trace (Trace): The trace returned by `start_trace`.
+        status (str): "completed", "cancelled" or "error".
+    """
+    seconds = time.perf_counter() - trace.started
+    STAGE_SECONDS.observe(seconds, ("turn",))
+    TURNS.inc((trace.attributes.get("decision", "none"), status))
+    if TRACE_LOG:
+        logger.info(json.dumps(dict(trace.to_dict(), status=status), ensure_ascii=False))
+
+
+def record_stage(stage: str, seconds: float):
+    """Record the duration of a stage in its histogram and in the current trace."""
+    STAGE_SECONDS.observe(seconds, (stage,))
+    trace = current_trace.get()
+    if trace is not None:
+        trace.stages[stage] = trace.stages.get(stage, 0.0) + seconds
+
+
+def record_cache(cache: str, result: str, count: int = 1):
+    """
+    Count cache lookups.
+
+    Args:
+        cache (str): The cache, e.g. "embeddings".
+        result (str): "hit", "miss" or "stale".
+        count (int): Number of lookups with this outcome.
+    """
+    if not count:
+        return
+    CACHE_REQUESTS.inc((cache, result), count)
+    trace = current_trace.get()
+    if trace is not None:
+        outcomes = trace.cache.setdefault(cache, {})
+        outcomes[result] = outcomes.get(result, 0) + count
+
+
+class timed:
+    """
+    Context manager recording the duration of a stage, e.g. `with timed("graphql"): ...`.
+
+    Costs two clock reads and a histogram update, so it can wrap hot paths.
+    """
+
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record_stage(self.stage, time.perf_counter() - self.started)
+        return False
+
+
+class _LLMRun:
+    __slots__ = ("stage", "started", "first_token", "prompt_tokens", "trace")
+
+    def __init__(self, stage: str, prompt_tokens: int):
+        self.stage = stage
+        self.started = time.perf_counter()
+        self.first_token = None
+        self.prompt_tokens = prompt_tokens
+        self.trace = current_trace.get()
+
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """
+    LangChain callback handler measuring chat model calls.
+
+    Records each call's duration, time to first streamed token and token
+    counts under the stage named by the run's tags (one of LLM_STAGES, else
+    "other"), in the histograms and in the trace of the turn. Attach it with
+    `.with_config(tags=[stage], callbacks=[llm_metrics])`. It runs inline in
+    the caller's thread or event loop and only keeps a small record per
+    running call.
+    """
+
+    run_inline = True
+
+    def __init__(self):
+        self._runs: dict = {}
+
+    @staticmethod
+    def _stage(tags) -> str:
+        for tag in tags or ():
+            if tag in LLM_STAGES:
+                return tag
+        return "other"
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, tags=None, **kwargs):
+        prompt = sum(estimate_tokens(str(message.content)) for batch in messages for message in batch)
+        self._runs[run_id] = _LLMRun(self._stage(tags), prompt)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, tags=None, **kwargs):
+        self._runs[run_id] = _LLMRun(self._stage(tags), sum(estimate_tokens(prompt) for prompt in prompts))
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        run = self._runs.get(run_id)
+        if run is not None and run.first_token is None:
+            run.first_token = time.perf_counter() - run.started
+            LLM_FIRST_TOKEN_SECONDS.observe(run.first_token, (run.stage,))
+
+    @staticmethod
+    def _usage(response) -> tuple[int | None, int | None]:
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        if usage:
+            return usage.get("prompt_tokens"), usage.get("completion_tokens")
+        for generations in response.generations:
+            for generation in generations:
+                metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if metadata:
+                    return metadata.get("input_tokens"), metadata.get("output_tokens")
+        return None, None
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        seconds = time.perf_counter() - run.started
+        prompt_tokens, completion_tokens = self._usage(response)
+        if prompt_tokens is None:
+            prompt_tokens = run.prompt_tokens
+        if completion_tokens is None:
+            completion_tokens = sum(estimate_tokens(generation.text) for generations in response.generations for generation in generations)
+        LLM_SECONDS.observe(seconds, (run.stage,))
+        LLM_TOKENS.inc((run.stage, "prompt"), prompt_tokens)
+        LLM_TOKENS.inc((run.stage, "completion"), completion_tokens)
+        if run.trace is not None:
+            calls = run.trace.llm.setdefault(run.stage, {"calls": 0, "seconds": 0.0, "prompt_tokens": 0, "completion_tokens": 0})
+            calls["calls"] += 1
+            calls["seconds"] = round(calls["seconds"] + seconds, 4)
+            calls["prompt_tokens"] += prompt_tokens
+            calls["completion_tokens"] += completion_tokens
+            if run.first_token is not None and "first_token" not in calls:
+                calls["first_token"] = round(run.first_token, 4)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._runs.pop(run_id, None)
+
+
+# Shared handler for every chat model call of the server
+llm_metrics = LLMMetricsHandler()
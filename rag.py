@@ -1,30 +1,68 @@
+import os
 from langchain_pinecone import PineconeVectorStore
 from logging import getLogger
+from metrics import timed
+from vectorstore import NumpyVectorStore
 
 logger = getLogger(__name__)
 
 class RAG:
-    def __init__(self, pinecone_client, pinecone_index_name, embedding):
+    def __init__(self, pinecone_client, pinecone_index_name, embedding, backend="pinecone", local_index_path=None, vector_store=None):
+        """
+        Args:
+            pinecone_client: The Pinecone client, only used by the "pinecone" backend.
+            pinecone_index_name (str): The name of the Pinecone index.
+            embedding: The embeddings model.
+            backend (str): "pinecone" or "local" (in-process NumPy index).
+            local_index_path (str, optional): Snapshot directory of the local index.
+            vector_store (VectorStore, optional): A ready vector store, bypassing backend setup.
+        """
         self.pinecone_client = pinecone_client
         self.pinecone_index_name = pinecone_index_name
-        self.vector_store = None
+        self.backend = backend
+        self.local_index_path = local_index_path
+        self.vector_store = vector_store
         self.embedding = embedding
-        self._initialize()
+        if self.vector_store is None:
+            self._initialize()
 
     def _initialize(self):
+        if self.backend == "local":
+            if not self.local_index_path or not os.path.isdir(self.local_index_path):
+                raise ValueError(f"Local index not found at {self.local_index_path}. Please create the index first.")
+            self.vector_store = NumpyVectorStore.load(self.local_index_path, self.embedding, mmap=True)
+            logger.info(f"Vector Store initialized with local index {self.local_index_path} ({len(self.vector_store)} vectors)")
+            return
+
+        if self.backend != "pinecone":
+            raise ValueError(f"Unknown vector store backend {self.backend!r}")
+
         if self.pinecone_index_name not in self.pinecone_client.list_indexes().names():
             raise ValueError(f"Index {self.pinecone_index_name} not found in Pinecone. Please create the index first.")
 
         index = self.pinecone_client.Index(self.pinecone_index_name)
         self.vector_store = PineconeVectorStore(index, self.embedding)
         logger.info(f"Vector Store initialized with index {self.pinecone_index_name}")
-        
-    def lookup(self, query: str, top_k=3):
-        self._initialize()
+
+    def lookup(self, query: str, top_k=3, filter=None):
         results = self.vector_store.similarity_search(
-            query, top_k=top_k
+            query, k=top_k, filter=filter
         )
         return results
-    
-    def get_retriever(self):
-        return self.vector_store.as_retriever()
\ No newline at end of file
+
+    def lookup_with_scores(self, query: str, top_k=3, filter=None):
+        """Return (document, relevance score in [0, 1]) pairs for `query`, best first."""
+        with timed("vector_search"):
+            return self.vector_store.similarity_search_with_relevance_scores(
+                query, k=top_k, filter=filter
+            )
+
+    async def alookup_with_scores(self, query: str, top_k=3, filter=None):
+        """Asynchronously return (document, relevance score in [0, 1]) pairs for `query`, best first."""
+        with timed("vector_search"):
+            return await self.vector_store.asimilarity_search_with_relevance_scores(
+                query, k=top_k, filter=filter
+            )
+
+    def get_retriever(self, **search_kwargs):
+        return self.vector_store.as_retriever(search_kwargs=search_kwargs)
@@ -0,0 +1,130 @@
+import re
+import threading
+from collections import OrderedDict
+from hashlib import sha256
+
+from lexical import LexicalIndex, tokenize
+from metrics import record_cache
+
+# Words and openings that make a message depend on the conversation so far
+ANAPHORA = {
+    "he", "him", "his", "she", "her", "hers", "they", "them", "their", "theirs", "it", "its",
+    "this", "that", "these", "those", "one", "ones", "same", "also", "too", "else", "another",
+    "other", "others", "more", "again", "instead", "former", "latter", "above", "previous",
+}
+FOLLOW_UP_RE = re.compile(r"^\s*(and|or|but|so|what about|how about|why|then)\b", re.I)
+TITLED_NAME_RE = re.compile(r"\b(?:Dr|Prof|Professor|Mr|Mrs|Ms)\.?\s+[A-Z][a-z]+")
+COURSE_CODE_RE = re.compile(r"\b[A-Z]{2,5}\s?-?\d{2,4}[A-Z]?\b")
+
+
+def history_digest(chat_history: list, window: int = 6) -> str:
+    """Return a digest of the last `window` messages of a chat history."""
+    parts = []
+    for message in chat_history[-window:]:
+        if isinstance(message, tuple):
+            role, content = message
+        else:
+            role, content = message.type, message.content
+        parts.append(f"{role}\0{content}")
+    return sha256("\x1e".join(parts).encode("utf-8")).hexdigest()
+
+
+class QuestionRewriter:
+    """
+    Decide whether a message needs the history-aware rewrite, and memoize it.
+
+    The LLM rewrite is skipped when there is no history, or when the message
+    is clearly self-contained: it has no pronouns or other anaphora, does
+    not open like a follow-up, and names a professor, a course code or a
+    subject known to the lexical index. Rewrites that do run are memoized
+    by (recent history digest, message).
+    """
+
+    def __init__(self, contextualize_chain, lexical: LexicalIndex | None = None, max_entries: int = 1024, history_window: int = 6):
+        """
+        Args:
+            contextualize_chain: Runnable turning {"input", "chat_history"} into a standalone question.
+            lexical (LexicalIndex, optional): Index used to recognise professor names and course subjects.
+            max_entries (int): Maximum number of memoized rewrites.
+            history_window (int): Number of recent messages included in the memo key.
+        """
+        self.contextualize_chain = contextualize_chain
+        self.lexical = lexical
+        self.max_entries = max_entries
+        self.history_window = history_window
+
+        self._memo: OrderedDict[tuple[str, str], str] = OrderedDict()
+        self._lock = threading.Lock()
+        self._subjects = set()
+        if lexical is not None:
+            self._subjects = {token for course in lexical.courses() for token in course.split() if len(token) > 3}
+
+        self.counts = {"no_history": 0, "self_contained": 0, "memo": 0, "llm": 0}
+
+    def is_self_contained(self, input: str) -> bool:
+        """Heuristically decide whether `input` can be understood without the chat history."""
+        tokens = tokenize(input)
+        if not tokens or FOLLOW_UP_RE.match(input) or ANAPHORA.intersection(tokens):
+            return False
+        if TITLED_NAME_RE.search(input) or COURSE_CODE_RE.search(input):
+            return True
+        if self._subjects.intersection(tokens):
+            return True
+        return self.lexical is not None and (
+            self.lexical.match_name(input) is not None or self.lexical.match_course(input) is not None
+        )
+
+    def _shortcut(self, inputs: dict):
+        """Return (standalone question, memo key) when no LLM call is needed, else (None, key)."""
+        input = inputs["input"]
+        chat_history = inputs.get("chat_history") or []
+        if not chat_history:
+            self.counts["no_history"] += 1
+            return input, None
+        if self.is_self_contained(input):
+            self.counts["self_contained"] += 1
+            return input, None
+        key = (history_digest(chat_history, self.history_window), input)
+        with self._lock:
+            if key in self._memo:
+                self._memo.move_to_end(key)
+                self.counts["memo"] += 1
+                record_cache("rewrite", "hit")
+                return self._memo[key], key
+        self.counts["llm"] += 1
+        record_cache("rewrite", "miss")
+        return None, key
+
+    def _remember(self, key, question: str):
+        with self._lock:
+            self._memo[key] = question
+            while len(self._memo) > self.max_entries:
+                self._memo.popitem(last=False)
+
+    def rewrite(self, inputs: dict) -> str:
+        """
+        Return a standalone version of `inputs["input"]`.
+
+        Args:
+            inputs (dict): The chain inputs with "input" and "chat_history".
+
+        Returns:
+            str: The standalone question.
+        """
+        question, key = self._shortcut(inputs)
+        if question is None:
+            question = self.contextualize_chain.invoke(inputs)
+            self._remember(key, question)
+        return question
+
+    async def arewrite(self, inputs: dict) -> str:
+        """Asynchronously return a standalone version of `inputs["input"]`. See `rewrite`."""
+        question, key = self._shortcut(inputs)
+        if question is None:
+            question = await self.contextualize_chain.ainvoke(inputs)
+            self._remember(key, question)
+        return question
+
+    def stats(self) -> dict:
+        """Return how often each rewrite path was taken."""
+        return dict(self.counts, memo_entries=len(self._memo))
@@ -0,0 +1,119 @@
+import asyncio
+from logging import getLogger
+from typing import AsyncIterator, Awaitable, Callable
+
+from metrics import annotate
+from streaming import SentinelFilter
+
+logger = getLogger(__name__)
+
+SENTINEL = "NO PROFESSOR"
+FALLBACK_NOTICE = (
+    "I could not find anything relavant in my database. "
+    "I will try to make tool call to help you. Please wait for a moment."
+)
+
+
+class AnswerRouter:
+    """
+    Route each turn between RAG generation and the RateMyProfessors tool agent.
+
+    The decision is taken from retrieval scores before anything is
+    generated (see `ProfessorRaterAgent._decide`):
+
+    - "rag": stream the RAG answer; only if it still ends in the
+      "NO PROFESSOR" sentinel, fall back to the tools afterwards.
+    - "tools": skip RAG generation and run the tool agent directly.
+    - "speculate": start the tool agent in the background while the RAG
+      answer streams. If RAG answers, the tool task is cancelled; if it
+      emits the sentinel, RAG generation is abandoned and the tool answer,
+      already under way, is used.
+
+    A miss therefore costs about one pipeline of latency instead of a full
+    RAG answer followed by a full tool run.
+    """
+
+    def __init__(self, agent, run_tools: Callable[..., Awaitable[str]]):
+        """
+        Args:
+            agent (ProfessorRaterAgent): Provides `aretrieve` and `astream_answer`.
+            run_tools (callable): Coroutine function answering (input, chat_history=..., session_id=...)
+                with the tool agent, e.g. `ToolAgentPool.run`.
+        """
+        self.agent = agent
+        self.run_tools = run_tools
+        self.counts = {
+            "turns": 0,
+            "rag": 0,
+            "speculate": 0,
+            "tools": 0,
+            "late_fallbacks": 0,
+            "speculation_used": 0,
+            "speculation_cancelled": 0,
+        }
+
+    async def astream(self, input: str, chat_history: list, session_id: str | None = None) -> AsyncIterator[tuple[str, str]]:
+        """
+        Answer a message, yielding (kind, text) events.
+
+        Kinds are "token" (a chunk of the RAG answer), "notice" (the RAG
+        answer is abandoned and a tool answer follows) and "tool" (the
+        complete tool-agent answer).
+
+        Args:
+            input (str): The user message.
+            chat_history (list): The chat history messages.
+            session_id (str, optional): The session, passed on to `run_tools`.
+        """
+        retrieved = await self.agent.aretrieve(input, chat_history)
+        decision = retrieved["decision"]
+        self.counts["turns"] += 1
+        self.counts[decision] += 1
+        annotate(decision=decision, route=retrieved["route"], score=round(retrieved["score"], 4))
+        logger.debug(f"Routing {decision!r} (score {retrieved['score']:.3f}, route {retrieved['route']})")
+
+        if decision == "tools":
+            yield "notice", FALLBACK_NOTICE
+            yield "tool", await self.run_tools(input, chat_history=chat_history, session_id=session_id)
+            return
+
+        tool_task = None
+        if decision == "speculate":
+            tool_task = asyncio.create_task(self.run_tools(input, chat_history=chat_history, session_id=session_id))
+        stream = self.agent.astream_answer(retrieved)
+        try:
+            # Text that may be the start of the sentinel is held back, so it never reaches the user
+            sentinel = SentinelFilter(SENTINEL)
+            async for chunk in stream:
+                if text := sentinel.feed(chunk):
+                    yield "token", text
+                if sentinel.found:
+                    break
+
+            if not sentinel.found:
+                if text := sentinel.flush():
+                    yield "token", text
+                if tool_task is not None:
+                    self.counts["speculation_cancelled"] += 1
+                return
+
+            # Stop generating the abandoned RAG answer
+            await stream.aclose()
+            yield "notice", FALLBACK_NOTICE
+            if tool_task is None:
+                self.counts["late_fallbacks"] += 1
+                yield "tool", await self.run_tools(input, chat_history=chat_history, session_id=session_id)
+            else:
+                self.counts["speculation_used"] += 1
+                yield "tool", await tool_task
+        finally:
+            await stream.aclose()
+            if tool_task is not None and not tool_task.done():
+                tool_task.cancel()
+
+    def stats(self) -> dict:
+        """Return how often each route was taken, how speculation played out and the tool fallback rate."""
+        counts = self.counts
+        # Turns answered by the tool agent rather than the index; falls as the index warms up
+        fallbacks = counts["tools"] + counts["speculation_used"] + counts["late_fallbacks"]
+        return dict(counts, fallback_rate=round(fallbacks / counts["turns"], 4) if counts["turns"] else 0.0)
@@ -0,0 +1,200 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from logging import getLogger
+from typing import Callable
+
+import numpy as np
+
+from metrics import record_cache
+
+logger = getLogger(__name__)
+
+
+def index_version(path: str) -> float:
+    """Return the version stamp of the vector index, written by ingestion (0 if never written)."""
+    try:
+        return os.stat(path).st_mtime
+    except FileNotFoundError:
+        return 0.0
+
+
+def touch_index_version(path: str):
+    """Mark the vector index as changed, invalidating cached answers in every worker."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(str(time.time()))
+
+
+def _normalize(question: str) -> str:
+    return re.sub(r"\s+", " ", question).strip().lower()
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    scope: str
+    documents: tuple
+    answer: str
+    seconds: float
+    slot: int | None
+
+
+class SemanticAnswerCache:
+    """
+    Cache of generated answers keyed by question similarity and retrieved documents.
+
+    A cached answer is reused when the new standalone question embeds within
+    `threshold` cosine similarity of a cached one (or matches it exactly
+    after normalization), the retrieved document set is identical and the
+    answer was generated in the same `scope`, e.g. the same chat history:
+    answers given without history are shared across sessions, others are
+    only reused for that exact history. Question vectors live in a fixed-size float32 matrix, so a lookup is a
+    single matrix-vector product; entries are evicted least recently used.
+    The whole cache is dropped when the index version changes.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 2048, version: Callable[[], float] | None = None, check_interval: float = 5.0):
+        """
+        Args:
+            threshold (float): Minimum cosine similarity between questions.
+            max_entries (int): Maximum number of cached answers.
+            version (callable, optional): Returns the current index version; a change clears the cache.
+            check_interval (float): Seconds between index version checks.
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.version = version
+        self.check_interval = check_interval
+
+        self._entries: OrderedDict[int, CachedAnswer] = OrderedDict()
+        self._exact: dict[tuple[str, str, tuple], int] = {}
+        self._by_slot: dict[int, int] = {}
+        self._vectors = None
+        self._valid = np.zeros(max_entries, dtype=bool)
+        self._free = list(range(max_entries - 1, -1, -1))
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._version = version() if version else None
+        self._checked = time.monotonic()
+
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self.invalidations = 0
+
+    @staticmethod
+    def documents_key(documents: list) -> tuple:
+        """Return an order-independent key of a retrieved document set."""
+        return tuple(sorted(document.page_content for document in documents))
+
+    def _check_version(self):
+        if self.version is None or time.monotonic() - self._checked < self.check_interval:
+            return
+        self._checked = time.monotonic()
+        current = self.version()
+        if current != self._version:
+            self._version = current
+            self.clear()
+            self.invalidations += 1
+            logger.info("Vector index changed, semantic answer cache cleared")
+
+    def clear(self):
+        """Drop every cached answer."""
+        with self._lock:
+            self._entries.clear()
+            self._exact.clear()
+            self._by_slot.clear()
+            self._valid[:] = False
+            self._free = list(range(self.max_entries - 1, -1, -1))
+
+    def _evict(self):
+        entry_id, entry = self._entries.popitem(last=False)
+        self._exact.pop((_normalize(entry.question), entry.scope, entry.documents), None)
+        if entry.slot is not None:
+            self._by_slot.pop(entry.slot, None)
+            self._valid[entry.slot] = False
+            self._free.append(entry.slot)
+
+    def lookup(self, question: str, documents: list, vector: list[float] | None = None, scope: str = "") -> CachedAnswer | None:
+        """
+        Return a cached answer for `question` given the retrieved `documents`, or None.
+
+        Args:
+            question (str): The standalone question.
+            documents (list): The retrieved documents.
+            vector (list, optional): The question's embedding; without it only exact matches are found.
+            scope (str): What else the answer depended on, e.g. a digest of the chat history.
+        """
+        self._check_version()
+        key = self.documents_key(documents)
+        with self._lock:
+            entry_id = self._exact.get((_normalize(question), scope, key))
+            if entry_id is None and vector is not None and self._vectors is not None and self._valid.any():
+                query = np.asarray(vector, dtype=np.float32)
+                query /= np.linalg.norm(query) or 1.0
+                scores = np.where(self._valid, self._vectors @ query, -np.inf)
+                slots = np.flatnonzero(scores >= self.threshold)
+                for slot in slots[np.argsort(-scores[slots])]:
+                    candidate = self._by_slot.get(int(slot))
+                    if candidate is not None and (self._entries[candidate].scope, self._entries[candidate].documents) == (scope, key):
+                        entry_id = candidate
+                        break
+            if entry_id is None:
+                self.misses += 1
+                record_cache("answer", "miss")
+                return None
+            self._entries.move_to_end(entry_id)
+            entry = self._entries[entry_id]
+            self.hits += 1
+            record_cache("answer", "hit")
+            self.saved_seconds += entry.seconds
+            return entry
+
+    def store(self, question: str, documents: list, answer: str, seconds: float, vector: list[float] | None = None, scope: str = ""):
+        """
+        Cache an answer.
+
+        Args:
+            question (str): The standalone question.
+            documents (list): The retrieved documents the answer was generated from.
+            answer (str): The generated answer.
+            seconds (float): How long generating the answer took.
+            vector (list, optional): The question's embedding, enabling similarity matches.
+            scope (str): What else the answer depended on, e.g. a digest of the chat history.
+        """
+        key = self.documents_key(documents)
+        with self._lock:
+            if (_normalize(question), scope, key) in self._exact:
+                return
+            if len(self._entries) >= self.max_entries:
+                self._evict()
+            slot = None
+            if vector is not None:
+                vector = np.asarray(vector, dtype=np.float32)
+                if self._vectors is None:
+                    self._vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+                slot = self._free.pop()
+                self._vectors[slot] = vector / (np.linalg.norm(vector) or 1.0)
+                self._valid[slot] = True
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = CachedAnswer(question, scope, key, answer, seconds, slot)
+            self._exact[(_normalize(question), scope, key)] = entry_id
+            if slot is not None:
+                self._by_slot[slot] = entry_id
+
+    def stats(self) -> dict:
+        """Return hit rate and latency saved by the cache."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "saved_seconds": round(self.saved_seconds, 3),
+            "entries": len(self._entries),
+            "invalidations": self.invalidations,
+        }
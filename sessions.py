@@ -0,0 +1,466 @@
+import asyncio
+import heapq
+import json
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from logging import getLogger
+from urllib.parse import unquote, urlparse
+
+logger = getLogger(__name__)
+
+HUMAN = "h"
+AI = "a"
+
+
+@dataclass
+class SessionHistory:
+    """
+    Compact history of one session.
+
+    `turns` only holds the messages that are not folded into `summary` yet,
+    as (role, text) tuples; `folded` counts how many messages were folded.
+    `start` is the position of the first of `turns` among all the messages
+    of the session, counting those folded or dropped when it overflowed.
+    """
+
+    turns: list[tuple[str, str]] = field(default_factory=list)
+    summary: str = ""
+    folded: int = 0
+    start: int = 0
+
+
+class SessionStore(ABC):
+    """
+    Storage of chat sessions with sliding expiry.
+
+    Every write refreshes the session's expiry. Appends are atomic and keep
+    at most `max_messages` messages of at most `max_message_chars`
+    characters each, so one runaway session cannot exhaust memory.
+    """
+
+    def __init__(self, ttl: float = 600, max_messages: int = 200, max_message_chars: int = 8000):
+        """
+        Args:
+            ttl (float): Seconds of inactivity after which a session expires.
+            max_messages (int): Maximum number of unfolded messages kept per session.
+            max_message_chars (int): Longer messages are truncated to this many characters.
+        """
+        self.ttl = ttl
+        self.max_messages = max(2, max_messages - max_messages % 2)
+        self.max_message_chars = max_message_chars
+
+    @abstractmethod
+    async def exists(self, session_id: str) -> bool:
+        """Return whether the session exists and has not expired."""
+
+    @abstractmethod
+    async def touch(self, session_id: str):
+        """Create the session if needed and refresh its expiry."""
+
+    @abstractmethod
+    async def load(self, session_id: str) -> SessionHistory:
+        """Return the session's history (empty if the session does not exist)."""
+
+    @abstractmethod
+    async def append_turn(self, session_id: str, human_message: str, ai_message: str) -> SessionHistory:
+        """Atomically append a human/AI turn, refresh the expiry and return the updated history."""
+
+    @abstractmethod
+    async def fold(self, session_id: str, end: int, summary: str):
+        """
+        Atomically replace the messages before position `end` with an updated summary.
+
+        Positions count every message of the session (see `SessionHistory.start`), so
+        messages appended or dropped since `end` was computed are never folded by mistake.
+        """
+
+    @abstractmethod
+    async def delete(self, session_id: str):
+        """Forget a session."""
+
+    async def expire(self) -> list[str]:
+        """Drop expired sessions and return their ids."""
+        return []
+
+    async def close(self):
+        """Release the store's resources."""
+
+
+class MemorySessionStore(SessionStore):
+    """
+    In-process session store.
+
+    Expiry deadlines live in a min-heap, so `expire` only pops the sessions
+    that actually expired instead of scanning all of them. Touching a
+    session pushes a new deadline and leaves the old one behind; stale
+    entries are skipped when popped and the heap is rebuilt when they
+    outnumber the live ones.
+    """
+
+    def __init__(self, ttl: float = 600, max_messages: int = 200, max_message_chars: int = 8000):
+        super().__init__(ttl, max_messages, max_message_chars)
+        self._sessions: dict[str, SessionHistory] = {}
+        self._deadlines: dict[str, float] = {}
+        self._heap: list[tuple[float, str]] = []
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _live(self, session_id: str) -> SessionHistory | None:
+        deadline = self._deadlines.get(session_id)
+        if deadline is None:
+            return None
+        if deadline <= time.monotonic():
+            self._drop(session_id)
+            return None
+        return self._sessions[session_id]
+
+    def _drop(self, session_id: str):
+        self._sessions.pop(session_id, None)
+        self._deadlines.pop(session_id, None)
+
+    def _touch(self, session_id: str) -> SessionHistory:
+        session = self._live(session_id)
+        if session is None:
+            session = self._sessions[session_id] = SessionHistory()
+        deadline = time.monotonic() + self.ttl
+        self._deadlines[session_id] = deadline
+        heapq.heappush(self._heap, (deadline, session_id))
+        if len(self._heap) > 2 * len(self._deadlines) + 64:
+            self._heap = [(deadline, session_id) for session_id, deadline in self._deadlines.items()]
+            heapq.heapify(self._heap)
+        return session
+
+    async def exists(self, session_id: str) -> bool:
+        return self._live(session_id) is not None
+
+    async def touch(self, session_id: str):
+        self._touch(session_id)
+
+    async def load(self, session_id: str) -> SessionHistory:
+        return self._live(session_id) or SessionHistory()
+
+    async def append_turn(self, session_id: str, human_message: str, ai_message: str) -> SessionHistory:
+        session = self._touch(session_id)
+        session.turns.append((HUMAN, human_message[:self.max_message_chars]))
+        session.turns.append((AI, ai_message[:self.max_message_chars]))
+        overflow = len(session.turns) - self.max_messages
+        if overflow > 0:
+            del session.turns[:overflow]
+            session.start += overflow
+        return session
+
+    async def fold(self, session_id: str, end: int, summary: str):
+        session = self._live(session_id)
+        if session is None:
+            return
+        count = min(max(end - session.start, 0), len(session.turns))
+        del session.turns[:count]
+        session.folded += count
+        session.start += count
+        session.summary = summary
+
+    async def delete(self, session_id: str):
+        self._drop(session_id)
+
+    async def expire(self) -> list[str]:
+        now = time.monotonic()
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, session_id = heapq.heappop(self._heap)
+            if self._deadlines.get(session_id) == deadline:
+                self._drop(session_id)
+                expired.append(session_id)
+        return expired
+
+
+class RedisError(Exception):
+    """Error reply from a Redis server."""
+
+
+class RespConnection:
+    """A single connection speaking the Redis serialization protocol (RESP2)."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    @staticmethod
+    def encode(*args) -> bytes:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(parts)
+
+    async def read_reply(self):
+        line = await self.reader.readuntil(b"\r\n")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode("utf-8")
+        if kind == b"-":
+            return RedisError(payload.decode("utf-8"))
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = await self.reader.readexactly(length + 2)
+            return data[:-2].decode("utf-8")
+        if kind == b"*":
+            length = int(payload)
+            if length < 0:
+                return None
+            return [await self.read_reply() for _ in range(length)]
+        raise RedisError(f"Unexpected reply from server: {line!r}")
+
+    async def pipeline(self, *commands: tuple) -> list:
+        """Send several commands in one write and return their replies in order."""
+        self.writer.write(b"".join(self.encode(*command) for command in commands))
+        await self.writer.drain()
+        return [await self.read_reply() for _ in commands]
+
+    def close(self):
+        self.writer.close()
+
+
+class RespClient:
+    """
+    Minimal pooled asyncio client for Redis-protocol servers.
+
+    Only what the session store needs: plain commands and MULTI/EXEC
+    transactions, pipelined in a single round trip, optionally guarded by
+    WATCH for read-then-write updates.
+    """
+
+    def __init__(self, url: str = "redis://localhost:6379/0", pool_size: int = 10, timeout: float = 5.0):
+        """
+        Args:
+            url (str): Server URL, e.g. redis://:password@host:6379/0.
+            pool_size (int): Maximum number of idle connections kept open.
+            timeout (float): Seconds to wait for connecting or for a reply.
+        """
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.username = unquote(parsed.username) if parsed.username else None
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._idle: list[RespConnection] = []
+
+    async def _connect(self) -> RespConnection:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+        connection = RespConnection(reader, writer)
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.username, self.password) if self.username else ("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        if setup:
+            for reply in await connection.pipeline(*setup):
+                if isinstance(reply, RedisError):
+                    connection.close()
+                    raise reply
+        return connection
+
+    def _release(self, connection: RespConnection):
+        if len(self._idle) < self.pool_size:
+            self._idle.append(connection)
+        else:
+            connection.close()
+
+    async def _run(self, *commands: tuple) -> list:
+        connection = self._idle.pop() if self._idle else await self._connect()
+        try:
+            replies = await asyncio.wait_for(connection.pipeline(*commands), self.timeout)
+        except BaseException:
+            # The connection may hold unread replies; never reuse it
+            connection.close()
+            raise
+        self._release(connection)
+        return replies
+
+    @staticmethod
+    def _check_exec(replies: list) -> list | None:
+        """Raise the first error of a MULTI/EXEC pipeline, including those of queued commands."""
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        for reply in replies[-1] or []:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies[-1]
+
+    async def execute(self, *args):
+        """Run one command and return its reply."""
+        reply = (await self._run(args))[0]
+        if isinstance(reply, RedisError):
+            raise reply
+        return reply
+
+    async def transaction(self, *commands: tuple) -> list:
+        """Run commands atomically with MULTI/EXEC and return their replies."""
+        replies = self._check_exec(await self._run(("MULTI",), *commands, ("EXEC",)))
+        if replies is None:
+            raise RedisError("Transaction aborted")
+        return replies
+
+    async def watched_transaction(self, keys: tuple, reads: list[tuple], build, attempts: int = 5) -> list:
+        """
+        Run an optimistic read-then-write transaction, retried while the keys change under it.
+
+        Args:
+            keys (tuple): Keys to WATCH.
+            reads (list): Commands whose replies the writes depend on.
+            build (callable): Returns the commands to run atomically given the replies of `reads`.
+            attempts (int): Number of tries before giving up.
+
+        Returns:
+            list: The replies of the commands.
+
+        Raises:
+            RedisError: On an error reply, or when every attempt was aborted by a concurrent write.
+        """
+        connection = self._idle.pop() if self._idle else await self._connect()
+        try:
+            for _ in range(attempts):
+                values = await asyncio.wait_for(connection.pipeline(("WATCH", *keys), *reads), self.timeout)
+                for reply in values:
+                    if isinstance(reply, RedisError):
+                        raise reply
+                commands = build(values[1:])
+                replies = self._check_exec(await asyncio.wait_for(connection.pipeline(("MULTI",), *commands, ("EXEC",)), self.timeout))
+                if replies is not None:
+                    break
+            else:
+                raise RedisError("Transaction aborted: the watched keys kept changing")
+        except BaseException:
+            connection.close()
+            raise
+        self._release(connection)
+        return replies
+
+    async def close(self):
+        while self._idle:
+            self._idle.pop().close()
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Session store shared by several worker processes through a Redis-protocol server.
+
+    A session is a list of JSON-encoded (role, text) messages plus a hash
+    with the summary, the fold count and the number of messages ever
+    appended. Every write runs as one MULTI/EXEC transaction that also
+    refreshes both keys' TTL, so expiry is handled by the server and
+    `expire` has nothing to do. Folding depends on the current list, so it
+    WATCHes the keys and retries when a concurrent append changed them.
+    """
+
+    def __init__(self, client: RespClient, ttl: float = 600, max_messages: int = 200, max_message_chars: int = 8000, prefix: str = "rmp:session:"):
+        """
+        Args:
+            client (RespClient): Connection to the server.
+            ttl (float): Seconds of inactivity after which a session expires.
+            max_messages (int): Maximum number of unfolded messages kept per session.
+            max_message_chars (int): Longer messages are truncated to this many characters.
+            prefix (str): Key prefix of session keys.
+        """
+        super().__init__(ttl, max_messages, max_message_chars)
+        self.client = client
+        self.prefix = prefix
+
+    def _keys(self, session_id: str) -> tuple[str, str]:
+        return f"{self.prefix}{session_id}:turns", f"{self.prefix}{session_id}:meta"
+
+    def _expire_commands(self, session_id: str) -> list[tuple]:
+        ttl = max(1, int(self.ttl))
+        return [("EXPIRE", key, ttl) for key in self._keys(session_id)]
+
+    @staticmethod
+    def _start(turns: list, fields: dict) -> int:
+        # Sessions written before "appended" existed never dropped messages, as far as we know
+        folded = int(fields.get("folded", 0))
+        return int(fields.get("appended", folded + len(turns))) - len(turns)
+
+    @classmethod
+    def _history(cls, turns: list, meta: list) -> SessionHistory:
+        fields = dict(zip(meta[::2], meta[1::2]))
+        return SessionHistory(
+            turns=[tuple(json.loads(turn)) for turn in turns],
+            summary=fields.get("summary", ""),
+            folded=int(fields.get("folded", 0)),
+            start=cls._start(turns, fields),
+        )
+
+    async def exists(self, session_id: str) -> bool:
+        return await self.client.execute("EXISTS", self._keys(session_id)[1]) > 0
+
+    async def touch(self, session_id: str):
+        _, meta = self._keys(session_id)
+        await self.client.transaction(("HSETNX", meta, "folded", 0), *self._expire_commands(session_id))
+
+    async def load(self, session_id: str) -> SessionHistory:
+        turns, meta = self._keys(session_id)
+        replies = await self.client.transaction(("LRANGE", turns, 0, -1), ("HGETALL", meta))
+        return self._history(*replies)
+
+    async def append_turn(self, session_id: str, human_message: str, ai_message: str) -> SessionHistory:
+        turns, meta = self._keys(session_id)
+        replies = await self.client.transaction(
+            ("RPUSH", turns, json.dumps([HUMAN, human_message[:self.max_message_chars]]), json.dumps([AI, ai_message[:self.max_message_chars]])),
+            ("LTRIM", turns, -self.max_messages, -1),
+            ("HSETNX", meta, "folded", 0),
+            ("HINCRBY", meta, "appended", 2),
+            *self._expire_commands(session_id),
+            ("LRANGE", turns, 0, -1),
+            ("HGETALL", meta),
+        )
+        return self._history(replies[-2], replies[-1])
+
+    async def fold(self, session_id: str, end: int, summary: str):
+        turns, meta = self._keys(session_id)
+
+        def commands(state: list) -> list[tuple]:
+            length, fields = state
+            fields = dict(zip(fields[::2], fields[1::2]))
+            if not fields:
+                return []  # Expired or deleted meanwhile
+            count = min(max(end - self._start([None] * length, fields), 0), length)
+            return [
+                ("LTRIM", turns, count, -1),
+                ("HINCRBY", meta, "folded", count),
+                ("HSET", meta, "summary", summary),
+                *self._expire_commands(session_id),
+            ]
+
+        await self.client.watched_transaction((turns, meta), [("LLEN", turns), ("HGETALL", meta)], commands)
+
+    async def delete(self, session_id: str):
+        await self.client.execute("DEL", *self._keys(session_id))
+
+    async def close(self):
+        await self.client.close()
+
+
+def build_session_store(backend: str = "memory", url: str | None = None, **kwargs) -> SessionStore:
+    """
+    Create a session store.
+
+    Args:
+        backend (str): "memory" for a single process or "redis" to share sessions between workers.
+        url (str, optional): Server URL of the redis backend.
+        **kwargs: Passed to the store (ttl, max_messages, max_message_chars).
+
+    Returns:
+        SessionStore: The store.
+    """
+    if backend == "memory":
+        return MemorySessionStore(**kwargs)
+    if backend == "redis":
+        return RedisSessionStore(RespClient(url or "redis://localhost:6379/0"), **kwargs)
+    raise ValueError(f"Unknown session store backend: {backend}")
@@ -0,0 +1,182 @@
+import asyncio
+import json
+import time
+from collections import deque
+from typing import Awaitable, Callable
+
+
+class SentinelFilter:
+    """
+    Incremental detection of a sentinel string in a token stream.
+
+    Each chunk is scanned together with the few characters held back from
+    the previous one, so the work per chunk is bounded by the chunk and
+    sentinel lengths rather than by the answer so far. Text that could be
+    the start of the sentinel is held back until the next chunk settles it,
+    so no part of the sentinel is ever emitted.
+    """
+
+    def __init__(self, sentinel: str):
+        self.sentinel = sentinel
+        self.found = False
+        self._held = ""
+
+    def feed(self, chunk: str) -> str:
+        """
+        Add a chunk and return the text that is safe to emit.
+
+        Once the sentinel is found, `found` is set and only the text before
+        it is returned.
+        """
+        text = self._held + chunk
+        index = text.find(self.sentinel)
+        if index >= 0:
+            self.found = True
+            self._held = ""
+            return text[:index]
+        keep = 0
+        for length in range(min(len(self.sentinel) - 1, len(text)), 0, -1):
+            if text.endswith(self.sentinel[:length]):
+                keep = length
+                break
+        self._held = text[len(text) - keep:] if keep else ""
+        return text[:len(text) - keep]
+
+    def flush(self) -> str:
+        """Return the held-back text at the end of the stream."""
+        held, self._held = self._held, ""
+        return held
+
+
+class StreamStats:
+    """Time to first frame and frames per answer over the most recent answers."""
+
+    def __init__(self, window: int = 1000):
+        self.answers = 0
+        self.frames = 0
+        self._ttfb = deque(maxlen=window)
+        self._frames = deque(maxlen=window)
+
+    def record(self, ttfb: float | None, frames: int):
+        self.answers += 1
+        self.frames += frames
+        if ttfb is not None:
+            self._ttfb.append(ttfb)
+        self._frames.append(frames)
+
+    def stats(self) -> dict:
+        """Return answer and frame counts with time-to-first-byte percentiles (milliseconds)."""
+        ttfb = sorted(self._ttfb)
+
+        def percentile(q: float) -> float:
+            return round(1000 * ttfb[int(q * (len(ttfb) - 1))], 1) if ttfb else 0.0
+
+        return {
+            "answers": self.answers,
+            "frames": self.frames,
+            "mean_frames_per_answer": round(sum(self._frames) / len(self._frames), 2) if self._frames else 0.0,
+            "ttfb_p50_ms": percentile(0.5),
+            "ttfb_p95_ms": percentile(0.95),
+        }
+
+
+class FrameWriter:
+    """
+    Buffered writer of one answer stream as JSON frames.
+
+    Text is buffered and sent as a frame once `max_bytes` characters are
+    waiting or `max_delay` seconds after the first of them arrived,
+    whichever comes first, so short answers start showing right away and
+    long ones are not sent token by token. Every frame carries the stream
+    id and a sequence number; the last one has `"end": true`, plus
+    `"cancelled": true` when the answer was abandoned:
+
+        {"id": 3, "seq": 0, "text": "Dr. Smith teaches", "end": false}
+        {"id": 3, "seq": 1, "text": " Biology.", "end": true}
+    """
+
+    def __init__(
+        self,
+        send: Callable[[str], Awaitable[None]],
+        stream_id: int,
+        max_bytes: int = 1024,
+        max_delay: float = 0.05,
+        started: float | None = None,
+        stats: StreamStats | None = None,
+    ):
+        """
+        Args:
+            send (callable): Coroutine function sending one text frame, e.g. `websocket.send_text`.
+            stream_id (int): Id of this stream, unique within the connection.
+            max_bytes (int): Buffered characters that trigger a flush.
+            max_delay (float): Seconds buffered text may wait before it is flushed.
+            started (float, optional): `time.perf_counter()` of the request, for time to first byte.
+            stats (StreamStats, optional): Collects time to first byte and frame counts once the stream ends.
+        """
+        self.send = send
+        self.stream_id = stream_id
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self.started = time.perf_counter() if started is None else started
+        self.stats = stats
+
+        self.frames = 0
+        self.ttfb = None
+        self.ended = False
+        self._parts: list[str] = []
+        self._size = 0
+        self._timer: asyncio.Task | None = None
+        self._lock = asyncio.Lock()
+
+    async def write(self, text: str):
+        """Buffer text, flushing when the size threshold is reached."""
+        if not text:
+            return
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size >= self.max_bytes:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.max_delay)
+        self._timer = None
+        await self.flush()
+
+    async def flush(self, end: bool = False, cancelled: bool = False):
+        """Send the buffered text as one frame; with `end`, close the stream."""
+        if self._timer is not None and self._timer is not asyncio.current_task():
+            self._timer.cancel()
+            self._timer = None
+        async with self._lock:
+            if self.ended:
+                return
+            text = "".join(self._parts)
+            self._parts.clear()
+            self._size = 0
+            if not text and not end:
+                return
+            frame = {"id": self.stream_id, "seq": self.frames, "text": text, "end": end}
+            if cancelled:
+                frame["cancelled"] = True
+            await self.send(json.dumps(frame, ensure_ascii=False))
+            self.frames += 1
+            if text and self.ttfb is None:
+                self.ttfb = time.perf_counter() - self.started
+            if end:
+                self.ended = True
+                if self.stats is not None:
+                    self.stats.record(self.ttfb, self.frames)
+
+    async def close(self, text: str = "", cancelled: bool = False):
+        """Send the remaining text, plus `text`, in a final frame."""
+        if text:
+            self._parts.append(text)
+        await self.flush(end=True, cancelled=cancelled)
+
+    def abort(self):
+        """Stop the flush timer without sending anything, e.g. when the connection is gone."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
@@ -0,0 +1,48 @@
+import os
+
+import pytest
+
+from benchmarks.standins import FakeChatModel, SlowDeterministicEmbeddings, StubGraphQLServer, build_local_index
+
+REVIEWS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "sample.json")
+
+
+@pytest.fixture
+def make_agent(tmp_path, monkeypatch):
+    """Build ProfessorRaterAgents on the local index of data/sample.json, with the offline stand-in models."""
+    embeddings = SlowDeterministicEmbeddings()
+    build_local_index(str(tmp_path / "index"), REVIEWS_PATH, embeddings)
+    monkeypatch.setenv("VECTOR_BACKEND", "local")
+    monkeypatch.setenv("LOCAL_INDEX_PATH", str(tmp_path / "index"))
+    monkeypatch.setenv("REVIEWS_PATH", REVIEWS_PATH)
+    monkeypatch.setenv("INDEX_VERSION_PATH", str(tmp_path / "index-version"))
+    monkeypatch.setenv("AGGREGATES_PATH", str(tmp_path / "aggregates"))
+    monkeypatch.delenv("EMBEDDING_CACHE_PATH", raising=False)
+
+    def make(**model_options):
+        from agent import ProfessorRaterAgent
+
+        return ProfessorRaterAgent(llm=FakeChatModel(**model_options), embeddings=embeddings)
+
+    return make
+
+
+@pytest.fixture
+def graphql(monkeypatch):
+    """Point the RateMyProfessors client at a local stub server, with an empty result cache."""
+    from tools import ratemyprofessor
+
+    stub = StubGraphQLServer().start()
+    requests = []
+    resolve = stub.resolve
+
+    def recording_resolve(query, variables):
+        requests.append(variables)
+        return resolve(query, variables)
+
+    stub.resolve = recording_resolve
+    monkeypatch.setattr(ratemyprofessor.client, "url", stub.url)
+    ratemyprofessor.cache.clear()
+    yield requests
+    ratemyprofessor.cache.clear()
+    stub.stop()
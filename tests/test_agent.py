@@ -0,0 +1,63 @@
+import asyncio
+
+from langchain_core.runnables import RunnableLambda
+
+
+def test_concurrent_sessions_stream_interleaved(make_agent):
+    """Two sessions streaming at once both make progress: their answer tokens interleave."""
+    agent = make_agent(first_token_latency=0.05, token_latency=0.01, answer_tokens=20)
+    received = []
+
+    async def session(name: str, question: str):
+        async for token in agent.astream(question, []):
+            received.append((name, token))
+
+    async def main():
+        await asyncio.gather(session("a", "How is Dr. Jane Smith?"), session("b", "How is Prof. Emma Lee?"))
+
+    asyncio.run(main())
+
+    order = [name for name, _ in received]
+    assert order.count("a") == 20 and order.count("b") == 20
+    # Sequential sessions would switch once; interleaved token streams switch on almost every token
+    switches = sum(1 for previous, current in zip(order, order[1:]) if previous != current)
+    assert switches >= 10
+    # Each session answered from its own context
+    assert "Smith" in "".join(token for name, token in received if name == "a")
+    assert "Emma" in "".join(token for name, token in received if name == "b")
+
+
+def test_follow_up_is_rewritten_before_the_fast_path(make_agent):
+    """A follow-up naming a course is routed on the standalone question, not on its raw text."""
+    agent = make_agent()
+    agent.rewriter.contextualize_chain = RunnableLambda(lambda inputs: "Does Dr. Mark Brown teach Physics II?")
+    history = [("human", "How is Dr. Mark Brown?"), ("ai", "Dr. Mark Brown teaches Physics II.")]
+
+    retrieved = agent.retrieve("does he also teach Physics II?", history)
+
+    assert retrieved["question"] == "Does Dr. Mark Brown teach Physics II?"
+    assert retrieved["route"] != "hybrid"
+    assert any("Mark Brown" in document.page_content for document in retrieved["context"])
+    assert agent.rewriter.counts["llm"] == 1
+
+
+def test_self_contained_message_skips_the_rewrite(make_agent):
+    agent = make_agent()
+    history = [("human", "How is Dr. Mark Brown?"), ("ai", "Dr. Mark Brown teaches Physics II.")]
+
+    retrieved = agent.retrieve("How is Dr. Jane Smith?", history)
+
+    assert retrieved["question"] == "How is Dr. Jane Smith?" and retrieved["route"] == "name"
+    assert agent.rewriter.counts["llm"] == 0
+
+
+def test_answers_given_with_chat_history_are_not_shared_across_sessions(make_agent):
+    agent = make_agent()
+    question = "How is Dr. Jane Smith?"
+
+    agent.invoke(question, [])
+    agent.invoke(question, [])
+    agent.invoke(question, [("human", "I only care about exams."), ("ai", "Noted.")])
+    agent.invoke(question, [("human", "I only care about labs."), ("ai", "Noted.")])
+
+    assert agent.answer_cache.stats()["hits"] == 1
@@ -0,0 +1,47 @@
+import asyncio
+
+from tools.agent_pool import ToolAgentPool
+
+
+def test_resubmitting_a_message_shares_the_in_flight_run():
+    calls = []
+
+    async def run_tools(input, chat_history):
+        calls.append(input)
+        await asyncio.sleep(0.05)
+        return f"answer to {input}"
+
+    async def main():
+        pool = ToolAgentPool(run_tools)
+        return await asyncio.gather(pool.run("Who is Dr. Smith?", [], "s"), pool.run("who is  dr. smith?", [], "s"))
+
+    assert asyncio.run(main()) == ["answer to Who is Dr. Smith?"] * 2
+    assert calls == ["Who is Dr. Smith?"]
+
+
+def test_message_sent_while_its_run_is_cancelled_starts_a_fresh_run():
+    calls = []
+
+    async def run_tools(input, chat_history):
+        calls.append(input)
+        try:
+            await asyncio.sleep(0.05)
+        except asyncio.CancelledError:
+            # Slow cleanup keeps the cancelled run in flight for a while
+            await asyncio.sleep(0.05)
+            raise
+        return "answer"
+
+    async def main():
+        pool = ToolAgentPool(run_tools)
+        first = asyncio.create_task(pool.run("Who is Dr. Smith?", [], "s"))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        await asyncio.sleep(0)
+        answer = await pool.run("Who is Dr. Smith?", [], "s")
+        return answer, pool.counts
+
+    answer, counts = asyncio.run(main())
+
+    assert answer == "answer"
+    assert len(calls) == 2 and counts["deduplicated"] == 0 and counts["cancelled"] == 1
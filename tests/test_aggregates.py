@@ -0,0 +1,44 @@
+from aggregates import ProfessorAggregates
+from compaction import ContextCompactor
+
+
+def review(professor: str, course: str, rating: float, **metrics) -> dict:
+    return {"professor_name": professor, "course": course, "overall_rating": rating, **metrics}
+
+
+def test_a_single_top_review_does_not_outrank_many_ratings():
+    records = [review("Dr. Lucky", "Calculus I", 5.0)]
+    records += [review("Dr. Steady", "Calculus I", 5.0 if i % 10 else 4.0) for i in range(200)]
+    records += [review("Dr. Average", "Calculus I", 3.0) for _ in range(50)]
+    aggregates = ProfessorAggregates.from_records(records)
+
+    rows = aggregates.query(k=3)
+
+    assert [row["professor_name"] for row in rows] == ["Dr. Steady", "Dr. Lucky", "Dr. Average"]
+    # Rows still report the plain mean
+    assert rows[0]["overall_rating"] == 4.9 and rows[1]["overall_rating"] == 5.0
+
+
+def test_course_ranking_keeps_one_row_per_course():
+    records = [
+        review("Dr. Brown", "Physics I", 2.0), review("Dr. Brown", "Physics II", 5.0),
+        review("Dr. Green", "Physics II", 4.0), review("Dr. Green", "Art History", 1.0),
+    ]
+    aggregates = ProfessorAggregates.from_records(records)
+
+    rows = aggregates.answer("Who is the best Physics II professor?")
+
+    assert [(row["professor_name"], row["course"]) for row in rows] == [("Dr. Brown", "Physics II"), ("Dr. Green", "Physics II"), ("Dr. Brown", "Physics I")]
+    table = ContextCompactor().render(rows, merge=False).splitlines()
+    assert len(table) == 4 and "Physics I |" in table[3] and "| 2 |" in table[3]
+    assert aggregates.counts["matched_questions"] == 1
+
+
+def test_only_answered_questions_count_as_matched():
+    aggregates = ProfessorAggregates.from_records([review("Dr. Brown", "Physics II", 5.0)])
+
+    # Recognized, but no review has a clarity score
+    assert aggregates.match("clearest physics professor") is not None
+    assert aggregates.answer("clearest physics professor") == []
+    assert aggregates.answer("who is the best professor") != []
+    assert aggregates.counts["matched_questions"] == 1
@@ -0,0 +1,78 @@
+import asyncio
+import threading
+
+from tools.cache import ResultCache, make_key
+
+
+def test_keys_ignore_case_of_search_text_but_not_of_ids():
+    query = {"query": {"text": "  Jane   SMITH ", "schoolID": "U2Nob29sLTE="}}
+
+    assert make_key("GetProfessor", query) == make_key("GetProfessor", {"query": {"text": "jane smith", "schoolID": "U2Nob29sLTE="}})
+    # Base64 ids differing only in case are different schools
+    assert make_key("GetProfessor", query) != make_key("GetProfessor", {"query": {"text": "jane smith", "schoolID": "u2nob29sLTE="}})
+    assert make_key("GetUniversity", {"query": {"name": "MIT"}}) == make_key("GetUniversity", {"query": {"name": "mit"}})
+
+
+def test_fresh_entries_are_served_and_expired_ones_reloaded():
+    cache = ResultCache(stale_ttl=5)
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return {"value": len(loads)}
+
+    assert cache.get_or_load("fresh", loader) == {"value": 1}
+    assert cache.get_or_load("fresh", loader) == {"value": 1}
+    # Expired beyond its stale window: a plain miss
+    cache.set("expired", {"value": 0}, ttl=-10)
+    assert cache.get("expired") is None
+    assert cache.get_or_load("expired", loader) == {"value": 2}
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_stale_entries_are_served_while_one_refresh_runs():
+    cache = ResultCache(stale_ttl=60)
+    cache.set("key", "old", ttl=-1)
+    release = threading.Event()
+    loads = []
+
+    def loader():
+        loads.append(1)
+        release.wait(5)
+        return "new"
+
+    assert cache.get_or_load("key", loader) == "old"
+    assert cache.get_or_load("key", loader) == "old"
+    release.set()
+    cache._refresh_pool.shutdown(wait=True)
+
+    assert cache.get("key") == "new"
+    assert len(loads) == 1 and cache.stats()["stale_hits"] == 2 and cache.stats()["refreshes"] == 1
+
+
+def test_async_stale_while_revalidate():
+    cache = ResultCache(stale_ttl=60)
+    cache.set("key", "old", ttl=-1)
+
+    async def loader():
+        await asyncio.sleep(0.01)
+        return "new"
+
+    async def main():
+        first = await cache.aget_or_load("key", loader)
+        await asyncio.sleep(0.05)
+        return first, await cache.aget_or_load("key", loader)
+
+    assert asyncio.run(main()) == ("old", "new")
+
+
+def test_cache_is_bounded_and_skips_uncacheable_values(tmp_path):
+    cache = ResultCache(max_entries=2, should_cache=lambda value: "error" not in value, path=str(tmp_path / "cache.sqlite"))
+    for key in ("a", "b", "c"):
+        cache.set(key, {"key": key})
+    cache.get_or_load("failed", lambda: {"error": "boom"})
+
+    assert cache.stats()["entries"] == 2 and cache.stats()["evictions"] == 1
+    assert cache.get("failed") is None
+    # Evicted from memory, still in the persistent store
+    assert ResultCache(path=str(tmp_path / "cache.sqlite")).get("a") == {"key": "a"}
@@ -0,0 +1,72 @@
+import json
+
+from langchain_core.documents import Document
+
+from compaction import ContextCompactor, merge_professors, select_fields
+from tools import ratemyprofessor
+
+
+def review(name: str, course: str, rating: float, comment: str) -> dict:
+    return {"id": f"{name}-{course}", "professor_name": name, "course": course, "overall_rating": rating, "comment": comment}
+
+
+def test_reviews_of_a_professor_are_merged_into_one_row():
+    merged = merge_professors([
+        review("Jane Smith", "Genetics", 4.0, "Clear lectures."),
+        review("Sam Lee", "Physics", 3.0, "Tough exams."),
+        review("Jane Smith", "Genetics", 5.0, "Great labs."),
+    ])
+
+    assert [professor["professor_name"] for professor in merged] == ["Jane Smith", "Sam Lee"]
+    assert merged[0]["overall_rating"] == 4.5
+    assert merged[0]["course"] == "Genetics"
+    assert merged[0]["comment"] == "Clear lectures. / Great labs."
+
+
+def test_columns_follow_the_question():
+    records = [{"legacyId": 1, "professor_name": "Jane Smith", "avgRating": 4.0, "overall_rating": 4.0, "easiness": 2.0, "clarity": 4.5}]
+
+    assert select_fields(records, "Who is Jane Smith?") == ["professor_name", "avgRating"]
+    assert select_fields(records, "Are her exams hard?") == ["professor_name", "avgRating", "easiness"]
+    # Without a question every visible field is kept, identifiers are not
+    assert select_fields(records) == ["professor_name", "avgRating", "easiness", "clarity"]
+
+
+def test_rows_are_dropped_once_the_budget_is_spent():
+    compactor = ContextCompactor(max_tokens=40, max_cell_chars=200, min_cell_chars=20)
+    records = [review(f"Professor {i}", "Biology", 4.0, "Long comment " * 20) for i in range(5)]
+
+    table = compactor.render(records)
+
+    lines = table.splitlines()
+    assert lines[0] == "professor | course | rating | comment"
+    assert 1 <= len(lines) - 1 < 5
+    assert sum(len(line) // 4 + 4 for line in lines) <= 40
+    assert compactor.counts["dropped_rows"] == 5 - (len(lines) - 1)
+
+
+def test_non_record_documents_are_kept_after_the_table():
+    compactor = ContextCompactor()
+    documents = [
+        Document(page_content=json.dumps(review("Jane Smith", "Genetics", 4.0, "Clear lectures."))),
+        Document(page_content="Office hours are on Fridays."),
+    ]
+
+    [compacted] = compactor.compact_documents(documents, "Who teaches Genetics?")
+
+    table, note = compacted.page_content.split("\n\n")
+    assert table.splitlines()[1] == "Jane Smith | Genetics | 4 | Clear lectures."
+    assert note == "Office hours are on Fridays."
+
+
+def test_compacted_tools_keep_school_ids(graphql):
+    universities = ratemyprofessor._compacted(ratemyprofessor.get_university)("Springfield")
+    # The school id is what GetProfessorsByUniversityID needs next
+    assert isinstance(universities, list) and universities[0]["id"]
+
+    professors = ratemyprofessor._compacted(ratemyprofessor.get_professors_by_university_id)(universities[0]["id"], "Sam", limit=2)
+    assert isinstance(professors, str) and professors.startswith("professor | school | department | rating")
+
+    combined = ratemyprofessor._compacted(ratemyprofessor.get_university_professors)("Springfield", "Sam", limit=2)
+    assert combined["universities"][0]["id"] == universities[0]["id"]
+    assert isinstance(combined["professors"], str)
@@ -0,0 +1,101 @@
+import asyncio
+import time
+
+import pytest
+
+from benchmarks.standins import StubGraphQLServer
+from ingest import iter_records
+from tools.crawler import CrawlState, Crawler, RateLimiter
+from tools.http_client import GraphQLClient
+
+SCHOOLS = ["U2Nob29sLTE=", "U2Nob29sLTI="]
+PAGES = 3
+
+
+@pytest.fixture
+def stub():
+    """A stub server whose teacher searches span `PAGES` pages per school, recording every request."""
+    server = StubGraphQLServer().start()
+    server.requests = []
+    server.fail_pages = set()
+    resolve = server.resolve
+
+    def paged_resolve(query, variables):
+        school_id = variables["query"]["schoolID"]
+        page = int(variables.get("cursor") or 0)
+        server.requests.append((school_id, page))
+        if (school_id, page) in server.fail_pages:
+            server.fail_pages.discard((school_id, page))
+            return {"errors": [{"message": "Internal error"}]}
+        response = resolve(query, variables)
+        teachers = response["data"]["newSearch"]["teachers"]
+        for i, edge in enumerate(teachers["edges"]):
+            edge["node"]["legacyId"] = 1000 * SCHOOLS.index(school_id) + 10 * page + i
+        teachers["pageInfo"] = {"hasNextPage": page + 1 < PAGES, "endCursor": str(page + 1)}
+        return response
+
+    server.resolve = paged_resolve
+    yield server
+    server.stop()
+
+
+def crawl(stub, tmp_path, **options) -> dict:
+    async def main():
+        client = GraphQLClient(stub.url, {"Content-Type": "application/json"}, backoff_base=0.01)
+        try:
+            crawler = Crawler(client, CrawlState(str(tmp_path / "state.sqlite")), str(tmp_path / "professors.jsonl.gz"), page_size=3, **options)
+            return await crawler.run(SCHOOLS)
+        finally:
+            await client.aclose()
+
+    return asyncio.run(main())
+
+
+def test_every_page_of_every_school_is_written(stub, tmp_path):
+    summary = crawl(stub, tmp_path, rate=100)
+
+    assert summary["completed"] == 2 and summary["pages"] == 2 * PAGES and not summary["failed"]
+    records = list(iter_records(str(tmp_path / "professors.jsonl.gz")))
+    assert len(records) == summary["records"] == 2 * PAGES * 3
+    assert len({record["id"] for record in records}) == len(records)
+    # Each school follows its own cursor from the first page
+    assert sorted(stub.requests) == [(school_id, page) for school_id in SCHOOLS for page in range(PAGES)]
+
+
+def test_an_interrupted_school_resumes_from_its_checkpoint(stub, tmp_path):
+    stub.fail_pages = {(SCHOOLS[1], 2)}
+    first = crawl(stub, tmp_path, rate=100)
+    assert first["completed"] == 1 and list(first["failed"]) == [SCHOOLS[1]]
+
+    stub.requests.clear()
+    second = crawl(stub, tmp_path, rate=100)
+
+    assert second["skipped"] == 1 and second["completed"] == 1 and not second["failed"]
+    assert stub.requests == [(SCHOOLS[1], 2)]
+    records = list(iter_records(str(tmp_path / "professors.jsonl.gz")))
+    assert len({record["id"] for record in records}) == len(records) == 2 * PAGES * 3
+
+
+def test_requests_are_spaced_by_the_rate_limit(stub, tmp_path):
+    started = time.perf_counter()
+    summary = crawl(stub, tmp_path, rate=20, concurrency=1)
+
+    # A burst of one request, then one every 1/20 s
+    assert summary["pages"] == 2 * PAGES
+    assert time.perf_counter() - started >= (2 * PAGES - 1) / 20
+
+
+def test_rate_limiter_allows_a_burst_then_waits():
+    async def main():
+        limiter = RateLimiter(rate=50, burst=3)
+        started = time.perf_counter()
+        for _ in range(3):
+            await limiter.acquire()
+        burst = time.perf_counter() - started
+        for _ in range(5):
+            await limiter.acquire()
+        return burst, time.perf_counter() - started
+
+    burst, total = asyncio.run(main())
+    assert burst < 0.02
+    assert total >= 5 / 50 * 0.9
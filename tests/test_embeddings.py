@@ -0,0 +1,62 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from benchmarks.standins import SlowDeterministicEmbeddings
+from embeddings import BatchingEmbeddings, CachedEmbeddings
+
+
+class FailingEmbeddings(SlowDeterministicEmbeddings):
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        raise ConnectionError("embeddings unavailable")
+
+
+def test_concurrent_queries_share_one_call():
+    base = SlowDeterministicEmbeddings(latency=0.05)
+    embeddings = BatchingEmbeddings(base, window=0.05, max_batch=8)
+    texts = [f"question {i}" for i in range(8)]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        vectors = list(pool.map(embeddings.embed_query, texts))
+
+    assert vectors == [base.embed_query(text) for text in texts]
+    stats = embeddings.stats()
+    assert stats["texts"] == 8 and stats["batches"] < 8
+    assert base.requests - 8 == stats["batches"]
+
+
+def test_batches_are_capped_and_async_callers_get_their_own_vector():
+    base = SlowDeterministicEmbeddings()
+    embeddings = BatchingEmbeddings(base, window=0.05, max_batch=3)
+    texts = [f"question {i}" for i in range(7)]
+
+    async def main():
+        return await asyncio.gather(*(embeddings.aembed_query(text) for text in texts))
+
+    assert asyncio.run(main()) == base.embed_documents(texts)
+    stats = embeddings.stats()
+    assert stats["batches"] == 3 and stats["batch_size_histogram"] == {"<=1": 1, "<=4": 2}
+
+
+def test_a_failed_batch_fails_each_caller():
+    embeddings = BatchingEmbeddings(FailingEmbeddings(), window=0.01)
+
+    with pytest.raises(ConnectionError):
+        embeddings.embed_query("question")
+    assert embeddings.stats()["errors"] == 1
+
+
+def test_cached_vectors_are_not_embedded_again(tmp_path):
+    base = SlowDeterministicEmbeddings()
+    path = str(tmp_path / "embeddings.sqlite")
+    embeddings = CachedEmbeddings(base, path=path)
+
+    first = embeddings.embed_documents(["a", "b", "a"])
+    assert embeddings.embed_documents(["b", "c"])[0] == first[1]
+    assert base.requests == 2 and embeddings.stats()["misses"] == 3
+
+    # A new process starts with an empty memory tier and reads the disk tier
+    reopened = CachedEmbeddings(base, path=path)
+    assert reopened.embed_query("a") == first[0]
+    assert base.requests == 2 and reopened.stats()["disk_hits"] == 1
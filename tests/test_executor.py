@@ -0,0 +1,68 @@
+import asyncio
+import time
+
+from langchain.agents import BaseMultiActionAgent
+from langchain_core.agents import AgentAction, AgentFinish
+from langchain_core.tools import Tool
+
+from tools.executor import ParallelAgentExecutor
+
+
+class TwoCallsAgent(BaseMultiActionAgent):
+    """Asks for both tools in its first step, then finishes with their observations."""
+
+    @property
+    def input_keys(self):
+        return ["input"]
+
+    def plan(self, intermediate_steps, callbacks=None, **kwargs):
+        if intermediate_steps:
+            return AgentFinish({"output": [step[1] for step in intermediate_steps]}, "done")
+        return [AgentAction("first", "a", ""), AgentAction("second", "b", "")]
+
+    async def aplan(self, intermediate_steps, callbacks=None, **kwargs):
+        return self.plan(intermediate_steps, callbacks, **kwargs)
+
+
+def make_executor(second_delay: float, step_timeout: float = 5.0) -> ParallelAgentExecutor:
+    def slow(delay):
+        def call(query: str) -> str:
+            time.sleep(delay)
+            return f"done {query}"
+
+        async def acall(query: str) -> str:
+            await asyncio.sleep(delay)
+            return f"done {query}"
+
+        return call, acall
+
+    first, afirst = slow(0.2)
+    second, asecond = slow(second_delay)
+    tools = [
+        Tool(name="first", func=first, coroutine=afirst, description="first"),
+        Tool(name="second", func=second, coroutine=asecond, description="second"),
+    ]
+    return ParallelAgentExecutor(agent=TwoCallsAgent(), tools=tools, step_timeout=step_timeout)
+
+
+def test_tool_calls_of_one_step_run_concurrently():
+    executor = make_executor(second_delay=0.2)
+
+    started = time.perf_counter()
+    assert executor.invoke({"input": "x"})["output"] == ["done a", "done b"]
+    assert time.perf_counter() - started < 0.35
+
+    started = time.perf_counter()
+    assert asyncio.run(executor.ainvoke({"input": "x"}))["output"] == ["done a", "done b"]
+    assert time.perf_counter() - started < 0.35
+
+
+def test_a_call_missing_the_step_budget_becomes_an_error_observation():
+    executor = make_executor(second_delay=2.0, step_timeout=0.5)
+
+    started = time.perf_counter()
+    output = executor.invoke({"input": "x"})["output"]
+
+    assert output[0] == "done a" and "timed out" in output[1]["error"]
+    assert time.perf_counter() - started < 1.5
+    assert "timed out" in asyncio.run(executor.ainvoke({"input": "x"}))["output"][1]["error"]
@@ -0,0 +1,95 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import pytest
+import requests
+
+from benchmarks.standins import StubGraphQLServer
+from tools.http_client import GraphQLClient
+from tools.queries import QUERIES
+
+QUERY = QUERIES["GetProfessor"].document
+VARIABLES = {"text": "Sam", "schoolID": "U2Nob29sLTE="}
+
+
+@pytest.fixture
+def stub():
+    server = StubGraphQLServer().start()
+    yield server
+    server.stop()
+
+
+def make_client(stub, **options) -> GraphQLClient:
+    return GraphQLClient(stub.url, {"Content-Type": "application/json"}, backoff_base=0.01, **options)
+
+
+def test_retryable_failures_are_retried(stub):
+    client = make_client(stub)
+    stub.failures = 2
+
+    assert "data" in client.post(QUERY, VARIABLES)
+    assert client.stats["requests"] == 3 and client.stats["retries"] == 2
+
+    stub.failures = 3
+    with pytest.raises(requests.exceptions.HTTPError):
+        client.post(QUERY, VARIABLES)
+    client.close()
+
+
+def test_async_retries_give_up_after_max_retries(stub):
+    client = make_client(stub, max_retries=1)
+
+    async def main():
+        stub.failures = 1
+        answer = await client.apost(QUERY, VARIABLES)
+        stub.failures = 2
+        try:
+            with pytest.raises(httpx.HTTPError):
+                await client.apost(QUERY, VARIABLES)
+        finally:
+            await client.aclose()
+        return answer
+
+    assert "data" in asyncio.run(main())
+    assert client.stats["retries"] == 2 and client.stats["errors"] == 1
+
+
+def test_identical_in_flight_requests_are_coalesced(stub):
+    stub.latency = 0.1
+    client = make_client(stub)
+
+    async def main():
+        try:
+            return await asyncio.gather(*(client.apost(QUERY, VARIABLES) for _ in range(5)))
+        finally:
+            await client.aclose()
+
+    answers = asyncio.run(main())
+    assert all(answer == answers[0] for answer in answers)
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(lambda _: client.post(QUERY, VARIABLES), range(4)))
+
+    assert stub.stats["requests"] == 2
+    assert client.stats["coalesced"] == 7
+    client.close()
+
+
+def test_each_event_loop_gets_its_own_async_client(stub):
+    """Loops in other threads (e.g. a crawler run next to the server) neither share a client nor join requests."""
+    stub.latency = 0.1
+    client = make_client(stub)
+
+    async def fetch():
+        try:
+            return await client.apost(QUERY, VARIABLES)
+        finally:
+            await client.aclose()
+
+    with ThreadPoolExecutor(2) as pool:
+        answers = list(pool.map(lambda _: asyncio.run(fetch()), range(2)))
+    # Sequential loops: the second must not reuse the client bound to the first, now closed, loop
+    answers.append(asyncio.run(client.apost(QUERY, VARIABLES)))
+
+    assert all("data" in answer for answer in answers)
+    assert client.stats["coalesced"] == 0
@@ -0,0 +1,41 @@
+import io
+import json
+
+import pytest
+
+import ingest
+from benchmarks.standins import SlowDeterministicEmbeddings
+from vectorstore import NumpyVectorStore
+
+from conftest import REVIEWS_PATH
+
+
+def test_truncated_json_array_is_an_error():
+    assert list(ingest._iter_json_array(io.StringIO('[{"a": 1}, {"b": 2}]'))) == [{"a": 1}, {"b": 2}]
+    with pytest.raises(ValueError):
+        list(ingest._iter_json_array(io.StringIO('[{"a": 1}, {"b": 2}')))
+    with pytest.raises(ValueError):
+        list(ingest._iter_json_array(io.StringIO("")))
+
+
+def test_reingesting_an_edited_review_replaces_it(tmp_path, monkeypatch):
+    embeddings = SlowDeterministicEmbeddings()
+    monkeypatch.setattr(ingest, "build_embeddings", lambda: embeddings)
+    reviews = json.load(open(REVIEWS_PATH))
+    path = tmp_path / "reviews.json"
+    options = [
+        "--backend", "local", "--index-path", str(tmp_path / "index"), "--state", str(tmp_path / "state.sqlite"),
+        "--version-path", str(tmp_path / "version"), "--aggregates", str(tmp_path / "aggregates"),
+    ]
+
+    path.write_text(json.dumps(reviews))
+    assert ingest.main([str(path), *options])["upserted"] == len(reviews)
+
+    reviews[0]["comment"] = "Edited: tough grader but fair."
+    path.write_text(json.dumps(reviews))
+    summary = ingest.main([str(path), *options])
+
+    assert summary["upserted"] == 1 and summary["deleted"] == 1
+    store = NumpyVectorStore.load(str(tmp_path / "index"), embeddings)
+    assert len(store) == len(reviews)
+    assert any("Edited" in document.page_content for document in store.similarity_search("Jane Smith", k=len(reviews)))
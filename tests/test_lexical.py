@@ -0,0 +1,49 @@
+import pytest
+
+from lexical import LexicalIndex, reciprocal_rank_fusion
+
+
+@pytest.fixture
+def index():
+    return LexicalIndex.from_records([
+        {"professor_name": "Dr. Jane Smith", "course": "Intro to Biology", "comment": "Great lectures on cells."},
+        {"professor_name": "Dr. Jane Smith", "course": "Genetics", "comment": "Hard exams."},
+        {"professor_name": "Prof. Amy Hall", "course": "Calculus I", "comment": "Clear and patient."},
+        {"professor_name": "Dr. Mark Brown", "course": "Physics II", "comment": "Fun labs, tough grading."},
+    ])
+
+
+def test_exact_and_fuzzy_names_are_confident_hits(index):
+    match = index.match("Tell me about Dr. Jane Smith")
+    assert match.kind == "name" and match.value == "jane smith" and len(match.documents) == 2
+
+    assert index.match("how is jane smth?").value == "jane smith"
+    # Ranked by BM25 within the professor's reviews
+    assert "Hard exams" in index.match("Are Jane Smith's exams hard?").documents[0].page_content
+
+
+def test_last_name_needs_a_title_first_name_or_course(index):
+    assert index.match("Is Dr. Hall patient?").value == "amy hall"
+    assert index.match("Does Hall teach Calculus I well?").value == "amy hall"
+    assert index.match("is amy nice? I heard hall is great").value == "amy hall"
+
+
+def test_a_last_name_that_is_a_common_word_is_not_a_hit(index):
+    # "hall" is Prof. Amy Hall's last name, but here it is just a word
+    assert index.match_name("Which lecture hall is best for studying?") is None
+    assert index.match("Which lecture hall is best for studying?") is None
+
+
+def test_course_hits_and_bm25_search(index):
+    match = index.match("who teaches physics ii?")
+    assert match.kind == "course" and match.documents[0].metadata["professor_name"] == "Dr. Mark Brown"
+
+    assert index.search("tough grading labs", k=1)[0][0].metadata["professor_name"] == "Dr. Mark Brown"
+    assert index.match("something about the weather") is None
+
+
+def test_reciprocal_rank_fusion_counts_shared_documents_once(index):
+    documents = index.documents
+    fused = reciprocal_rank_fusion([documents[0], documents[1]], [documents[1], documents[2]], k=3)
+
+    assert fused == [documents[1], documents[0], documents[2]]
@@ -0,0 +1,36 @@
+import json
+import time
+
+from fastapi.testclient import TestClient
+
+from benchmarks.standins import FakeChatModel, SlowDeterministicEmbeddings
+
+
+def test_readiness_and_a_framed_answer_stream(make_agent, monkeypatch):
+    """The server starts serving before the agent is built, reports readiness, then streams framed answers."""
+    import main
+
+    monkeypatch.setattr(main, "agent_overrides", {"llm": FakeChatModel(answer_tokens=12), "embeddings": SlowDeterministicEmbeddings()})
+    client = TestClient(main.app)
+    # Without the startup event, nothing is warmed up yet
+    assert client.get("/healthz").json() == {"status": "ok"}
+    not_ready = client.get("/readyz")
+    assert not_ready.status_code == 503 and not_ready.json()["state"] == "pending"
+
+    with TestClient(main.app) as client:
+        deadline = time.monotonic() + 30
+        while client.get("/readyz").status_code != 200 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert client.get("/readyz").json()["state"] == "ready"
+
+        session_id = client.get("/").cookies["session_id"]
+        client.cookies.set("session_id", session_id)
+        with client.websocket_connect("/chat") as websocket:
+            websocket.send_text("How is Dr. Jane Smith?")
+            frames = [json.loads(websocket.receive_text())]
+            while not frames[-1]["end"]:
+                frames.append(json.loads(websocket.receive_text()))
+
+    assert {frame["id"] for frame in frames} == {1}
+    assert [frame["seq"] for frame in frames] == list(range(len(frames)))
+    assert "Smith" in "".join(frame["text"] for frame in frames)
@@ -0,0 +1,66 @@
+import asyncio
+
+from benchmarks.standins import FakeChatModel
+from metrics import LLM_TOKENS, Registry, finish_trace, llm_metrics, record_cache, render_stats, start_trace, timed
+
+
+def test_counters_and_histograms_render_in_the_text_format():
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests.", ("route",))
+    latency = registry.histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1))
+    requests.inc(("/chat",))
+    requests.inc(("/chat",), 2)
+    requests.inc(('say "hi"\n',))
+    for seconds in (0.05, 0.5, 5):
+        latency.observe(seconds, ("/chat",))
+
+    assert registry.render().splitlines() == [
+        "# HELP requests_total Requests.",
+        "# TYPE requests_total counter",
+        'requests_total{route="/chat"} 3',
+        'requests_total{route="say \\"hi\\"\\n"} 1',
+        "# HELP latency_seconds Latency.",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{route="/chat",le="0.1"} 1',
+        'latency_seconds_bucket{route="/chat",le="1"} 2',
+        'latency_seconds_bucket{route="/chat",le="+Inf"} 3',
+        'latency_seconds_sum{route="/chat"} 5.55',
+        'latency_seconds_count{route="/chat"} 3',
+    ]
+
+
+def test_stats_become_gauges():
+    stats = {"rmp cache": {"hits": 3, "hit_rate": 0.75, "path": "/tmp/cache"}, "ready": True, "missing": float("nan")}
+
+    assert render_stats(stats).splitlines() == [
+        "# TYPE rmp_rmp_cache_hits gauge",
+        "rmp_rmp_cache_hits 3",
+        "# TYPE rmp_rmp_cache_hit_rate gauge",
+        "rmp_rmp_cache_hit_rate 0.75",
+        "# TYPE rmp_ready gauge",
+        "rmp_ready 1",
+    ]
+    assert render_stats({"name": "no numbers"}) == ""
+
+
+def test_stages_cache_lookups_and_model_calls_land_in_the_trace():
+    async def turn():
+        trace = start_trace(session="s1")
+        with timed("graphql"):
+            await asyncio.sleep(0.01)
+        # Work handed to a thread still reports to the turn's trace
+        await asyncio.to_thread(record_cache, "embeddings", "hit", 2)
+        record_cache("embeddings", "miss", 0)
+        model = FakeChatModel(answer_tokens=5).with_config(tags=["answer"], callbacks=[llm_metrics])
+        await model.ainvoke("Who teaches Genetics?")
+        finish_trace(trace, "completed")
+        return trace.to_dict()
+
+    before = dict(LLM_TOKENS._values)
+    trace = asyncio.run(turn())
+
+    assert trace["session"] == "s1" and len(trace["trace_id"]) == 16
+    assert trace["stages"]["graphql"] >= 0.01
+    assert trace["cache"] == {"embeddings": {"hit": 2}}
+    assert trace["llm"]["answer"]["calls"] == 1 and trace["llm"]["answer"]["completion_tokens"] > 0
+    assert LLM_TOKENS._values[("answer", "completion")] > before.get(("answer", "completion"), 0)
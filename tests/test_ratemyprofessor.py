@@ -0,0 +1,40 @@
+import asyncio
+import json
+
+from tools import ratemyprofessor
+
+
+def test_university_professors_search_within_the_resolved_school(graphql):
+    result = ratemyprofessor.get_university_professors("Springfield", "Sam", limit=2)
+
+    school_id = result["universities"][0]["id"]
+    assert result["professors"] and len(result["professors"]) <= 2
+    # The teacher search is scoped to the school, not filtered after a search across every school
+    searches = [value for value in graphql[1].values() if isinstance(value, dict)]
+    assert searches and all(search["schoolID"] == school_id for search in searches)
+    assert len(graphql) == 2
+
+
+def test_university_professors_reuse_the_cached_school(graphql):
+    ratemyprofessor.get_university_professors("Springfield", "Sam")
+    result = asyncio.run(ratemyprofessor.aget_university_professors("Springfield", "Riley"))
+
+    assert result["professors"]
+    # Only the second teacher search reached the server
+    assert len(graphql) == 3
+    assert "Riley" in json.dumps(graphql[-1])
+
+
+def test_listeners_see_fetched_professors_once(graphql, monkeypatch):
+    notified = []
+    monkeypatch.setattr(ratemyprofessor, "professor_listeners", [notified.append])
+
+    first = ratemyprofessor.get_professor("Sam", limit=2)
+    # Served from the cache, and formatting is free of side effects
+    assert ratemyprofessor.get_professor("Sam", limit=2) == first
+    ratemyprofessor.format_professor_response({"data": {"newSearch": {"teachers": {"edges": []}}}}, 5)
+    asyncio.run(ratemyprofessor.aget_professors(["Riley", "Sam"], limit=2))
+    ratemyprofessor.get_university("Springfield")
+
+    assert len(notified) == 2 and len(graphql) == 3
+    assert {professor["legacyId"] for professor in first} <= {professor["legacyId"] for professor in notified[0]}
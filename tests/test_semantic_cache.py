@@ -0,0 +1,48 @@
+from langchain_core.documents import Document
+
+from semantic_cache import SemanticAnswerCache
+
+DOCUMENTS = [Document(page_content="Dr. Jane Smith: great lectures"), Document(page_content="Dr. Jane Smith: hard exams")]
+
+
+def test_exact_and_similar_questions_hit_for_the_same_documents():
+    cache = SemanticAnswerCache(threshold=0.95)
+    cache.store("How is Dr. Jane Smith?", DOCUMENTS, "She is great.", 1.5, vector=[1.0, 0.0])
+
+    assert cache.lookup("  how is dr. jane smith? ", DOCUMENTS[::-1]).answer == "She is great."
+    assert cache.lookup("Is Dr. Jane Smith good?", DOCUMENTS, vector=[0.99, 0.05]).answer == "She is great."
+    assert cache.lookup("Is Dr. Jane Smith good?", DOCUMENTS, vector=[0.0, 1.0]) is None
+    assert cache.lookup("How is Dr. Jane Smith?", DOCUMENTS[:1]) is None
+    assert cache.stats()["hits"] == 2 and cache.stats()["saved_seconds"] == 3.0
+
+
+def test_answers_are_only_reused_within_their_scope():
+    cache = SemanticAnswerCache()
+    cache.store("Is he strict?", DOCUMENTS, "Dr. Smith is strict.", 1.0, vector=[1.0, 0.0], scope="history-a")
+
+    assert cache.lookup("Is he strict?", DOCUMENTS, vector=[1.0, 0.0], scope="history-b") is None
+    assert cache.lookup("Is he strict?", DOCUMENTS, vector=[1.0, 0.0]) is None
+    assert cache.lookup("Is he strict?", DOCUMENTS, vector=[1.0, 0.0], scope="history-a") is not None
+
+
+def test_least_recently_used_entries_are_evicted_and_slots_reused():
+    cache = SemanticAnswerCache(max_entries=2)
+    cache.store("a", DOCUMENTS, "A", 1.0, vector=[1.0, 0.0])
+    cache.store("b", DOCUMENTS, "B", 1.0, vector=[0.0, 1.0])
+    cache.lookup("a", DOCUMENTS)
+    cache.store("c", DOCUMENTS, "C", 1.0, vector=[0.7, 0.7])
+
+    assert cache.lookup("b", DOCUMENTS) is None
+    assert cache.lookup("a", DOCUMENTS).answer == "A"
+    assert cache.lookup("x", DOCUMENTS, vector=[0.7, 0.72]).answer == "C"
+
+
+def test_a_new_index_version_clears_the_cache():
+    version = [1.0]
+    cache = SemanticAnswerCache(version=lambda: version[0], check_interval=0)
+    cache.store("a", DOCUMENTS, "A", 1.0)
+
+    assert cache.lookup("a", DOCUMENTS) is not None
+    version[0] = 2.0
+    assert cache.lookup("a", DOCUMENTS) is None
+    assert cache.stats()["invalidations"] == 1 and cache.stats()["entries"] == 0
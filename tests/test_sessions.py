@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from benchmarks.standins import FakeRedisServer
+from sessions import AI, HUMAN, MemorySessionStore, RedisError, RedisSessionStore, RespClient
+
+
+@pytest.fixture
+def redis():
+    server = FakeRedisServer().start()
+    yield server
+    server.stop()
+
+
+def run_redis(server, test, **options):
+    """Run `test(store)` against a RedisSessionStore on `server`, closing its client afterwards."""
+
+    async def main():
+        store = RedisSessionStore(RespClient(server.url), **options)
+        try:
+            return await test(store)
+        finally:
+            await store.close()
+
+    return asyncio.run(main())
+
+
+def test_redis_store_appends_loads_and_folds(redis):
+    async def test(store):
+        for i in range(3):
+            await store.append_turn("s", f"q{i}", f"a{i}")
+        session = await store.load("s")
+        await store.fold("s", session.start + 2, "asked q0")
+        return await store.load("s")
+
+    session = run_redis(redis, test)
+
+    assert session.turns == [(HUMAN, "q1"), (AI, "a1"), (HUMAN, "q2"), (AI, "a2")]
+    assert session.summary == "asked q0" and session.folded == 2 and session.start == 2
+
+
+@pytest.mark.parametrize("make_store", [MemorySessionStore, None], ids=["memory", "redis"])
+def test_fold_after_an_overflow_trim_keeps_unsummarized_messages(redis, make_store):
+    """Messages dropped by the overflow trim after the fold was planned are not counted twice."""
+
+    async def test(store):
+        for i in range(2):
+            await store.append_turn("s", f"q{i}", f"a{i}")
+        session = await store.load("s")
+        end = session.start + 2  # Fold q0/a0, planned before the next turn
+        await store.append_turn("s", "q2", "a2")  # Overflows: drops q0/a0
+        await store.fold("s", end, "asked q0")
+        return await store.load("s")
+
+    if make_store is None:
+        session = run_redis(redis, test, max_messages=4)
+    else:
+        session = asyncio.run(test(make_store(max_messages=4)))
+
+    assert session.turns == [(HUMAN, "q1"), (AI, "a1"), (HUMAN, "q2"), (AI, "a2")]
+    assert session.start == 2
+
+
+def test_watched_transaction_retries_after_a_concurrent_write(redis):
+    built = []
+
+    def build(state):
+        if not built:
+            redis.execute("RPUSH", "list", "concurrent")
+        built.append(state[0])
+        return [("LTRIM", "list", state[0], -1)]
+
+    async def main():
+        client = RespClient(redis.url)
+        await client.execute("RPUSH", "list", "a", "b")
+        try:
+            await client.watched_transaction(("list",), [("LLEN", "list")], build)
+            return await client.execute("LRANGE", "list", 0, -1)
+        finally:
+            await client.close()
+
+    assert asyncio.run(main()) == []
+    assert built == [2, 3] and redis.stats["aborted"] == 1
+
+
+def test_transaction_raises_errors_of_queued_commands(redis):
+    async def main():
+        client = RespClient(redis.url)
+        await client.execute("HSET", "meta", "summary", "text")
+        try:
+            await client.transaction(("HINCRBY", "meta", "summary", 1), ("HSET", "meta", "folded", 0))
+        finally:
+            await client.close()
+
+    with pytest.raises(RedisError, match="not an integer"):
+        asyncio.run(main())
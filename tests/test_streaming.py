@@ -0,0 +1,98 @@
+import asyncio
+import json
+
+from streaming import FrameWriter, SentinelFilter, StreamStats
+
+
+def stream(chunks: list[str], sentinel: str = "<END>") -> tuple[str, bool]:
+    sentinel_filter = SentinelFilter(sentinel)
+    emitted = ""
+    for chunk in chunks:
+        emitted += sentinel_filter.feed(chunk)
+        if sentinel_filter.found:
+            return emitted, True
+    return emitted + sentinel_filter.flush(), False
+
+
+def test_sentinel_split_across_chunks_is_never_emitted():
+    assert stream(["Dr. Smith <E", "N", "D> tail"]) == ("Dr. Smith ", True)
+    assert stream(["Dr. Smith <", "<END>"]) == ("Dr. Smith <", True)
+
+
+def test_held_back_text_is_flushed_when_no_sentinel_follows():
+    sentinel_filter = SentinelFilter("<END>")
+    assert sentinel_filter.feed("a <EN") == "a "
+    assert sentinel_filter.feed("D is not here") == "<END is not here"
+    assert stream(["ends with <E"]) == ("ends with <E", False)
+
+
+def run_writer(script, **options) -> list[dict]:
+    frames = []
+
+    async def send(text: str):
+        frames.append(json.loads(text))
+
+    async def main():
+        writer = FrameWriter(send, stream_id=7, **options)
+        await script(writer)
+
+    asyncio.run(main())
+    return frames
+
+
+def test_frames_flush_on_size_and_close_with_the_rest():
+    async def script(writer):
+        for token in ["abc", "def", "gh", "ij"]:
+            await writer.write(token)
+        await writer.close(" end")
+
+    frames = run_writer(script, max_bytes=5, max_delay=10)
+
+    assert frames == [
+        {"id": 7, "seq": 0, "text": "abcdef", "end": False},
+        {"id": 7, "seq": 1, "text": "ghij end", "end": True},
+    ]
+
+
+def test_frames_flush_after_the_delay():
+    async def script(writer):
+        await writer.write("Dr. ")
+        await writer.write("Smith")
+        await asyncio.sleep(0.05)
+        await writer.write(" teaches")
+        await writer.close()
+
+    frames = run_writer(script, max_bytes=1024, max_delay=0.01)
+
+    assert [frame["text"] for frame in frames] == ["Dr. Smith", " teaches"]
+    assert [frame["seq"] for frame in frames] == [0, 1] and frames[-1]["end"]
+
+
+def test_cancelled_streams_end_once():
+    stats = StreamStats()
+
+    async def script(writer):
+        await writer.write("partial")
+        await writer.close(cancelled=True)
+        await writer.close("late")
+        await writer.write("ignored")
+        writer.abort()
+
+    frames = run_writer(script, max_bytes=1024, max_delay=10, stats=stats)
+
+    assert frames == [{"id": 7, "seq": 0, "text": "partial", "end": True, "cancelled": True}]
+    summary = stats.stats()
+    assert summary["answers"] == 1 and summary["frames"] == 1 and summary["mean_frames_per_answer"] == 1.0
+
+
+def test_stream_stats_percentiles():
+    stats = StreamStats(window=3)
+    for ttfb, frames in [(0.5, 9), (0.1, 2), (0.2, 3), (0.3, 4)]:
+        stats.record(ttfb, frames)
+    stats.record(None, 1)
+
+    summary = stats.stats()
+    # Only the last three answers are in the window
+    assert summary["answers"] == 5 and summary["frames"] == 19
+    assert summary["ttfb_p50_ms"] == 200.0 and summary["ttfb_p95_ms"] == 200.0
+    assert summary["mean_frames_per_answer"] == round(8 / 3, 2)
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from benchmarks.standins import SlowDeterministicEmbeddings
+from vectorstore import NumpyVectorStore
+
+
+@pytest.fixture
+def store():
+    store = NumpyVectorStore(SlowDeterministicEmbeddings(size=8))
+    store.add_vectors(np.eye(3, 8), ["a", "b", "c"], [{"n": 1}, {"n": 2}, {"n": 3}], ids=["a", "b", "c"])
+    return store
+
+
+def test_search_ranks_by_cosine_similarity_and_filters(store):
+    query = [1.0, 0.5] + [0.0] * 6
+
+    assert [document.id for document in store.similarity_search_by_vector(query, k=2)] == ["a", "b"]
+    assert [document.id for document, _ in store.similarity_search_by_vector_with_score(query, k=3, filter={"n": {"$gte": 2}})] == ["b", "c"]
+    assert store.similarity_search_by_vector(query, k=0) == []
+
+
+def test_upsert_replaces_and_delete_keeps_rows_consistent(store):
+    store.add_vectors(np.eye(8)[[4]], ["a2"], ids=["a"])
+    assert len(store) == 3 and store.get_by_ids(["a"])[0].page_content == "a2"
+
+    store.delete(["a"])
+    # The last row moved into the hole: its id, text and vector still belong together
+    assert len(store) == 2
+    assert store.similarity_search_by_vector(np.eye(8)[2].tolist(), k=1)[0].page_content == "c"
+    assert store.get_by_ids(["a", "b", "c"])[1].id == "c"
+
+
+def test_delete_on_an_empty_store_keeps_the_dimension_unset():
+    store = NumpyVectorStore(SlowDeterministicEmbeddings(size=8))
+
+    assert store.delete(["x"]) is True
+    store.add_texts(["a"], ids=["a"])
+    assert store.dimension == 8 and len(store) == 1
+
+
+def test_snapshots_round_trip_and_memory_mapped_stores_accept_writes(store, tmp_path):
+    store.save(str(tmp_path / "index"))
+    loaded = NumpyVectorStore.load(str(tmp_path / "index"), store.embedding, mmap=True)
+
+    assert len(loaded) == 3 and loaded.get_by_ids(["b"])[0].metadata == {"n": 2}
+    loaded.add_texts(["d"], ids=["d"])
+    loaded.delete(["a"])
+    assert len(loaded) == 3 and len(NumpyVectorStore.load(str(tmp_path / "index"), store.embedding)) == 3
+    assert loaded.similarity_search("d", k=1)[0].id == "d"
@@ -0,0 +1,113 @@
+import asyncio
+
+from benchmarks.standins import SlowDeterministicEmbeddings
+from lexical import LexicalIndex
+from vectorstore import NumpyVectorStore
+from writeback import IndexWriteBack
+
+
+def professor(legacy_id: int) -> dict:
+    return {"legacyId": legacy_id, "firstName": "Sam", "lastName": f"Lee{legacy_id}", "avgRating": 4.0}
+
+
+def test_snapshot_is_taken_before_later_writes(tmp_path):
+    """The snapshot holds the batch that triggered it, even if more professors are added while it is written."""
+    embeddings = SlowDeterministicEmbeddings()
+    store = NumpyVectorStore(embeddings)
+
+    async def main():
+        writeback = IndexWriteBack(store, batch_size=2, debounce=0, snapshot_path=str(tmp_path / "index"))
+        save = NumpyVectorStore.save
+
+        def slow_save(snapshot, path):
+            # Another batch lands on the loop while the thread writes
+            asyncio.run_coroutine_threadsafe(store.aadd_texts(["late"], ids=["late"]), loop).result()
+            save(snapshot, path)
+
+        loop = asyncio.get_running_loop()
+        NumpyVectorStore.save = slow_save
+        try:
+            writeback.start()
+            writeback.submit([professor(1), professor(2)])
+            await asyncio.sleep(0.3)
+            await writeback.stop()
+        finally:
+            NumpyVectorStore.save = save
+
+    asyncio.run(main())
+
+    snapshot = NumpyVectorStore.load(str(tmp_path / "index"), embeddings)
+    assert len(snapshot) == 2 and len(store) == 3
+    for id_ in ("rmp-teacher-1", "rmp-teacher-2"):
+        document = snapshot.similarity_search_by_vector(embeddings.embed_query(snapshot.get_by_ids([id_])[0].page_content), k=1)[0]
+        assert document.id == id_
+
+
+def test_written_professors_are_remembered_up_to_a_bound():
+    store = NumpyVectorStore(SlowDeterministicEmbeddings())
+
+    async def main():
+        writeback = IndexWriteBack(store, batch_size=4, debounce=0, max_written=3)
+        writeback.start()
+        writeback.submit([professor(i) for i in range(5)])
+        await asyncio.sleep(0.3)
+        writeback.submit([professor(4)])
+        await writeback.stop()
+        return writeback
+
+    writeback = asyncio.run(main())
+
+    assert list(writeback._written) == [2, 3, 4]
+    assert writeback.counts["upserted"] == 5 and writeback.counts["duplicates"] == 1
+
+
+def test_rewritten_professors_replace_their_lexical_rows():
+    index = LexicalIndex.from_records([{"professor_name": "Dr. Jane Smith", "course": "Genetics", "comment": "Hard exams."}])
+    store = NumpyVectorStore(SlowDeterministicEmbeddings())
+
+    async def main():
+        # Remembers no written legacyId, so every resubmission is written again
+        writeback = IndexWriteBack(store, index, batch_size=4, debounce=0, max_written=0)
+        writeback.start()
+        for rating in (4.0, 2.5):
+            writeback.submit([dict(professor(1), avgRating=rating)])
+            await asyncio.sleep(0.2)
+        await writeback.stop()
+        return writeback
+
+    writeback = asyncio.run(main())
+
+    assert writeback.counts["upserted"] == 2
+    assert len(index) == 2 and len(store) == 1
+    documents = index.match("Dr. Sam Lee1").documents
+    assert len(documents) == 1 and "2.5" in documents[0].page_content
+
+
+def test_a_failed_batch_is_retried_once():
+    class FlakyStore:
+        def __init__(self, failures: int):
+            self.failures = failures
+            self.written = []
+
+        async def aadd_texts(self, texts, metadatas=None, ids=None):
+            if self.failures:
+                self.failures -= 1
+                raise ConnectionError("index unavailable")
+            self.written.extend(ids)
+
+    async def main(store):
+        writeback = IndexWriteBack(store, batch_size=4, debounce=0.01)
+        writeback.start()
+        writeback.submit([professor(1), professor(2)])
+        await asyncio.sleep(0.3)
+        await writeback.stop()
+        return writeback.counts
+
+    recovered = FlakyStore(failures=1)
+    counts = asyncio.run(main(recovered))
+    assert sorted(recovered.written) == ["rmp-teacher-1", "rmp-teacher-2"]
+    assert counts["retried"] == 2 and counts["failed"] == 0 and counts["upserted"] == 2
+
+    broken = FlakyStore(failures=10)
+    counts = asyncio.run(main(broken))
+    assert broken.written == [] and counts["retried"] == 2 and counts["failed"] == 2
@@ -0,0 +1,169 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from logging import getLogger
+from typing import Awaitable, Callable
+
+from metrics import record_stage
+
+logger = getLogger(__name__)
+
+BUSY_MESSAGE = (
+    "I'm handling a lot of lookups right now and can't search RateMyProfessors for you at the moment. "
+    "Please try again in a minute."
+)
+TIMEOUT_MESSAGE = (
+    "Searching RateMyProfessors took too long, so I stopped. "
+    "Please try again, or ask about fewer professors at once."
+)
+ERROR_MESSAGE = "Something went wrong while searching RateMyProfessors. Please try again."
+
+
+@dataclass
+class _Run:
+    task: asyncio.Task | None = None
+    waiters: int = 0
+    queued: bool = True
+
+
+class ToolAgentPool:
+    """
+    Admission control in front of the tool-calling agent.
+
+    At most `concurrency` agents run at once and at most `max_queue` more
+    wait for a slot; anything beyond that is rejected immediately with a
+    friendly message instead of piling up. Every run has a deadline
+    covering both its queue wait and its execution. A session that submits
+    the same message again while the first run is in flight shares that
+    run instead of launching a second agent; the run is cancelled only
+    when nobody is waiting for it any more, and a message arriving while
+    it is being cancelled starts a fresh run.
+    """
+
+    def __init__(self, run_tools: Callable[..., Awaitable[str]], concurrency: int = 4, max_queue: int = 16, deadline: float = 45.0):
+        """
+        Args:
+            run_tools (callable): Coroutine function answering (input, chat_history=...) with the tool agent.
+            concurrency (int): Maximum number of agents running at once.
+            max_queue (int): Maximum number of runs waiting for a slot.
+            deadline (float): Seconds a run may take, queue wait included.
+        """
+        self.run_tools = run_tools
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.deadline = deadline
+
+        self._slots = asyncio.Semaphore(concurrency)
+        self._runs: dict[tuple[str, str], _Run] = {}
+        self.active = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.started = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.counts = {"completed": 0, "rejected": 0, "timeouts": 0, "errors": 0, "deduplicated": 0, "cancelled": 0}
+
+    def saturated(self) -> bool:
+        """Return whether a new run would be rejected."""
+        return self.active + self.waiting >= self.concurrency + self.max_queue
+
+    async def run(self, input: str, chat_history: list, session_id: str | None = None) -> str:
+        """
+        Answer a message with the tool agent, subject to admission control.
+
+        Args:
+            input (str): The user message.
+            chat_history (list): The chat history messages.
+            session_id (str, optional): The session; identical in-flight messages of a session share one run.
+
+        Returns:
+            str: The agent's answer, or a message explaining why there is none.
+        """
+        key = (session_id, " ".join(input.split()).lower()) if session_id else None
+        run = self._runs.get(key) if key else None
+        if run is not None and (run.task.done() or run.task.cancelling()):
+            # Being torn down: joining it would only get the cancellation
+            run = None
+        if run is not None:
+            self.counts["deduplicated"] += 1
+        else:
+            if self.saturated():
+                self.counts["rejected"] += 1
+                logger.warning(f"Tool agent saturated ({self.active} running, {self.waiting} queued), shedding request")
+                return BUSY_MESSAGE
+            # Counted as queued right away, so a burst within one loop tick cannot overshoot the queue
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+            run = _Run()
+            run.task = asyncio.create_task(self._execute(run, input, chat_history))
+            run.task.add_done_callback(lambda _: self._dequeue(run))
+            if key:
+                self._runs[key] = run
+                run.task.add_done_callback(lambda _: self._runs.pop(key, None) if self._runs.get(key) is run else None)
+
+        run.waiters += 1
+        try:
+            return await asyncio.shield(run.task)
+        except asyncio.CancelledError:
+            # Only abandon the agent once every caller sharing it is gone
+            if run.waiters == 1 and not run.task.done():
+                run.task.cancel()
+                if key and self._runs.get(key) is run:
+                    del self._runs[key]
+            raise
+        finally:
+            run.waiters -= 1
+
+    def _dequeue(self, run: _Run):
+        if run.queued:
+            run.queued = False
+            self.waiting -= 1
+
+    async def _execute(self, run: _Run, input: str, chat_history: list) -> str:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        queued = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.deadline)
+        except asyncio.TimeoutError:
+            self.counts["timeouts"] += 1
+            return TIMEOUT_MESSAGE
+        finally:
+            self._dequeue(run)
+        waited = time.perf_counter() - queued
+        record_stage("tool_queue", waited)
+        self.started += 1
+        self.wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+        self.active += 1
+        try:
+            answer = await asyncio.wait_for(self.run_tools(input, chat_history=chat_history), max(0.0, deadline - loop.time()))
+            self.counts["completed"] += 1
+            return answer
+        except asyncio.TimeoutError:
+            self.counts["timeouts"] += 1
+            logger.warning(f"Tool agent run exceeded its {self.deadline}s deadline")
+            return TIMEOUT_MESSAGE
+        except asyncio.CancelledError:
+            # Every caller went away, e.g. the user disconnected or sent a new message
+            self.counts["cancelled"] += 1
+            raise
+        except Exception as e:
+            self.counts["errors"] += 1
+            logger.warning(f"Tool agent run failed: {e}")
+            return ERROR_MESSAGE
+        finally:
+            self.active -= 1
+            self._slots.release()
+
+    def stats(self) -> dict:
+        """Return queue depth, wait times and outcome counts."""
+        return {
+            **self.counts,
+            "active": self.active,
+            "queue_depth": self.waiting,
+            "max_queue_depth": self.max_waiting,
+            "mean_wait_seconds": round(self.wait_seconds / self.started, 4) if self.started else 0.0,
+            "max_wait_seconds": round(self.max_wait_seconds, 4),
+        }
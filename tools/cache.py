@@ -0,0 +1,282 @@
+import asyncio
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from logging import getLogger
+from typing import Any, Awaitable, Callable
+
+from metrics import record_cache
+
+logger = getLogger(__name__)
+
+# Free-text search variables, matched case-insensitively by the API; any other string
+# (e.g. a base64 schoolID) is an opaque, case-sensitive value and is kept as is
+TEXT_VARIABLES = frozenset({"text", "name"})
+
+
+def normalize_variables(value: Any, key: str | None = None) -> Any:
+    """
+    Normalize GraphQL variables so equivalent lookups share a cache key.
+
+    Free-text search strings (see `TEXT_VARIABLES`) are lower-cased with
+    surrounding and repeated whitespace removed; other values are kept as
+    they are. Dicts and lists are normalized recursively.
+    """
+    if isinstance(value, str):
+        return re.sub(r"\s+", " ", value).strip().lower() if key in TEXT_VARIABLES else value
+    if isinstance(value, dict):
+        return {k: normalize_variables(v, k) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [normalize_variables(v, key) for v in value]
+    return value
+
+
+def make_key(namespace: str, variables: dict) -> str:
+    """Build a cache key from an operation namespace and its query variables."""
+    return namespace + ":" + json.dumps(normalize_variables(variables), sort_keys=True, separators=(",", ":"))
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    size: int
+    fresh_until: float
+    stale_until: float
+
+
+class ResultCache:
+    """
+    An in-memory LRU cache with per-entry TTL and stale-while-revalidate.
+
+    Entries are fresh until their TTL expires; after that they are still
+    served for `stale_ttl` seconds while a single background refresh
+    replaces them. The cache is bounded both by entry count and by the
+    JSON-encoded size of its values. When `path` is given, entries are
+    written through to a SQLite file so a restarted worker starts warm.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 3600,
+        stale_ttl: float = 86400,
+        max_entries: int = 2048,
+        max_bytes: int = 32 * 1024 * 1024,
+        path: str | None = None,
+        should_cache: Callable[[Any], bool] | None = None,
+    ):
+        """
+        Args:
+            ttl (float): Default number of seconds an entry stays fresh.
+            stale_ttl (float): Extra seconds an expired entry may be served while it is refreshed.
+            max_entries (int): Maximum number of entries kept in memory.
+            max_bytes (int): Maximum total JSON size of the values kept in memory.
+            path (str, optional): SQLite file used as a persistent backing store.
+            should_cache (callable, optional): Predicate deciding whether a loaded value is stored.
+        """
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.should_cache = should_cache or (lambda value: True)
+
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self._refreshing: set[str] = set()
+        self._refresh_tasks: set[asyncio.Task] = set()
+        self._refresh_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cache-refresh")
+
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cache "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, fresh_until REAL NOT NULL, stale_until REAL NOT NULL)"
+            )
+            self._db.execute("DELETE FROM cache WHERE stale_until < ?", (time.time(),))
+            self._db.commit()
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.refreshes = 0
+
+    # Storage
+
+    def _lookup(self, key: str) -> CacheEntry | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+            if self._db is None:
+                return None
+            row = self._db.execute(
+                "SELECT value, fresh_until, stale_until FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, fresh_until, stale_until = row
+            entry = CacheEntry(json.loads(value), len(value), fresh_until, stale_until)
+            self._store(key, entry)
+            return entry
+
+    def _store(self, key: str, entry: CacheEntry):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.size
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+                self.evictions += 1
+
+    def set(self, key: str, value: Any, ttl: float | None = None):
+        """
+        Store a value.
+
+        Args:
+            key (str): The cache key.
+            value (Any): A JSON-serializable value.
+            ttl (float, optional): Seconds the entry stays fresh, defaults to the cache TTL.
+        """
+        encoded = json.dumps(value, separators=(",", ":"))
+        now = time.time()
+        fresh_until = now + (self.ttl if ttl is None else ttl)
+        entry = CacheEntry(value, len(encoded), fresh_until, fresh_until + self.stale_ttl)
+        with self._lock:
+            self._store(key, entry)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, fresh_until, stale_until) VALUES (?, ?, ?, ?)",
+                    (key, encoded, entry.fresh_until, entry.stale_until),
+                )
+                self._db.commit()
+
+    def get(self, key: str) -> Any | None:
+        """Return a fresh or stale value for `key`, or None."""
+        entry = self._lookup(key)
+        if entry is None or time.time() > entry.stale_until:
+            return None
+        return entry.value
+
+    def clear(self):
+        """Drop every entry from memory and from the persistent store."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM cache")
+                self._db.commit()
+
+    # Read-through API
+
+    def _begin_refresh(self, key: str) -> bool:
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            self.refreshes += 1
+            return True
+
+    def _end_refresh(self, key: str):
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def _classify(self, key: str) -> tuple[CacheEntry | None, bool]:
+        """Return the entry (if usable) and whether it is stale, updating counters."""
+        entry = self._lookup(key)
+        now = time.time()
+        if entry is None or now > entry.stale_until:
+            self.misses += 1
+            record_cache("rmp", "miss")
+            return None, False
+        if now <= entry.fresh_until:
+            self.hits += 1
+            record_cache("rmp", "hit")
+            return entry, False
+        self.stale_hits += 1
+        record_cache("rmp", "stale")
+        return entry, True
+
+    def _load(self, key: str, loader: Callable[[], Any], ttl: float | None):
+        value = loader()
+        if self.should_cache(value):
+            self.set(key, value, ttl)
+        return value
+
+    def get_or_load(self, key: str, loader: Callable[[], Any], ttl: float | None = None) -> Any:
+        """
+        Return the cached value for `key`, calling `loader` on a miss.
+
+        Stale entries are returned immediately and refreshed in a background thread.
+
+        Args:
+            key (str): The cache key.
+            loader (callable): Function producing the value.
+            ttl (float, optional): Seconds a newly loaded entry stays fresh.
+
+        Returns:
+            Any: The cached or freshly loaded value.
+        """
+        entry, stale = self._classify(key)
+        if entry is None:
+            return self._load(key, loader, ttl)
+        if stale and self._begin_refresh(key):
+            def refresh():
+                try:
+                    self._load(key, loader, ttl)
+                except Exception as e:
+                    logger.warning(f"Background refresh of {key} failed: {e}")
+                finally:
+                    self._end_refresh(key)
+            self._refresh_pool.submit(refresh)
+        return entry.value
+
+    async def aget_or_load(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: float | None = None) -> Any:
+        """
+        Asynchronously return the cached value for `key`, awaiting `loader` on a miss.
+
+        Stale entries are returned immediately and refreshed in a background task.
+        """
+        entry, stale = self._classify(key)
+        if entry is None:
+            value = await loader()
+            if self.should_cache(value):
+                self.set(key, value, ttl)
+            return value
+        if stale and self._begin_refresh(key):
+            async def refresh():
+                try:
+                    value = await loader()
+                    if self.should_cache(value):
+                        self.set(key, value, ttl)
+                except Exception as e:
+                    logger.warning(f"Background refresh of {key} failed: {e}")
+                finally:
+                    self._end_refresh(key)
+            task = asyncio.ensure_future(refresh())
+            self._refresh_tasks.add(task)
+            task.add_done_callback(self._refresh_tasks.discard)
+        return entry.value
+
+    def stats(self) -> dict:
+        """Return counters useful for sizing the cache."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "refreshes": self.refreshes,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
@@ -0,0 +1,274 @@
+"""
+Bulk crawler prefetching every professor of whole schools from RateMyProfessors.
+
+Usage:
+    python -m tools.crawler U2Nob29sLTEyMzQ= U2Nob29sLTU2Nzg= --output data/professors.jsonl.gz
+    python -m tools.crawler --schools-file partner-schools.txt --rate 5 --concurrency 8
+    python ingest.py data/professors.jsonl.gz --backend local
+
+Each school's teacher search is followed page by page through its cursor
+until RateMyProfessors reports no next page. Many schools are crawled at
+once, under a global request rate and a cap on requests in flight. Every
+page is appended to a gzipped JSONL file as its own gzip member, in the
+record format `ingest.py` consumes. A school's cursor is checkpointed in a
+SQLite state file once its page is written, so an interrupted crawl
+resumes where each school stopped. A page written just before a crash may
+be written again on resume; ingestion dedupes it by record id. --url
+points the crawler at another endpoint, such as a local stub server.
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import sqlite3
+import time
+from logging import basicConfig, getLogger
+
+from dotenv import load_dotenv
+
+from ingest import professor_record
+from tools.http_client import GraphQLClient
+from tools.queries import QUERIES
+from tools.ratemyprofessor import BASE_URL, HEADERS, format_professor_response
+
+logger = getLogger(__name__)
+
+
+class RateLimiter:
+    """Token bucket spacing requests to `rate` per second, allowing bursts of `burst`."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait until a request may be sent."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class CrawlState:
+    """SQLite-backed cursor checkpoint of each school."""
+
+    def __init__(self, path: str):
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS schools ("
+            "school_id TEXT PRIMARY KEY, cursor TEXT, pages INTEGER NOT NULL, records INTEGER NOT NULL, done INTEGER NOT NULL)"
+        )
+        self.db.commit()
+
+    def get(self, school_id: str) -> tuple[str | None, int, int, bool]:
+        """Return (cursor, pages, records, done) of a school; a fresh start if it was never crawled."""
+        row = self.db.execute(
+            "SELECT cursor, pages, records, done FROM schools WHERE school_id = ?", (school_id,)
+        ).fetchone()
+        if row is None:
+            return None, 0, 0, False
+        return row[0], row[1], row[2], bool(row[3])
+
+    def commit(self, school_id: str, cursor: str | None, pages: int, records: int, done: bool):
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO schools (school_id, cursor, pages, records, done) VALUES (?, ?, ?, ?, ?)",
+                (school_id, cursor, pages, records, int(done)),
+            )
+
+    def reset(self, school_id: str):
+        with self.db:
+            self.db.execute("DELETE FROM schools WHERE school_id = ?", (school_id,))
+
+
+class Crawler:
+    """Follow the teacher-search cursor of many schools concurrently."""
+
+    def __init__(
+        self,
+        client: GraphQLClient,
+        state: CrawlState,
+        output_path: str,
+        page_size: int = 100,
+        rate: float = 5.0,
+        concurrency: int = 8,
+        report_interval: float = 10.0,
+    ):
+        """
+        Args:
+            client (GraphQLClient): Client for the RateMyProfessors GraphQL endpoint.
+            state (CrawlState): Per-school cursor checkpoints.
+            output_path (str): Gzipped JSONL file the records are appended to.
+            page_size (int): Teachers requested per page.
+            rate (float): Maximum requests per second over all schools.
+            concurrency (int): Maximum requests in flight over all schools.
+            report_interval (float): Seconds between progress log lines.
+        """
+        self.client = client
+        self.state = state
+        self.output_path = output_path
+        self.page_size = page_size
+        self.concurrency = concurrency
+        self.report_interval = report_interval
+
+        self._limiter = RateLimiter(rate, burst=max(1, concurrency))
+        self._slots = asyncio.Semaphore(concurrency)
+        self._output = None
+
+        self.pages = 0
+        self.records = 0
+        self.failed: dict[str, str] = {}
+        self.completed = 0
+        self.skipped = 0
+        self._started = None
+
+    async def _fetch(self, school_id: str, cursor: str | None) -> dict:
+        await self._limiter.acquire()
+        async with self._slots:
+            response = await self.client.apost(
+                QUERIES["GetProfessorsByUniversityID"].document,
+                {"query": {"text": "", "schoolID": school_id}, "count": self.page_size, "cursor": cursor},
+            )
+        if response.get("errors"):
+            raise RuntimeError(response["errors"][0].get("message", "GraphQL error"))
+        return response
+
+    def _write(self, records: list[dict]):
+        if records:
+            lines = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+            # One gzip member per page: a concatenation of members is itself a valid gzip file
+            self._output.write(gzip.compress(lines.encode("utf-8")))
+            self._output.flush()
+
+    async def crawl_school(self, school_id: str):
+        """Crawl one school from its checkpoint until its last page."""
+        cursor, pages, records, done = self.state.get(school_id)
+        if done:
+            self.skipped += 1
+            return
+        try:
+            while True:
+                response = await self._fetch(school_id, cursor)
+                teachers = response.get("data", {}).get("newSearch", {}).get("teachers") or {}
+                professors = format_professor_response(response, len(teachers.get("edges") or []))
+                batch = [record for record in map(professor_record, professors) if record is not None]
+                self._write(batch)
+
+                page_info = teachers.get("pageInfo") or {}
+                cursor = page_info.get("endCursor") or cursor
+                done = not page_info.get("hasNextPage") or not professors
+                pages += 1
+                records += len(batch)
+                self.pages += 1
+                self.records += len(batch)
+                self.state.commit(school_id, cursor, pages, records, done)
+                if done:
+                    self.completed += 1
+                    logger.info(f"School {school_id}: {records} professors in {pages} pages")
+                    return
+        except Exception as e:
+            # The checkpoint keeps the last written page, so a rerun resumes from there
+            self.failed[school_id] = str(e)
+            logger.warning(f"School {school_id} failed after {pages} pages: {e}")
+
+    async def _report(self):
+        while True:
+            await asyncio.sleep(self.report_interval)
+            logger.info(f"Crawled {self.pages} pages, {self.records} professors ({self.pages_per_second():.2f} pages/s)")
+
+    def pages_per_second(self) -> float:
+        return self.pages / max(time.perf_counter() - self._started, 1e-9) if self._started else 0.0
+
+    async def run(self, school_ids: list[str]) -> dict:
+        """
+        Crawl every school, all of them concurrently under the global limits.
+
+        Args:
+            school_ids (list): RateMyProfessors school ids (the base64 `id`, e.g. "U2Nob29sLTEyMzQ=").
+
+        Returns:
+            dict: Summary of the crawl.
+        """
+        self._started = time.perf_counter()
+        os.makedirs(os.path.dirname(os.path.abspath(self.output_path)), exist_ok=True)
+        reporter = asyncio.create_task(self._report())
+        try:
+            with open(self.output_path, "ab") as self._output:
+                await asyncio.gather(*(self.crawl_school(school_id) for school_id in dict.fromkeys(school_ids)))
+        finally:
+            reporter.cancel()
+        elapsed = time.perf_counter() - self._started
+        return {
+            "schools": len(dict.fromkeys(school_ids)),
+            "completed": self.completed,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "pages": self.pages,
+            "records": self.records,
+            "seconds": round(elapsed, 3),
+            "pages_per_second": round(self.pages / max(elapsed, 1e-9), 2),
+        }
+
+
+def main(argv=None):
+    load_dotenv()
+    basicConfig(level="INFO", format="%(asctime)s %(levelname)s %(message)s")
+
+    parser = argparse.ArgumentParser(description="Prefetch every professor of whole schools from RateMyProfessors.")
+    parser.add_argument("schools", nargs="*", help="RateMyProfessors school ids")
+    parser.add_argument("--schools-file", help="File with one school id per line")
+    parser.add_argument("--output", default="data/professors.jsonl.gz", help="Gzipped JSONL file the records are appended to")
+    parser.add_argument("--state", default=os.getenv("CRAWL_STATE_PATH", "data/crawl-state.sqlite"), help="SQLite file with per-school checkpoints")
+    parser.add_argument("--url", default=BASE_URL, help="GraphQL endpoint, e.g. a local stub server")
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=5.0, help="Maximum requests per second over all schools")
+    parser.add_argument("--concurrency", type=int, default=8, help="Maximum requests in flight over all schools")
+    parser.add_argument("--report-interval", type=float, default=10.0, help="Seconds between progress log lines")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoints and crawl the schools from their first page")
+    args = parser.parse_args(argv)
+
+    school_ids = list(args.schools)
+    if args.schools_file:
+        with open(args.schools_file, "r", encoding="utf-8") as file:
+            school_ids += [line.strip() for line in file if line.strip() and not line.startswith("#")]
+    if not school_ids:
+        parser.error("no school ids given")
+
+    state = CrawlState(args.state)
+    if args.restart:
+        for school_id in school_ids:
+            state.reset(school_id)
+
+    async def crawl():
+        client = GraphQLClient(args.url, HEADERS, pool_size=args.concurrency)
+        try:
+            crawler = Crawler(
+                client,
+                state,
+                args.output,
+                page_size=args.page_size,
+                rate=args.rate,
+                concurrency=args.concurrency,
+                report_interval=args.report_interval,
+            )
+            return await crawler.run(school_ids)
+        finally:
+            await client.aclose()
+
+    summary = asyncio.run(crawl())
+    logger.info(f"Crawl finished: {json.dumps(summary)}")
+    return summary
+
+
+if __name__ == "__main__":
+    main()
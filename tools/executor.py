@@ -0,0 +1,78 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from logging import getLogger
+
+from langchain.agents import AgentExecutor
+from langchain_core.agents import AgentAction, AgentStep
+
+logger = getLogger(__name__)
+
+# Threads running the synchronous tool calls of one step side by side
+_tool_threads = ThreadPoolExecutor(max_workers=16, thread_name_prefix="tool-call")
+
+# Actions of the step currently being executed by each thread calling the sync executor
+_step = threading.local()
+
+
+class ParallelAgentExecutor(AgentExecutor):
+    """
+    AgentExecutor that runs the independent tool calls of one step concurrently.
+
+    The async path already gathers a step's tool calls; this adds a time
+    budget per step. The sync path, which AgentExecutor runs one call after
+    another, submits all calls of the step to a thread pool at once. A call
+    that misses the step budget is answered with an error observation so
+    the agent can still finish with what it has.
+    """
+
+    step_timeout: float = 15.0
+    """Seconds the tool calls of one agent step may take together."""
+
+    def _timeout_step(self, agent_action: AgentAction) -> AgentStep:
+        logger.warning(f"Tool {agent_action.tool} exceeded the {self.step_timeout}s step budget")
+        return AgentStep(action=agent_action, observation={"error": f"{agent_action.tool} timed out after {self.step_timeout}s"})
+
+    def _iter_next_step(self, name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager=None):
+        # AgentExecutor yields every action of the step before performing any of them,
+        # so by the first _perform_agent_action call the whole step is known
+        _step.actions = []
+        _step.futures = None
+        try:
+            for item in super()._iter_next_step(name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager):
+                if isinstance(item, AgentAction):
+                    _step.actions.append(item)
+                yield item
+        finally:
+            _step.actions = []
+            _step.futures = None
+
+    def _perform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None) -> AgentStep:
+        perform = super()._perform_agent_action
+        if getattr(_step, "futures", None) is None:
+            actions = getattr(_step, "actions", None) or [agent_action]
+            _step.deadline = time.monotonic() + self.step_timeout
+            _step.futures = {
+                id(action): _tool_threads.submit(perform, name_to_tool_map, color_mapping, action, run_manager)
+                for action in actions
+            }
+        future = _step.futures.get(id(agent_action))
+        if future is None:
+            return perform(name_to_tool_map, color_mapping, agent_action, run_manager)
+        try:
+            return future.result(timeout=max(0.0, _step.deadline - time.monotonic()))
+        except FutureTimeoutError:
+            future.cancel()
+            return self._timeout_step(agent_action)
+
+    async def _aperform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None) -> AgentStep:
+        # The calls of a step are gathered, so they all start together and share this budget
+        try:
+            return await asyncio.wait_for(
+                super()._aperform_agent_action(name_to_tool_map, color_mapping, agent_action, run_manager),
+                self.step_timeout,
+            )
+        except asyncio.TimeoutError:
+            return self._timeout_step(agent_action)
@@ -0,0 +1,294 @@
+import asyncio
+import json
+import random
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+from hashlib import sha256
+from logging import getLogger
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = getLogger(__name__)
+
+# Status codes that are worth retrying: rate limiting and transient upstream failures
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+
+class RetryableStatusError(Exception):
+    """Raised internally when the upstream answers with a retryable status code."""
+
+    def __init__(self, status_code: int, retry_after: float | None = None):
+        super().__init__(f"Upstream responded with HTTP {status_code}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def _parse_retry_after(value: str | None) -> float | None:
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        return None
+
+
+class _LoopState:
+    """The async client and in-flight requests of one event loop."""
+
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+        self.inflight: dict[str, asyncio.Task] = {}
+        self.awaiters: dict[asyncio.Task, int] = {}
+
+
+class GraphQLClient:
+    """
+    A shared HTTP client for a single GraphQL endpoint.
+
+    The client keeps a pooled keep-alive session (and an async counterpart),
+    applies connect/read timeouts, retries 429/5xx responses and connection
+    errors with jittered exponential backoff, and coalesces identical
+    in-flight requests so that concurrent callers asking for the same
+    query and variables share one upstream round trip. Async clients and
+    in-flight requests are bound to an event loop, so each loop using the
+    client gets its own.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        headers: dict,
+        connect_timeout: float = 3.05,
+        read_timeout: float = 10.0,
+        max_retries: int = 2,
+        backoff_base: float = 0.25,
+        backoff_max: float = 4.0,
+        pool_size: int = 20,
+    ):
+        """
+        Args:
+            url (str): The GraphQL endpoint.
+            headers (dict): Headers sent with every request.
+            connect_timeout (float): Seconds to wait for a connection.
+            read_timeout (float): Seconds to wait for the response.
+            max_retries (int): Retries after the first attempt on retryable failures.
+            backoff_base (float): Base delay in seconds for the exponential backoff.
+            backoff_max (float): Upper bound for a single backoff delay.
+            pool_size (int): Maximum number of pooled connections.
+        """
+        self.url = url
+        self.headers = dict(headers)
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.pool_size = pool_size
+
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._loops: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopState] = weakref.WeakKeyDictionary()
+
+        self._inflight: dict[str, Future] = {}
+        self._inflight_lock = threading.Lock()
+
+        self.stats = {"requests": 0, "retries": 0, "coalesced": 0, "errors": 0, "cancelled": 0}
+
+    # Helpers
+
+    @staticmethod
+    def request_key(query: str, variables: dict) -> str:
+        """Return a stable key identifying a query and its variables."""
+        payload = json.dumps({"query": query, "variables": variables}, sort_keys=True, separators=(",", ":"))
+        return sha256(payload.encode("utf-8")).hexdigest()
+
+    def _backoff(self, attempt: int, retry_after: float | None = None) -> float:
+        """Full-jitter exponential backoff, honouring Retry-After when given."""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    def _get_session(self) -> requests.Session:
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    session.headers.update(self.headers)
+                    self._session = session
+        return self._session
+
+    def _loop_state(self) -> _LoopState:
+        """Return the async client and in-flight requests of the running loop, creating them on first use."""
+        loop = asyncio.get_running_loop()
+        state = self._loops.get(loop)
+        if state is None:
+            # Clients of closed loops can no longer be closed properly; just let them go
+            for closed in [other for other in self._loops if other.is_closed()]:
+                del self._loops[closed]
+            state = self._loops[loop] = _LoopState(httpx.AsyncClient(
+                headers=self.headers,
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+            ))
+        return state
+
+    # Sync API
+
+    def post(self, query: str, variables: dict) -> dict:
+        """
+        Send a GraphQL request, sharing the upstream call with identical in-flight requests.
+
+        Args:
+            query (str): The GraphQL query string.
+            variables (dict): The variables for the GraphQL query.
+
+        Returns:
+            dict: The decoded JSON response.
+
+        Raises:
+            requests.exceptions.RequestException: If the request still fails after all retries.
+        """
+        key = self.request_key(query, variables)
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self.stats["coalesced"] += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = self._post_with_retries(query, variables)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+
+    def _post_with_retries(self, query: str, variables: dict) -> dict:
+        session = self._get_session()
+        payload = json.dumps({"query": query, "variables": variables})
+        attempt = 0
+        while True:
+            self.stats["requests"] += 1
+            try:
+                response = session.post(
+                    self.url, data=payload, timeout=(self.connect_timeout, self.read_timeout)
+                )
+                if response.status_code in RETRY_STATUS_CODES:
+                    raise RetryableStatusError(
+                        response.status_code, _parse_retry_after(response.headers.get("Retry-After"))
+                    )
+                response.raise_for_status()
+                return response.json()
+            except (RetryableStatusError, requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt >= self.max_retries:
+                    self.stats["errors"] += 1
+                    if isinstance(e, RetryableStatusError):
+                        raise requests.exceptions.HTTPError(str(e)) from e
+                    raise
+                delay = self._backoff(attempt, getattr(e, "retry_after", None))
+                logger.warning(f"GraphQL request failed ({e}); retrying in {delay:.2f}s")
+                self.stats["retries"] += 1
+                attempt += 1
+                time.sleep(delay)
+            except requests.exceptions.RequestException:
+                self.stats["errors"] += 1
+                raise
+
+    # Async API
+
+    async def apost(self, query: str, variables: dict) -> dict:
+        """
+        Asynchronously send a GraphQL request, sharing identical in-flight requests.
+
+        Args:
+            query (str): The GraphQL query string.
+            variables (dict): The variables for the GraphQL query.
+
+        Returns:
+            dict: The decoded JSON response.
+
+        Raises:
+            httpx.HTTPError: If the request still fails after all retries.
+        """
+        key = self.request_key(query, variables)
+        state = self._loop_state()
+        task = state.inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._apost_with_retries(state.client, query, variables))
+            state.inflight[key] = task
+            task.add_done_callback(lambda _: state.inflight.pop(key, None))
+        else:
+            self.stats["coalesced"] += 1
+        # Shield the shared task so that one cancelled caller does not fail the others,
+        # but abandon the upstream request once every caller sharing it is gone
+        awaiters = state.awaiters
+        awaiters[task] = awaiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if awaiters[task] == 1 and not task.done():
+                task.cancel()
+                self.stats["cancelled"] += 1
+            raise
+        finally:
+            awaiters[task] -= 1
+            if not awaiters[task]:
+                del awaiters[task]
+
+    async def _apost_with_retries(self, client: httpx.AsyncClient, query: str, variables: dict) -> dict:
+        payload = {"query": query, "variables": variables}
+        attempt = 0
+        while True:
+            self.stats["requests"] += 1
+            try:
+                response = await client.post(self.url, json=payload)
+                if response.status_code in RETRY_STATUS_CODES:
+                    raise RetryableStatusError(
+                        response.status_code, _parse_retry_after(response.headers.get("Retry-After"))
+                    )
+                response.raise_for_status()
+                return response.json()
+            except (RetryableStatusError, httpx.TransportError) as e:
+                if attempt >= self.max_retries:
+                    self.stats["errors"] += 1
+                    if isinstance(e, RetryableStatusError):
+                        raise httpx.HTTPError(str(e)) from e
+                    raise
+                delay = self._backoff(attempt, getattr(e, "retry_after", None))
+                logger.warning(f"GraphQL request failed ({e!r}); retrying in {delay:.2f}s")
+                self.stats["retries"] += 1
+                attempt += 1
+                await asyncio.sleep(delay)
+            except httpx.HTTPError:
+                self.stats["errors"] += 1
+                raise
+
+    def close(self):
+        """Close the pooled sync session."""
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    async def aclose(self):
+        """Close the pooled async client of the running loop."""
+        state = self._loops.pop(asyncio.get_running_loop(), None)
+        if state is not None:
+            await state.client.aclose()
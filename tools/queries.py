@@ -0,0 +1,140 @@
+import os
+import re
+from dataclasses import dataclass
+
+# Tokens of a GraphQL document: strings, names/numbers/variables, spread and punctuators
+_TOKEN_RE = re.compile(r'"(?:\\.|[^"\\])*"|\.\.\.|\$?[_A-Za-z0-9.\-]+|[!$&():=@\[\]{|}]')
+_WORD_RE = re.compile(r'^[$_A-Za-z0-9.\-"]')
+_VARIABLE_RE = re.compile(r"\$([_A-Za-z][_A-Za-z0-9]*)")
+_DEFINITION_RE = re.compile(r"\$([_A-Za-z][_A-Za-z0-9]*):([^$,]+)")
+_HEADER_RE = re.compile(r"^(query|mutation)\s*([_A-Za-z][_A-Za-z0-9]*)?\s*(?:\((.*?)\))?\s*\{", re.S)
+
+
+def minify(document: str) -> str:
+    """
+    Minify a GraphQL document by dropping comments and insignificant whitespace.
+
+    Args:
+        document (str): The GraphQL document.
+
+    Returns:
+        str: An equivalent, compact document.
+    """
+    document = re.sub(r'#[^\n]*', "", document)
+    tokens = _TOKEN_RE.findall(document)
+    parts = []
+    for i, token in enumerate(tokens):
+        # A space is only needed between two adjacent name-like tokens
+        if i and _WORD_RE.match(token) and _WORD_RE.match(tokens[i - 1]):
+            parts.append(" ")
+        parts.append(token)
+    return "".join(parts)
+
+
+@dataclass(frozen=True)
+class GraphQLOperation:
+    """A preloaded GraphQL operation split into its variable definitions and selection set."""
+
+    name: str
+    document: str
+    variables: dict[str, str]
+    selection: str
+
+    @classmethod
+    def parse(cls, document: str) -> "GraphQLOperation":
+        document = minify(document)
+        match = _HEADER_RE.match(document)
+        if match is None or not document.endswith("}"):
+            raise ValueError("Only single, named query operations are supported")
+        variables = dict(_DEFINITION_RE.findall(match.group(3) or ""))
+        selection = document[match.end():-1]
+        return cls(match.group(2) or "Query", document, variables, selection)
+
+    def aliased(self, alias: str) -> tuple[dict[str, str], str]:
+        """
+        Return this operation's variable definitions and selection with every
+        variable prefixed by `alias` and the top-level field aliased as `alias`.
+        """
+        variables = {f"{alias}_{name}": type_ for name, type_ in self.variables.items()}
+        selection = _VARIABLE_RE.sub(lambda m: f"${alias}_{m.group(1)}", self.selection)
+        return variables, f"{alias}:{selection}"
+
+
+def load_operation(file_name: str) -> GraphQLOperation:
+    """
+    Load and parse a GraphQL operation stored next to this module.
+
+    Args:
+        file_name (str): The name of the .graphql file.
+
+    Returns:
+        GraphQLOperation: The parsed, minified operation.
+    """
+    path = os.path.join(os.path.dirname(os.path.realpath(__file__)), file_name)
+    with open(path, "r", encoding="utf-8") as file:
+        return GraphQLOperation.parse(file.read())
+
+
+# Registry of the operations used by the tools, loaded and minified once at import
+QUERIES = {
+    "GetProfessor": load_operation("search_professor_by_name.graphql"),
+    "GetUniversity": load_operation("search_university_by_name.graphql"),
+    "GetProfessorsByUniversityID": load_operation("search_teachers_by_school_id.graphql"),
+}
+
+
+def fuse(requests: list[tuple[str, dict]]) -> tuple[str, dict]:
+    """
+    Fuse several registered operations into a single aliased GraphQL request.
+
+    Args:
+        requests (list): (operation name, variables) pairs. Each one is aliased `op<index>`.
+
+    Returns:
+        tuple: The fused query document and its merged variables.
+    """
+    definitions = {}
+    selections = []
+    variables = {}
+    for index, (operation_name, operation_variables) in enumerate(requests):
+        alias = f"op{index}"
+        operation_definitions, selection = QUERIES[operation_name].aliased(alias)
+        definitions.update(operation_definitions)
+        selections.append(selection)
+        variables.update({f"{alias}_{name}": value for name, value in operation_variables.items()})
+    header = ",".join(f"${name}:{type_}" for name, type_ in definitions.items())
+    query = f"query FusedSearchQuery({header}){{{' '.join(selections)}}}"
+    return query, variables
+
+
+def split_fused_response(response: dict, count: int) -> list[dict]:
+    """
+    Split the response of a fused request back into one response per operation.
+
+    Each part has the same shape as the response of the standalone operation,
+    so the existing formatters can be reused. Transport errors are copied to
+    every part and GraphQL errors are routed to the operation they belong to.
+
+    Args:
+        response (dict): The response of the fused request.
+        count (int): The number of fused operations.
+
+    Returns:
+        list: One response dict per operation, in request order.
+    """
+    if "error" in response:
+        return [{"error": response["error"]} for _ in range(count)]
+
+    data = response.get("data") or {}
+    errors = response.get("errors") or []
+    parts = []
+    for index in range(count):
+        alias = f"op{index}"
+        part = {}
+        if data.get(alias) is not None:
+            part["data"] = {"newSearch": data[alias]}
+        part_errors = [error for error in errors if (error.get("path") or [None])[0] in (alias, None)]
+        if part_errors:
+            part["errors"] = part_errors
+        parts.append(part)
+    return parts
@@ -0,0 +1,66 @@
+from langchain.pydantic_v1 import BaseModel, Field
+from langchain_core.tools import StructuredTool
+
+from aggregates import MAX_TOP_K, METRICS, ProfessorAggregates
+from compaction import ContextCompactor
+
+
+class RankProfessorsArgs(BaseModel):
+    metric: str = Field("overall_rating", title=f"The metric to rank by: {', '.join(METRICS)}.")
+    k: int = Field(5, title=f"The number of professors to return (at most {MAX_TOP_K}).")
+    ascending: bool = Field(False, title="Rank from the lowest value, e.g. the hardest professors by easiness.")
+    course: str | None = Field(None, title="Only rank on reviews of courses whose name contains this text.")
+    school: str | None = Field(None, title="Only rank professors of schools whose name contains this text.")
+    department: str | None = Field(None, title="Only rank professors of departments whose name contains this text.")
+    min_ratings: int = Field(1, title="The minimum number of ratings of a professor.")
+
+
+def make_ranking_tool(aggregates: ProfessorAggregates, compactor: ContextCompactor | None = None) -> StructuredTool:
+    """
+    Build the RankProfessors tool over the precomputed review aggregates.
+
+    The ranking runs in-process over every ingested review, so the agent
+    gets the winning rows as a table instead of searching professor by
+    professor.
+
+    Args:
+        aggregates (ProfessorAggregates): The aggregates to rank.
+        compactor (ContextCompactor, optional): Renders the rows; defaults to a 600-token table.
+
+    Returns:
+        StructuredTool: The tool, for `tools.ratemyprofessor.get_agent_executor(extra_tools=...)`.
+    """
+    compactor = compactor or ContextCompactor(name="ranking")
+
+    def rank_professors(
+        metric: str = "overall_rating",
+        k: int = 5,
+        ascending: bool = False,
+        course: str | None = None,
+        school: str | None = None,
+        department: str | None = None,
+        min_ratings: int = 1,
+    ):
+        try:
+            rows = aggregates.query(metric, min(k, MAX_TOP_K), ascending, course, school, department, min_ratings)
+        except ValueError as e:
+            return {"error": str(e)}
+        if not rows:
+            return {"error": "No professors match these filters."}
+        # One row per professor, or per (professor, course) with a course filter: already aggregated
+        return compactor.render(rows, merge=False)
+
+    async def arank_professors(**kwargs):
+        return rank_professors(**kwargs)
+
+    return StructuredTool.from_function(
+        func=rank_professors,
+        coroutine=arank_professors,
+        name="RankProfessors",
+        description=(
+            "Rank the professors of the internal database by their average rating, clarity, helpfulness "
+            "or easiness, optionally within a course, school or department. Use it for questions like "
+            "'best', 'easiest' or 'top 5' professors."
+        ),
+        args_schema=RankProfessorsArgs,
+    )
@@ -1,11 +1,22 @@
+import httpx
 import requests
-import json
 import os
+import threading
+from functools import wraps
 from dotenv import load_dotenv
+from logging import getLogger
+
+from compaction import ContextCompactor
+from metrics import llm_metrics, timed
+from tools.cache import ResultCache, make_key
+from tools.http_client import GraphQLClient
+from tools.queries import QUERIES, fuse, split_fused_response
 
 # Load environment variables
 load_dotenv()
 
+logger = getLogger(__name__)
+
 # Base URL for the requests
 BASE_URL = "https://www.ratemyprofessors.com/graphql"
 AUTHORIZATION = os.getenv("RMP_AUTHORIZATION")  # Load Authorization token from .env
@@ -28,25 +39,70 @@ HEADERS = {
     "sec-ch-ua-platform": "\"Windows\""
 }
 
-def load_query_from_file(file_path: str) -> str:
+# HTTP client settings
+RMP_CONNECT_TIMEOUT = float(os.getenv("RMP_CONNECT_TIMEOUT", "3.05"))
+RMP_READ_TIMEOUT = float(os.getenv("RMP_READ_TIMEOUT", "10"))
+RMP_MAX_RETRIES = int(os.getenv("RMP_MAX_RETRIES", "2"))
+RMP_POOL_SIZE = int(os.getenv("RMP_POOL_SIZE", "20"))
+TOOL_AGENT_VERBOSE = os.getenv("TOOL_AGENT_VERBOSE", "false").lower() == "true"
+TOOL_AGENT_MAX_ITERATIONS = int(os.getenv("TOOL_AGENT_MAX_ITERATIONS", "6"))
+TOOL_AGENT_MAX_EXECUTION_TIME = float(os.getenv("TOOL_AGENT_MAX_EXECUTION_TIME", "40"))
+TOOL_STEP_TIMEOUT = float(os.getenv("TOOL_STEP_TIMEOUT", "15"))
+TOOL_RESULT_MAX_TOKENS = int(os.getenv("TOOL_RESULT_MAX_TOKENS", "800"))
+
+# Shared, pooled client used by every tool call
+client = GraphQLClient(
+    BASE_URL,
+    HEADERS,
+    connect_timeout=RMP_CONNECT_TIMEOUT,
+    read_timeout=RMP_READ_TIMEOUT,
+    max_retries=RMP_MAX_RETRIES,
+    pool_size=RMP_POOL_SIZE,
+)
+
+# Result cache settings
+RMP_CACHE_TTL = float(os.getenv("RMP_CACHE_TTL", "3600"))
+RMP_CACHE_STALE_TTL = float(os.getenv("RMP_CACHE_STALE_TTL", "86400"))
+RMP_CACHE_MAX_ENTRIES = int(os.getenv("RMP_CACHE_MAX_ENTRIES", "2048"))
+RMP_CACHE_MAX_BYTES = int(os.getenv("RMP_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+RMP_CACHE_PATH = os.getenv("RMP_CACHE_PATH")  # Optional SQLite file to keep the cache across restarts
+
+# Callables notified with the professors of every teacher search fetched from the network (e.g. the
+# index write-back); cache hits are not notified again. Called from whichever thread fetched the
+# response, so they must be thread-safe and must not block.
+professor_listeners = []
+
+# Cache of upstream responses keyed by operation and normalized variables.
+# Error responses are never stored.
+cache = ResultCache(
+    ttl=RMP_CACHE_TTL,
+    stale_ttl=RMP_CACHE_STALE_TTL,
+    max_entries=RMP_CACHE_MAX_ENTRIES,
+    max_bytes=RMP_CACHE_MAX_BYTES,
+    path=RMP_CACHE_PATH,
+    should_cache=lambda response: "error" not in response and "errors" not in response,
+)
+
+def send_graphql_request(query: str, variables: dict):
     """
-    Load a GraphQL query from a file.
+    Send a GraphQL request to the RateMyProfessors API.
 
     Args:
-        file_path (str): The path to the file containing the GraphQL query.
+        query (str): The GraphQL query string.
+        variables (dict): The variables for the GraphQL query.
 
     Returns:
-        str: The GraphQL query as a string.
+        dict: The response from the API in JSON format, or an error message.
     """
-    
-    current_path = os.path.dirname(os.path.realpath(__file__))
-    file_path = os.path.join(current_path, file_path)
-    with open(file_path, 'r', encoding="utf-8") as file:
-        return file.read()
+    try:
+        with timed("graphql"):
+            return client.post(query, variables)
+    except requests.exceptions.RequestException as e:
+        return {"error": str(e)}
 
-def send_graphql_request(query: str, variables: dict):
+async def asend_graphql_request(query: str, variables: dict):
     """
-    Send a GraphQL request to the RateMyProfessors API.
+    Asynchronously send a GraphQL request to the RateMyProfessors API.
 
     Args:
         query (str): The GraphQL query string.
@@ -55,18 +111,75 @@ def send_graphql_request(query: str, variables: dict):
     Returns:
         dict: The response from the API in JSON format, or an error message.
     """
-    payload = {
-        "query": query,
-        "variables": variables
-    }
-
     try:
-        response = requests.post(BASE_URL, headers=HEADERS, data=json.dumps(payload))
-        response.raise_for_status()  # Raises an error for bad responses
-        return response.json()
-    except requests.exceptions.RequestException as e:
+        with timed("graphql"):
+            return await client.apost(query, variables)
+    except httpx.HTTPError as e:
         return {"error": str(e)}
 
+def cached_graphql_request(operation: str, query: str, variables: dict):
+    """
+    Send a GraphQL request through the result cache.
+
+    Args:
+        operation (str): A name for the operation, used to namespace the cache key.
+        query (str): The GraphQL query string.
+        variables (dict): The variables for the GraphQL query.
+
+    Returns:
+        dict: The (possibly cached) response from the API, or an error message.
+    """
+    return cache.get_or_load(make_key(operation, variables), lambda: _fetched(send_graphql_request(query, variables)))
+
+async def acached_graphql_request(operation: str, query: str, variables: dict):
+    """
+    Asynchronously send a GraphQL request through the result cache. See `cached_graphql_request`.
+    """
+    async def load():
+        return _fetched(await asend_graphql_request(query, variables))
+
+    return await cache.aget_or_load(make_key(operation, variables), load)
+
+def _fused_misses(operations: list[tuple[str, dict]]):
+    """Split operations into cached responses and the indexes that still need fetching."""
+    keys = [make_key(operation, variables) for operation, variables in operations]
+    responses = [cache.get(key) for key in keys]
+    misses = [i for i, response in enumerate(responses) if response is None]
+    return keys, responses, misses
+
+def _store_fused(keys, responses, misses, fused_response):
+    for i, response in zip(misses, split_fused_response(fused_response, len(misses))):
+        responses[i] = _fetched(response)
+        if cache.should_cache(response):
+            cache.set(keys[i], response)
+    return responses
+
+def batch_graphql_request(operations: list[tuple[str, dict]]):
+    """
+    Run several registered operations, fetching every cache miss in one fused GraphQL request.
+
+    Args:
+        operations (list): (operation name, variables) pairs, e.g. ("GetProfessor", {...}).
+
+    Returns:
+        list: One response per operation, shaped like the standalone operation's response.
+    """
+    keys, responses, misses = _fused_misses(operations)
+    if not misses:
+        return responses
+    query, variables = fuse([operations[i] for i in misses])
+    return _store_fused(keys, responses, misses, send_graphql_request(query, variables))
+
+async def abatch_graphql_request(operations: list[tuple[str, dict]]):
+    """
+    Asynchronously run several registered operations in one fused request. See `batch_graphql_request`.
+    """
+    keys, responses, misses = _fused_misses(operations)
+    if not misses:
+        return responses
+    query, variables = fuse([operations[i] for i in misses])
+    return _store_fused(keys, responses, misses, await asend_graphql_request(query, variables))
+
 def format_university_response(response, limit):
     """
     Format the response for universities to a specific schema.
@@ -130,6 +243,17 @@ def format_professor_response(response, limit):
             formatted_data.append(professor_info)
     return formatted_data
 
+def _fetched(response):
+    """Notify `professor_listeners` of the professors in a response fresh from the network, and return it."""
+    professors = format_professor_response(response, None) if professor_listeners else []
+    if professors:
+        for listener in professor_listeners:
+            try:
+                listener(professors)
+            except Exception as e:
+                logger.warning(f"Professor listener failed: {e}")
+    return response
+
 def get_professor(name: str, limit: int = 5):
     """
     Get a professor by their name.
@@ -141,13 +265,13 @@ def get_professor(name: str, limit: int = 5):
     Returns:
         list: A list of formatted professor details or an error message.
     """
-    query = load_query_from_file('search_professor_by_name.graphql')
+    query = QUERIES["GetProfessor"].document
     variables = {
         "query": {"text": name},
         "count": limit
     }
     
-    response = send_graphql_request(query, variables)
+    response = cached_graphql_request("GetProfessor", query, variables)
     return format_professor_response(response, limit)
 
 def get_university(university: str, limit: int = 5):
@@ -161,12 +285,12 @@ def get_university(university: str, limit: int = 5):
     Returns:
         list: A list of formatted university details or an error message.
     """
-    query = load_query_from_file('search_university_by_name.graphql')
+    query = QUERIES["GetUniversity"].document
     variables = {
         "query": {"text": university}
     }
 
-    response = send_graphql_request(query, variables)
+    response = cached_graphql_request("GetUniversity", query, variables)
     return format_university_response(response, limit)
 
 
@@ -182,15 +306,125 @@ def get_professors_by_university_id(school_id: str, professor_name: str, limit:
     Returns:
         list: A list of formatted teacher details or an error message.
     """
-    query = load_query_from_file('search_teachers_by_school_id.graphql')
+    query = QUERIES["GetProfessorsByUniversityID"].document
+    variables = {
+        "query": {"text": professor_name, "schoolID": school_id},
+        "count": limit
+    }
+
+    response = cached_graphql_request("GetProfessorsByUniversityID", query, variables)
+    return format_professor_response(response, limit)
+
+async def aget_professor(name: str, limit: int = 5):
+    """
+    Asynchronously get a professor by their name. See `get_professor`.
+    """
+    query = QUERIES["GetProfessor"].document
+    variables = {
+        "query": {"text": name},
+        "count": limit
+    }
+
+    response = await acached_graphql_request("GetProfessor", query, variables)
+    return format_professor_response(response, limit)
+
+async def aget_university(university: str, limit: int = 5):
+    """
+    Asynchronously get universities by name. See `get_university`.
+    """
+    query = QUERIES["GetUniversity"].document
+    variables = {
+        "query": {"text": university}
+    }
+
+    response = await acached_graphql_request("GetUniversity", query, variables)
+    return format_university_response(response, limit)
+
+async def aget_professors_by_university_id(school_id: str, professor_name: str, limit: int = 5):
+    """
+    Asynchronously get teachers by school ID. See `get_professors_by_university_id`.
+    """
+    query = QUERIES["GetProfessorsByUniversityID"].document
     variables = {
         "query": {"text": professor_name, "schoolID": school_id},
         "count": limit
     }
 
-    response = send_graphql_request(query, variables)
+    response = await acached_graphql_request("GetProfessorsByUniversityID", query, variables)
     return format_professor_response(response, limit)
 
+def _professors_operations(names: list[str], limit: int):
+    return [("GetProfessor", {"query": {"text": name}, "count": limit}) for name in names]
+
+def get_professors(names: list[str], limit: int = 5):
+    """
+    Get several professors by name with a single upstream request.
+
+    Args:
+        names (list): The names of the professors.
+        limit (int): The maximum number of results to return per name.
+
+    Returns:
+        dict: A mapping of each name to its list of formatted professor details.
+    """
+    responses = batch_graphql_request(_professors_operations(names, limit))
+    return {name: format_professor_response(response, limit) for name, response in zip(names, responses)}
+
+async def aget_professors(names: list[str], limit: int = 5):
+    """
+    Asynchronously get several professors by name with a single upstream request. See `get_professors`.
+    """
+    responses = await abatch_graphql_request(_professors_operations(names, limit))
+    return {name: format_professor_response(response, limit) for name, response in zip(names, responses)}
+
+def _university_professors_operations(universities: list[dict], professor_name: str, limit: int):
+    # One teacher search per resolved school: these are independent, so they can share a fused request
+    return [
+        ("GetProfessorsByUniversityID", {"query": {"text": professor_name, "schoolID": university["id"]}, "count": limit})
+        for university in universities
+    ]
+
+def _format_university_professors(universities: list[dict], responses, limit: int):
+    professors = [professor for response in responses for professor in format_professor_response(response, limit)]
+    return {
+        "universities": universities,
+        "professors": professors[:limit],
+    }
+
+def _no_university(university: str):
+    return {"error": f"No university found matching '{university}'."}
+
+def get_university_professors(university: str, professor_name: str, limit: int = 5):
+    """
+    Resolve a university by name and search its professors.
+
+    The school lookup is cached, so this is usually a single upstream
+    request for the teachers of the resolved schools.
+
+    Args:
+        university (str): The name of the university.
+        professor_name (str): The text to search for within the university's teachers.
+        limit (int): The maximum number of results to return.
+
+    Returns:
+        dict: The matching universities and the matching professors teaching there, or an error message.
+    """
+    universities = get_university(university, limit)
+    if not universities:
+        return _no_university(university)
+    responses = batch_graphql_request(_university_professors_operations(universities, professor_name, limit))
+    return _format_university_professors(universities, responses, limit)
+
+async def aget_university_professors(university: str, professor_name: str, limit: int = 5):
+    """
+    Asynchronously resolve a university and search its professors. See `get_university_professors`.
+    """
+    universities = await aget_university(university, limit)
+    if not universities:
+        return _no_university(university)
+    responses = await abatch_graphql_request(_university_professors_operations(universities, professor_name, limit))
+    return _format_university_professors(universities, responses, limit)
+
 # # Example usage:
 # # Example 1: Search for a Professor by Name
 # result_professor = get_professor(name="John", limit=1)
@@ -211,10 +445,8 @@ def get_professors_by_university_id(school_id: str, professor_name: str, limit:
 
 
 from langchain.pydantic_v1 import BaseModel, Field
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.tools import StructuredTool
-from langchain_openai import ChatOpenAI
-from langchain import hub
-from langchain.agents import AgentExecutor, create_tool_calling_agent
 
 # Define Pydantic Models for Arguments
 class GetProfessorArgs(BaseModel):
@@ -225,50 +457,140 @@ class GetUniversityArgs(BaseModel):
     university: str = Field(..., title="The name of the university to be searched.")
     limit: int = Field(5, title="The maximum number of results to return.")
 
+class GetProfessorsArgs(BaseModel):
+    names: list[str] = Field(..., title="The names of the professors to be searched.")
+    limit: int = Field(5, title="The maximum number of results to return per name.")
+
+class GetUniversityProfessorsArgs(BaseModel):
+    university: str = Field(..., title="The name of the university.")
+    professor_name: str = Field(..., title="The search field for the professor's name.")
+    limit: int = Field(5, title="The maximum number of results to return.")
+
 class GetProfessorsByUniversityIDArgs(BaseModel):
     school_id: str = Field(..., title="The ID of the school.")
     professor_name: str = Field(..., title="The search field for the professor's name.")
     limit: int = Field(5, title="The maximum number of results to return.")
 
 
+# The agent sees professor lists as compact tables rather than nested JSON
+tool_compactor = ContextCompactor(max_tokens=TOOL_RESULT_MAX_TOKENS, name="tool result")
+
+def _compacted(func):
+    """Wrap a tool function so that the agent receives its result compacted."""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        return tool_compactor.compact_result(func(*args, **kwargs))
+    return wrapper
+
+def _acompacted(coroutine):
+    """Wrap a tool coroutine so that the agent receives its result compacted."""
+    @wraps(coroutine)
+    async def wrapper(*args, **kwargs):
+        return tool_compactor.compact_result(await coroutine(*args, **kwargs))
+    return wrapper
+
 rate_tools = [
     StructuredTool.from_function(
-        func=get_professor,
+        func=_compacted(get_professor),
+        coroutine=_acompacted(aget_professor),
         name="GetProfessor",
         description="Get a professor by their name.",
         args_schema=GetProfessorArgs,
     ),
     StructuredTool.from_function(
-        func=get_university,
+        func=_compacted(get_university),
+        coroutine=_acompacted(aget_university),
         name="GetUniversity",
         description="Get Universities and Their Departments.",
         args_schema=GetUniversityArgs,
     ),
     StructuredTool.from_function(
-        func=get_professors_by_university_id,
+        func=_compacted(get_professors_by_university_id),
+        coroutine=_acompacted(aget_professors_by_university_id),
         name="GetProfessorsByUniversityID",
         description="Get professors by university ID. You can use the GetUniversity tool to get the university ID.",
         args_schema=GetProfessorsByUniversityIDArgs,
     ),
+    StructuredTool.from_function(
+        func=_compacted(get_professors),
+        coroutine=_acompacted(aget_professors),
+        name="GetProfessors",
+        description="Get several professors by their names at once. Prefer this over repeated GetProfessor calls.",
+        args_schema=GetProfessorsArgs,
+    ),
+    StructuredTool.from_function(
+        func=_compacted(get_university_professors),
+        coroutine=_acompacted(aget_university_professors),
+        name="GetUniversityProfessors",
+        description="Find a university by name and search its professors in one step, without needing the university ID.",
+        args_schema=GetUniversityProfessorsArgs,
+    ),
 ]
 
-# Initialize a ChatOpenAI model
-llm = ChatOpenAI(model="gpt-4o-mini")
+# Based on the "hwchase17/openai-tools-agent" hub prompt, kept locally so startup needs no network
+prompt = ChatPromptTemplate.from_messages(
+    [
+        (
+            "system",
+            "You are a helpful assistant. When a question involves several professors or universities, "
+            "request all the lookups you need at once in a single step instead of one after another.",
+        ),
+        MessagesPlaceholder("chat_history", optional=True),
+        ("human", "{input}"),
+        MessagesPlaceholder("agent_scratchpad"),
+    ]
+)
 
-prompt = hub.pull("hwchase17/openai-tools-agent")
+# Model calls of the tool agent are measured under the "tool_agent" stage
+TOOL_AGENT_CONFIG = {"tags": ["tool_agent"], "callbacks": [llm_metrics]}
 
-agent = create_tool_calling_agent(
-    llm=llm,
-    tools=rate_tools,
-    prompt=prompt,
-)
+# The LLM and the agent executor are built on first use (or by the server's warm-up task)
+_agent_executor = None
+_agent_executor_lock = threading.Lock()
 
-agent_executor = AgentExecutor.from_agent_and_tools(
-    agent=agent,
-    tools=rate_tools,
-    verbose=True,
-    handle_parsing_errors=True,
-)
+
+def get_agent_executor(llm=None, extra_tools=None):
+    """
+    Return the tool-calling agent executor, building it on first use.
+
+    Args:
+        llm (BaseChatModel, optional): Chat model used when the executor is built; defaults to gpt-4o-mini.
+        extra_tools (list, optional): Tools offered next to the RateMyProfessors ones, e.g. RankProfessors.
+
+    Returns:
+        AgentExecutor: The shared executor.
+    """
+    global _agent_executor
+    if _agent_executor is None:
+        with _agent_executor_lock:
+            if _agent_executor is None:
+                from langchain.agents import create_tool_calling_agent
+                from langchain_openai import ChatOpenAI
+
+                from tools.executor import ParallelAgentExecutor
+
+                # Initialize a ChatOpenAI model
+                llm = llm or ChatOpenAI(model="gpt-4o-mini")
+                tools = rate_tools + list(extra_tools or [])
+
+                agent = create_tool_calling_agent(
+                    llm=llm,
+                    tools=tools,
+                    prompt=prompt,
+                )
+
+                # Independent tool calls of a step run concurrently within TOOL_STEP_TIMEOUT
+                _agent_executor = ParallelAgentExecutor.from_agent_and_tools(
+                    agent=agent,
+                    tools=tools,
+                    verbose=TOOL_AGENT_VERBOSE,
+                    handle_parsing_errors=True,
+                    max_iterations=TOOL_AGENT_MAX_ITERATIONS,
+                    max_execution_time=TOOL_AGENT_MAX_EXECUTION_TIME,
+                    early_stopping_method="force",
+                    step_timeout=TOOL_STEP_TIMEOUT,
+                )
+    return _agent_executor
 
 
 def run_tools(input: str, chat_history: list):
@@ -282,7 +604,23 @@ def run_tools(input: str, chat_history: list):
     Returns:
         dict: The output of the tools.
     """
-    return agent_executor.invoke({"input": input, "chat_history": chat_history})["output"]
+    with timed("tool_agent"):
+        return get_agent_executor().invoke({"input": input, "chat_history": chat_history}, config=TOOL_AGENT_CONFIG)["output"]
+
+async def arun_tools(input: str, chat_history: list):
+    """
+    Asynchronously run the tools on the input and chat history.
+
+    Args:
+        input (str): The input text.
+        chat_history (list): The chat history.
+
+    Returns:
+        str: The output of the tools.
+    """
+    with timed("tool_agent"):
+        result = await get_agent_executor().ainvoke({"input": input, "chat_history": chat_history}, config=TOOL_AGENT_CONFIG)
+    return result["output"]
 
 if __name__ == "__main__":
     from langchain_core.messages import HumanMessage, AIMessage
@@ -293,6 +631,6 @@ if __name__ == "__main__":
             break
         print("----------------------")
         chat_history.append(HumanMessage(query))
-        ai_message =agent_executor.invoke({"input": query, "chat_history": chat_history})["output"]
+        ai_message = run_tools(query, chat_history)
         print("AI: ", ai_message)
         chat_history.append(AIMessage(ai_message))
\ No newline at end of file
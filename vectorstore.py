@@ -0,0 +1,301 @@
+import json
+import os
+import uuid
+from logging import getLogger
+from typing import Any, Callable, Iterable, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+logger = getLogger(__name__)
+
+VECTORS_FILE = "vectors.npy"
+DOCSTORE_FILE = "docstore.json"
+
+
+def _matches(metadata: dict, filter: dict) -> bool:
+    """
+    Check a metadata dict against a Pinecone-style filter.
+
+    Supports plain equality and the `$eq`, `$ne`, `$in`, `$nin`, `$gt`,
+    `$gte`, `$lt` and `$lte` operators; all conditions must hold.
+    """
+    for field, condition in filter.items():
+        value = metadata.get(field)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for op, expected in condition.items():
+            if op == "$eq" and value != expected:
+                return False
+            if op == "$ne" and value == expected:
+                return False
+            if op == "$in" and value not in expected:
+                return False
+            if op == "$nin" and value in expected:
+                return False
+            if op in ("$gt", "$gte", "$lt", "$lte"):
+                if value is None:
+                    return False
+                if op == "$gt" and not value > expected:
+                    return False
+                if op == "$gte" and not value >= expected:
+                    return False
+                if op == "$lt" and not value < expected:
+                    return False
+                if op == "$lte" and not value <= expected:
+                    return False
+    return True
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    An in-process vector store backed by a contiguous float32 NumPy matrix.
+
+    Vectors are L2-normalized on insert, so cosine similarity is a single
+    matrix-vector product and the top-k rows are selected with
+    `argpartition`. Snapshots are a directory holding `vectors.npy` and a
+    JSON docstore; they can be loaded memory-mapped, in which case the
+    matrix is only copied into memory on the first write.
+    """
+
+    def __init__(self, embedding: Embeddings, dimension: int | None = None):
+        """
+        Args:
+            embedding (Embeddings): The embeddings model used for texts and queries.
+            dimension (int, optional): Vector size, inferred from the first insert when omitted.
+        """
+        self.embedding = embedding
+        self.dimension = dimension
+        self._vectors = np.zeros((0, dimension or 0), dtype=np.float32)
+        self._size = 0
+        self._ids: list[str] = []
+        self._texts: list[str] = []
+        self._metadatas: list[dict] = []
+        self._rows: dict[str, int] = {}
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        # Cosine similarity in [-1, 1] mapped to a relevance score in [0, 1]
+        return lambda score: (score + 1.0) / 2.0
+
+    # Writes
+
+    def _ensure_capacity(self, extra: int, dimension: int):
+        if self.dimension is None:
+            self.dimension = dimension
+        elif dimension != self.dimension:
+            raise ValueError(f"Expected vectors of dimension {self.dimension}, got {dimension}")
+        needed = self._size + extra
+        if needed > self._vectors.shape[0] or not self._vectors.flags.writeable or self._vectors.shape[1] != dimension:
+            capacity = max(needed, 2 * self._vectors.shape[0], 64)
+            vectors = np.zeros((capacity, dimension), dtype=np.float32)
+            if self._size:
+                vectors[:self._size] = self._vectors[:self._size]
+            self._vectors = vectors
+
+    def add_vectors(self, vectors, texts: list[str], metadatas: list[dict] | None = None, ids: list[str] | None = None) -> list[str]:
+        """
+        Insert or replace precomputed vectors.
+
+        Args:
+            vectors: A (n, dimension) array-like of embeddings.
+            texts (list): The text of each vector.
+            metadatas (list, optional): The metadata of each vector.
+            ids (list, optional): Ids for the vectors; existing ids are replaced.
+
+        Returns:
+            list: The ids of the stored vectors.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(texts):
+            raise ValueError("Expected one vector per text")
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1.0, norms)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+
+        self._ensure_capacity(len(texts), vectors.shape[1])
+        for vector, text, metadata, id_ in zip(vectors, texts, metadatas, ids):
+            row = self._rows.get(id_)
+            if row is None:
+                # The row is complete before it is counted, so readers never see a partial one
+                row = self._size
+                self._vectors[row] = vector
+                self._ids.append(id_)
+                self._texts.append(text)
+                self._metadatas.append(dict(metadata))
+                self._rows[id_] = row
+                self._size += 1
+            else:
+                self._vectors[row] = vector
+                self._texts[row] = text
+                self._metadatas[row] = dict(metadata)
+        return list(ids)
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[list[dict]] = None, ids: Optional[list[str]] = None, **kwargs: Any) -> list[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        return self.add_vectors(self.embedding.embed_documents(texts), texts, metadatas, ids)
+
+    async def aadd_texts(self, texts: Iterable[str], metadatas: Optional[list[dict]] = None, ids: Optional[list[str]] = None, **kwargs: Any) -> list[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        return self.add_vectors(await self.embedding.aembed_documents(texts), texts, metadatas, ids)
+
+    def delete(self, ids: Optional[list[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if ids is None:
+            return False
+        if self.dimension is None or self._size == 0:
+            return True
+        self._ensure_capacity(0, self.dimension)
+        for id_ in ids:
+            row = self._rows.pop(id_, None)
+            if row is None:
+                continue
+            last = self._size - 1
+            if row != last:
+                # Move the last row into the hole to keep the matrix contiguous
+                self._vectors[row] = self._vectors[last]
+                self._ids[row] = self._ids[last]
+                self._texts[row] = self._texts[last]
+                self._metadatas[row] = self._metadatas[last]
+                self._rows[self._ids[row]] = row
+            self._ids.pop()
+            self._texts.pop()
+            self._metadatas.pop()
+            self._size -= 1
+        return True
+
+    def get_by_ids(self, ids: list[str]) -> list[Document]:
+        """Return the stored documents for `ids`, skipping unknown ids."""
+        return [
+            Document(id=id_, page_content=self._texts[row], metadata=dict(self._metadatas[row]))
+            for id_ in ids if (row := self._rows.get(id_)) is not None
+        ]
+
+    # Search
+
+    def similarity_search_by_vector_with_score(self, embedding: list[float], k: int = 4, filter: dict | None = None) -> list[tuple[Document, float]]:
+        """
+        Return the `k` most similar documents to a query vector with their cosine similarity.
+
+        Args:
+            embedding (list): The query vector.
+            k (int): The number of results.
+            filter (dict, optional): A Pinecone-style metadata filter.
+
+        Returns:
+            list: (document, score) pairs, most similar first.
+        """
+        if self._size == 0 or k <= 0:
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        scores = self._vectors[:self._size] @ query
+        if filter:
+            mask = np.fromiter((_matches(metadata, filter) for metadata in self._metadatas), dtype=bool, count=self._size)
+            scores = np.where(mask, scores, -np.inf)
+            k = min(k, int(mask.sum()))
+            if k == 0:
+                return []
+        k = min(k, self._size)
+        top = np.argpartition(-scores, k - 1)[:k] if k < self._size else np.arange(self._size)
+        top = top[np.argsort(-scores[top])]
+        return [
+            (Document(id=self._ids[row], page_content=self._texts[row], metadata=dict(self._metadatas[row])), float(scores[row]))
+            for row in top
+        ]
+
+    def similarity_search_by_vector(self, embedding: list[float], k: int = 4, **kwargs: Any) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, kwargs.get("filter"))]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: dict | None = None, **kwargs: Any) -> list[tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self.embedding.embed_query(query), k, filter)
+
+    async def asimilarity_search_with_score(self, query: str, k: int = 4, filter: dict | None = None, **kwargs: Any) -> list[tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(await self.embedding.aembed_query(query), k, filter)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    async def asimilarity_search(self, query: str, k: int = 4, **kwargs: Any) -> list[Document]:
+        return [doc for doc, _ in await self.asimilarity_search_with_score(query, k, **kwargs)]
+
+    # Snapshots
+
+    def copy(self) -> "NumpyVectorStore":
+        """
+        Return an independent copy of the store.
+
+        Saving the copy from another thread is safe while this store keeps
+        changing, e.g. `await asyncio.to_thread(store.copy().save, path)`.
+        """
+        store = type(self)(self.embedding)
+        store._vectors = np.array(self._vectors[:self._size])
+        store._size = self._size
+        store._ids = list(self._ids)
+        store._texts = list(self._texts)
+        store._metadatas = [dict(metadata) for metadata in self._metadatas]
+        store._rows = dict(self._rows)
+        return store
+
+    def save(self, path: str):
+        """
+        Write a snapshot of the store to the directory `path`.
+
+        Files are written next to their final name and then renamed, so a
+        crash never leaves a half-written snapshot behind.
+        """
+        os.makedirs(path, exist_ok=True)
+        vectors_path = os.path.join(path, VECTORS_FILE)
+        docstore_path = os.path.join(path, DOCSTORE_FILE)
+        with open(vectors_path + ".tmp", "wb") as file:
+            np.save(file, self._vectors[:self._size])
+        with open(docstore_path + ".tmp", "w", encoding="utf-8") as file:
+            json.dump({"ids": self._ids, "texts": self._texts, "metadatas": self._metadatas}, file)
+        os.replace(vectors_path + ".tmp", vectors_path)
+        os.replace(docstore_path + ".tmp", docstore_path)
+        logger.info(f"Saved {self._size} vectors to {path}")
+
+    @classmethod
+    def load(cls, path: str, embedding: Embeddings, mmap: bool = False) -> "NumpyVectorStore":
+        """
+        Load a snapshot written by `save`.
+
+        Args:
+            path (str): The snapshot directory.
+            embedding (Embeddings): The embeddings model used for queries and new texts.
+            mmap (bool): Memory-map the vectors instead of reading them into memory.
+
+        Returns:
+            NumpyVectorStore: The loaded store.
+        """
+        vectors = np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r" if mmap else None)
+        with open(os.path.join(path, DOCSTORE_FILE), "r", encoding="utf-8") as file:
+            docstore = json.load(file)
+        store = cls(embedding, dimension=vectors.shape[1] if len(vectors) else None)
+        store._vectors = vectors
+        store._size = len(vectors)
+        store._ids = docstore["ids"]
+        store._texts = docstore["texts"]
+        store._metadatas = docstore["metadatas"]
+        store._rows = {id_: row for row, id_ in enumerate(store._ids)}
+        return store
+
+    @classmethod
+    def from_texts(cls, texts: list[str], embedding: Embeddings, metadatas: Optional[list[dict]] = None, ids: Optional[list[str]] = None, **kwargs: Any) -> "NumpyVectorStore":
+        store = cls(embedding)
+        store.add_texts(texts, metadatas, ids)
+        return store
@@ -0,0 +1,170 @@
+import asyncio
+from collections import OrderedDict
+from logging import getLogger
+
+from ingest import professor_record, record_id, record_metadata, record_text
+from lexical import LexicalIndex
+
+logger = getLogger(__name__)
+
+class IndexWriteBack:
+    """
+    Background write-back of tool-fetched professors into the retrieval index.
+
+    Professors fetched by the RateMyProfessors tools are normalized,
+    deduplicated by legacyId and queued; a background task embeds and
+    upserts them in batches once the queue has been quiet for `debounce`
+    seconds or holds a full batch. The queue is bounded and `submit` never
+    blocks, so the foreground request never waits on indexing; when the
+    queue is full, new professors are dropped until it drains. Professors of
+    a failed batch are queued again once, then counted as failed. Upserted
+    professors also join the lexical index, so the next question about
+    them takes the name fast path instead of the tool agent. The legacyIds
+    already written are remembered to skip resubmissions, up to
+    `max_written` of the most recent ones.
+    """
+
+    def __init__(
+        self,
+        vector_store,
+        lexical: LexicalIndex | None = None,
+        batch_size: int = 32,
+        debounce: float = 2.0,
+        max_pending: int = 256,
+        max_written: int = 10000,
+        snapshot_path: str | None = None,
+    ):
+        """
+        Args:
+            vector_store (VectorStore): The retrieval index to upsert into.
+            lexical (LexicalIndex, optional): The lexical index to extend with the same records.
+            batch_size (int): Maximum number of professors embedded and upserted at once.
+            debounce (float): Seconds to wait for more professors before writing a partial batch.
+            max_pending (int): Maximum number of queued professors.
+            max_written (int): Maximum number of written legacyIds remembered as duplicates.
+            snapshot_path (str, optional): Save a local NumpyVectorStore here after each batch.
+        """
+        self.vector_store = vector_store
+        self.lexical = lexical
+        self.batch_size = batch_size
+        self.debounce = debounce
+        self.max_pending = max_pending
+        self.max_written = max_written
+        self.snapshot_path = snapshot_path
+
+        self._pending: dict[int, dict] = {}
+        self._written: OrderedDict[int, None] = OrderedDict()
+        self._failed_once: set[int] = set()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+
+        self.counts = {"submitted": 0, "duplicates": 0, "dropped": 0, "upserted": 0, "batches": 0, "errors": 0, "retried": 0, "failed": 0}
+
+    def start(self):
+        """Start the background writer on the running event loop."""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = self._loop.create_task(self._run())
+
+    async def stop(self):
+        """Write what is still queued and stop the background writer."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        while self._pending:
+            await self._flush()
+
+    def submit(self, professors: list[dict]):
+        """
+        Queue professors for write-back. Safe to call from any thread; never blocks.
+
+        Args:
+            professors (list): Professors as formatted by `format_professor_response`.
+        """
+        if self._loop is None or not professors:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._enqueue, list(professors))
+        except RuntimeError:
+            pass  # Loop closed during shutdown
+
+    def _enqueue(self, professors: list[dict]):
+        for professor in professors:
+            record = professor_record(professor)
+            if record is None:
+                continue
+            self.counts["submitted"] += 1
+            legacy_id = record["legacyId"]
+            if legacy_id in self._written or legacy_id in self._pending:
+                self.counts["duplicates"] += 1
+                if legacy_id in self._written:
+                    self._written.move_to_end(legacy_id)
+            elif len(self._pending) >= self.max_pending:
+                self.counts["dropped"] += 1
+            else:
+                self._pending[legacy_id] = record
+        if self._pending:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            # Debounce: let more professors arrive unless a full batch is already waiting
+            if len(self._pending) < self.batch_size:
+                await asyncio.sleep(self.debounce)
+            while self._pending:
+                if not await self._flush():
+                    # Give the index a moment before retrying the requeued professors
+                    await asyncio.sleep(self.debounce)
+                    self._wakeup.set()
+                    break
+
+    async def _flush(self) -> bool:
+        """Write one batch; return whether it succeeded."""
+        legacy_ids = list(self._pending)[:self.batch_size]
+        records = [self._pending.pop(legacy_id) for legacy_id in legacy_ids]
+        try:
+            await self.vector_store.aadd_texts(
+                [record_text(record) for record in records],
+                metadatas=[record_metadata(record) for record in records],
+                ids=[record_id(record) for record in records],
+            )
+        except Exception as e:
+            self.counts["errors"] += 1
+            logger.warning(f"Write-back of {len(records)} professors failed: {e}")
+            for legacy_id, record in zip(legacy_ids, records):
+                if legacy_id in self._failed_once or len(self._pending) >= self.max_pending:
+                    self._failed_once.discard(legacy_id)
+                    self.counts["failed"] += 1
+                elif legacy_id not in self._pending:
+                    self._failed_once.add(legacy_id)
+                    self._pending[legacy_id] = record
+                    self.counts["retried"] += 1
+            return False
+        for legacy_id in legacy_ids:
+            self._failed_once.discard(legacy_id)
+            self._written[legacy_id] = None
+            self._written.move_to_end(legacy_id)
+        while len(self._written) > self.max_written:
+            self._written.popitem(last=False)
+        if self.lexical is not None:
+            for record in records:
+                self.lexical.add(record)
+        self.counts["upserted"] += len(records)
+        self.counts["batches"] += 1
+        logger.info(f"Wrote back {len(records)} professors to the index")
+        if self.snapshot_path and hasattr(self.vector_store, "save"):
+            try:
+                # Copied on the loop: aadd_texts keeps changing the store while the thread writes
+                await asyncio.to_thread(self.vector_store.copy().save, self.snapshot_path)
+            except Exception as e:
+                logger.warning(f"Could not save index snapshot to {self.snapshot_path}: {e}")
+        return True
+
+    def stats(self) -> dict:
+        """Return write-back counters and the current queue size."""
+        return dict(self.counts, pending=len(self._pending))